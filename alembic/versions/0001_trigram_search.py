@@ -0,0 +1,45 @@
+"""pg_trgm GIN indexes for substring search
+
+Revision ID: 0001_trigram_search
+Revises:
+Create Date: 2026-10-16 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001_trigram_search'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Expressions must stay in sync with crud._text_search_clause.
+TRIGRAM_INDEXES = {
+    "ix_employees_first_name_trgm": "lower(first_name)",
+    "ix_employees_last_name_trgm": "lower(last_name)",
+    "ix_employees_email_trgm": "lower(email)",
+    "ix_employees_phone_digits_trgm": r"regexp_replace(phone, '\D', '', 'g')",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CONCURRENTLY keeps the employees table writable while the indexes build.
+    with op.get_context().autocommit_block():
+        for name, expression in TRIGRAM_INDEXES.items():
+            op.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                f"ON employees USING gin (({expression}) gin_trgm_ops)"
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in TRIGRAM_INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
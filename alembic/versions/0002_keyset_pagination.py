@@ -0,0 +1,34 @@
+"""Composite index for keyset pagination
+
+Revision ID: 0002_keyset_pagination
+Revises: 0001_trigram_search
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002_keyset_pagination'
+down_revision: Union[str, None] = '0001_trigram_search'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Matches crud.SORT_KEY so ORDER BY / cursor seeks read the index in order.
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employees_org_sort_key "
+            "ON employees (org_id, coalesce(last_name, ''), id)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_employees_org_sort_key")
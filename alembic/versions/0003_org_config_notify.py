@@ -0,0 +1,60 @@
+"""NOTIFY on org_column_config changes for cache invalidation
+
+Revision ID: 0003_org_config_notify
+Revises: 0002_keyset_pagination
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003_org_config_notify'
+down_revision: Union[str, None] = '0002_keyset_pagination'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Channel name must match app.invalidation.ORG_CONFIG_CHANNEL.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_org_config_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                PERFORM pg_notify('org_config_changed', '*');
+            ELSIF TG_OP = 'DELETE' THEN
+                PERFORM pg_notify('org_config_changed', OLD.org_id::text);
+            ELSE
+                PERFORM pg_notify('org_config_changed', NEW.org_id::text);
+            END IF;
+            IF TG_OP = 'UPDATE' AND NEW.org_id <> OLD.org_id THEN
+                PERFORM pg_notify('org_config_changed', OLD.org_id::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # init.sql installs the same triggers.
+    op.execute("DROP TRIGGER IF EXISTS org_column_config_notify ON org_column_config")
+    op.execute("DROP TRIGGER IF EXISTS org_column_config_notify_truncate ON org_column_config")
+    op.execute("""
+        CREATE TRIGGER org_column_config_notify
+        AFTER INSERT OR UPDATE OR DELETE ON org_column_config
+        FOR EACH ROW EXECUTE FUNCTION notify_org_config_changed()
+    """)
+    op.execute("""
+        CREATE TRIGGER org_column_config_notify_truncate
+        AFTER TRUNCATE ON org_column_config
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_org_config_changed()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS org_column_config_notify_truncate ON org_column_config")
+    op.execute("DROP TRIGGER IF EXISTS org_column_config_notify ON org_column_config")
+    op.execute("DROP FUNCTION IF EXISTS notify_org_config_changed()")
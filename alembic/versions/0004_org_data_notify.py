@@ -0,0 +1,70 @@
+"""NOTIFY on employees changes for per-org cache invalidation
+
+Revision ID: 0004_org_data_notify
+Revises: 0003_org_config_notify
+Create Date: 2026-10-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004_org_data_notify'
+down_revision: Union[str, None] = '0003_org_config_notify'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Statement-level triggers with transition tables notify once per affected
+# org per statement rather than once per row. Postgres only allows transition
+# tables on single-event triggers, hence one trigger per operation.
+TRIGGERS = {
+    "employees_notify_insert": "AFTER INSERT ON employees REFERENCING NEW TABLE AS new_rows",
+    "employees_notify_update": "AFTER UPDATE ON employees REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows",
+    "employees_notify_delete": "AFTER DELETE ON employees REFERENCING OLD TABLE AS old_rows",
+    "employees_notify_truncate": "AFTER TRUNCATE ON employees",
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Channel name must match app.invalidation.ORG_DATA_CHANNEL.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION notify_org_data_changed() RETURNS trigger AS $$
+        DECLARE
+            changed_org integer;
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                PERFORM pg_notify('org_data_changed', '*');
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                FOR changed_org IN SELECT DISTINCT org_id FROM new_rows WHERE org_id IS NOT NULL LOOP
+                    PERFORM pg_notify('org_data_changed', changed_org::text);
+                END LOOP;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                FOR changed_org IN SELECT DISTINCT org_id FROM old_rows WHERE org_id IS NOT NULL LOOP
+                    PERFORM pg_notify('org_data_changed', changed_org::text);
+                END LOOP;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    for name, timing in TRIGGERS.items():
+        # init.sql installs the same triggers.
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON employees")
+        op.execute(
+            f"CREATE TRIGGER {name} {timing} "
+            f"FOR EACH STATEMENT EXECUTE FUNCTION notify_org_data_changed()"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON employees")
+    op.execute("DROP FUNCTION IF EXISTS notify_org_data_changed()")
@@ -0,0 +1,60 @@
+"""Composite, partial and covering indexes for the search query shapes
+
+Revision ID: 0005_composite_search_indexes
+Revises: 0004_org_data_notify
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005_composite_search_indexes'
+down_revision: Union[str, None] = '0004_org_data_notify'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every search filters on org_id first and then on IN-lists, so each index
+# leads with org_id. Shared with tests/test_query_plans.py.
+INDEXES = {
+    # Status plus any mix of the other facets.
+    "ix_employees_org_status_facets": 'ON employees (org_id, status, department, "location", "position")',
+    # Single-facet filters without a status.
+    "ix_employees_org_department": "ON employees (org_id, department)",
+    "ix_employees_org_location": 'ON employees (org_id, "location")',
+    "ix_employees_org_position": 'ON employees (org_id, "position")',
+    # Most UI traffic filters on ACTIVE employees only.
+    "ix_employees_active_org_facets": (
+        'ON employees (org_id, department, "location", "position") WHERE status = \'ACTIVE\''
+    ),
+    # Sort-order scan that can answer the common visible_columns sets
+    # (names, email, phone, department, position, location) from the index
+    # alone; supersedes ix_employees_org_sort_key.
+    "ix_employees_org_sort_covering": (
+        "ON employees (org_id, coalesce(last_name, ''), id) "
+        'INCLUDE (first_name, last_name, email, phone, department, "position", "location", status)'
+    ),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES.items():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} {definition}")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_employees_org_sort_key")
+    op.execute("ANALYZE employees")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_employees_org_sort_key "
+            "ON employees (org_id, coalesce(last_name, ''), id)"
+        )
+        for name in INDEXES:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
@@ -0,0 +1,91 @@
+"""Partition employees by org_id
+
+Revision ID: 0006_partition_employees
+Revises: 0005_composite_search_indexes
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006_partition_employees'
+down_revision: Union[str, None] = '0005_composite_search_indexes'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Postgres cannot convert a table in place, so both directions copy every row
+# into a freshly created table under an exclusive lock: schedule downtime.
+# Indexes and triggers are read from the old table and replayed on the new
+# one, so everything from earlier revisions (and init.sql) carries over.
+#
+# The layout is fixed here rather than read from app.partitioning, so the
+# revision produces the same schema whatever code or environment runs it.
+# Every org starts in the hash-partitioned default partition; large tenants
+# are moved out afterwards with `python -m app.partitioning promote <org_id>`.
+HASH_PARTITIONS = 16
+
+PARTITIONS = [
+    "CREATE TABLE employees_shared PARTITION OF employees DEFAULT PARTITION BY HASH (org_id)",
+] + [
+    f"CREATE TABLE employees_shared_p{remainder} PARTITION OF employees_shared "
+    f"FOR VALUES WITH (MODULUS {HASH_PARTITIONS}, REMAINDER {remainder})"
+    for remainder in range(HASH_PARTITIONS)
+]
+
+
+def _indexes(bind, table):
+    return bind.execute(sa.text(
+        "SELECT indexdef FROM pg_indexes i "
+        "WHERE i.tablename = :table AND i.schemaname = current_schema() "
+        "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)"
+    ), {"table": table}).scalars().all()
+
+
+def _triggers(bind, table):
+    return bind.execute(sa.text(
+        "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = CAST(:table AS regclass) AND NOT tgisinternal"
+    ), {"table": table}).scalars().all()
+
+
+def _swap(bind, create_table, create_children=()):
+    """Rebuild employees through `create_table`, keeping data, sequence, indexes and triggers."""
+    op.execute("LOCK TABLE employees IN ACCESS EXCLUSIVE MODE")
+    indexes = _indexes(bind, "employees")
+    triggers = _triggers(bind, "employees")
+    op.execute("ALTER TABLE employees RENAME TO employees_old")
+    op.execute("ALTER INDEX IF EXISTS employees_pkey RENAME TO employees_old_pkey")
+    # Otherwise dropping the old table would drop the id sequence with it.
+    op.execute("ALTER SEQUENCE employees_id_seq OWNED BY NONE")
+    op.execute(create_table)
+    for statement in create_children:
+        op.execute(statement)
+    op.execute("INSERT INTO employees SELECT * FROM employees_old")
+    op.execute("DROP TABLE employees_old")
+    op.execute("ALTER SEQUENCE employees_id_seq OWNED BY employees.id")
+    # Definitions were rendered before the rename, so they name employees.
+    for statement in indexes + triggers:
+        op.execute(statement)
+    op.execute("ANALYZE employees")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    nulls = bind.execute(sa.text("SELECT count(*) FROM employees WHERE org_id IS NULL")).scalar()
+    if nulls:
+        raise RuntimeError(f"{nulls} employees rows have no org_id; assign or delete them before partitioning")
+    _swap(
+        bind,
+        "CREATE TABLE employees (LIKE employees_old INCLUDING DEFAULTS, PRIMARY KEY (id, org_id)) "
+        "PARTITION BY LIST (org_id)",
+        PARTITIONS,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _swap(op.get_bind(), "CREATE TABLE employees (LIKE employees_old INCLUDING DEFAULTS, PRIMARY KEY (id))")
@@ -0,0 +1,49 @@
+"""Maintain employees.updated_at for incremental suggest index refreshes
+
+Revision ID: 0007_employees_updated_at
+Revises: 0006_partition_employees
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007_employees_updated_at'
+down_revision: Union[str, None] = '0006_partition_employees'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # app.suggest pulls rows with updated_at past its watermark, so every
+    # write path has to bump it, not just the ORM.
+    op.execute("""
+        CREATE OR REPLACE FUNCTION employees_touch_updated_at() RETURNS trigger AS $$
+        BEGIN
+            NEW.updated_at := now();
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    # init.sql installs the same trigger.
+    op.execute("DROP TRIGGER IF EXISTS employees_touch_updated_at ON employees")
+    op.execute("""
+        CREATE TRIGGER employees_touch_updated_at
+        BEFORE UPDATE ON employees
+        FOR EACH ROW EXECUTE FUNCTION employees_touch_updated_at()
+    """)
+    # CONCURRENTLY is not supported on partitioned tables; this blocks writes
+    # while the partitions are indexed.
+    op.execute("CREATE INDEX IF NOT EXISTS ix_employees_org_updated_at ON employees (org_id, updated_at)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ix_employees_org_updated_at")
+    op.execute("DROP TRIGGER IF EXISTS employees_touch_updated_at ON employees")
+    op.execute("DROP FUNCTION IF EXISTS employees_touch_updated_at()")
@@ -0,0 +1,85 @@
+"""Per-org data version for HTTP ETags
+
+Revision ID: 0008_org_data_version
+Revises: 0007_employees_updated_at
+Create Date: 2026-10-16 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008_org_data_version'
+down_revision: Union[str, None] = '0007_employees_updated_at'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# The employees statement triggers from 0004 already visit every changed org
+# once per statement; the function now also stamps those orgs with a fresh
+# value from one global sequence, so a version never repeats for an org even
+# if its row is deleted and recreated.
+NOTIFY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION notify_org_data_changed() RETURNS trigger AS $$
+    DECLARE
+        changed_org integer;
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            {truncate}
+            PERFORM pg_notify('org_data_changed', '*');
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            FOR changed_org IN SELECT DISTINCT org_id FROM new_rows WHERE org_id IS NOT NULL LOOP
+                {bump}
+                PERFORM pg_notify('org_data_changed', changed_org::text);
+            END LOOP;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            FOR changed_org IN SELECT DISTINCT org_id FROM old_rows WHERE org_id IS NOT NULL LOOP
+                {bump}
+                PERFORM pg_notify('org_data_changed', changed_org::text);
+            END LOOP;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+"""
+
+BUMP = (
+    "INSERT INTO org_data_version (org_id, version) VALUES (changed_org, nextval('org_data_version_seq')) "
+    "ON CONFLICT (org_id) DO UPDATE SET version = EXCLUDED.version;"
+)
+TRUNCATE = "UPDATE org_data_version SET version = nextval('org_data_version_seq');"
+
+# init.sql creates the sequence, table and bumping function as well, so the
+# API runs before migrations. The table is tagged only when this revision
+# created it, and downgrade leaves init.sql's objects in place.
+CREATED_HERE = "created by 0008_org_data_version"
+
+
+def _comment(bind):
+    return bind.execute(sa.text(
+        "SELECT obj_description(to_regclass('org_data_version'), 'pg_class')"
+    )).scalar()
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    if bind.execute(sa.text("SELECT to_regclass('org_data_version')")).scalar() is None:
+        op.execute("CREATE SEQUENCE IF NOT EXISTS org_data_version_seq")
+        op.execute("CREATE TABLE org_data_version (org_id integer PRIMARY KEY, version bigint NOT NULL)")
+        op.execute(f"COMMENT ON TABLE org_data_version IS '{CREATED_HERE}'")
+    op.execute(NOTIFY_FUNCTION.format(truncate=TRUNCATE, bump=BUMP))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if _comment(op.get_bind()) != CREATED_HERE:
+        return
+    op.execute(NOTIFY_FUNCTION.format(truncate="", bump=""))
+    op.drop_table("org_data_version")
+    op.execute("DROP SEQUENCE IF EXISTS org_data_version_seq")
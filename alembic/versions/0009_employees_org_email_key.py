@@ -0,0 +1,41 @@
+"""Unique (org_id, email) natural key for bulk imports
+
+Revision ID: 0009_employees_org_email_key
+Revises: 0008_org_data_version
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009_employees_org_email_key'
+down_revision: Union[str, None] = '0008_org_data_version'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # app.importer merges with ON CONFLICT (org_id, email). Unique indexes on a
+    # partitioned table must contain the partition key, which this one does.
+    duplicates = op.get_bind().execute(sa.text(
+        "SELECT count(*) FROM (SELECT 1 FROM employees WHERE email IS NOT NULL "
+        "GROUP BY org_id, email HAVING count(*) > 1) d"
+    )).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates} (org_id, email) pairs are used by more than one employee; "
+            "merge or delete the duplicates before upgrading"
+        )
+    # CONCURRENTLY is not supported on partitioned tables; this blocks writes
+    # while the partitions are indexed.
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_employees_org_email ON employees (org_id, email)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP INDEX IF EXISTS ux_employees_org_email")
@@ -0,0 +1,41 @@
+"""Drop init.sql's single-column facet indexes
+
+Revision ID: 0010_drop_facet_indexes
+Revises: 0009_employees_org_email_key
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010_drop_facet_indexes'
+down_revision: Union[str, None] = '0009_employees_org_email_key'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Every query filters on org_id, and 0005 covers each facet with an index
+# leading on org_id. The planner still picks these cheaper-looking indexes,
+# which scan every org in a shared partition, and each one costs a write on
+# every insert and update.
+INDEXES = {
+    "idx_employees_status": "(status)",
+    "idx_employees_department": "(department)",
+    "idx_employees_location": '("location")',
+    "idx_employees_position": '("position")',
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY is not supported on partitioned tables.
+    for name in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name, columns in INDEXES.items():
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON employees {columns}")
@@ -1,43 +1,449 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
-from app.models import Employee, OrgConfig
-from typing import Optional, List
-
-def search_employees(db: Session, org_id: int, q: Optional[str], offset: int, limit: int,
-                     status: Optional[List[str]], locations: Optional[List[str]],
-                     departments: Optional[List[str]], positions: Optional[List[str]]):
-    query = db.query(Employee).filter(Employee.org_id == org_id)
-
-    if status:
-        query = query.filter(Employee.status.in_(status))
-    if locations:
-        query = query.filter(Employee.location.in_(locations))
-    if departments:
-        query = query.filter(Employee.department.in_(departments))
-    if positions:
-        query = query.filter(Employee.position.in_(positions))
+import enum
+import math
+import os
+import re
+import time
+from functools import lru_cache
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import or_, func, any_, bindparam, literal, literal_column, text, tuple_, select, union_all, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from app.models import Employee, OrgConfig, OrgDataVersion
+from app.schemas import EmployeeSearchRequest
+from app.cache import TTLCache
+from app import invalidation
+from app.profiling import EXPLAIN_OPTION
+from app.replicas import replica_router
+from typing import AsyncIterator, Optional, List, Sequence, Tuple, Dict, Iterable
+
+# "trigram" matches the pg_trgm GIN indexes from the 0001 migration and
+# normalizes phone numbers to digits; "like" keeps the original behaviour.
+SEARCH_MODE = os.getenv("SEARCH_MODE", "trigram").lower()
+if SEARCH_MODE not in ("trigram", "like"):
+    raise ValueError(f"Unknown SEARCH_MODE: {SEARCH_MODE}")
+# Exports run as one long query; the per-connection DB_STATEMENT_TIMEOUT_MS is sized for API pages.
+EXPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("EXPORT_STATEMENT_TIMEOUT_MS", "600000"))
+# A `q` only adds the phone-digits clause when it looks like a phone number
+# (digits and separators only) with at least this many digits.
+PHONE_QUERY_MIN_DIGITS = int(os.getenv("PHONE_QUERY_MIN_DIGITS", "3"))
+
+ORG_CONFIG_CACHE_SIZE = int(os.getenv("ORG_CONFIG_CACHE_SIZE", "1024"))
+ORG_CONFIG_CACHE_TTL = float(os.getenv("ORG_CONFIG_CACHE_TTL", "300"))
+
+FILTER_METADATA_CACHE_SIZE = int(os.getenv("FILTER_METADATA_CACHE_SIZE", "1024"))
+FILTER_METADATA_CACHE_TTL = float(os.getenv("FILTER_METADATA_CACHE_TTL", "60"))
+
+ORG_VERSION_CACHE_SIZE = int(os.getenv("ORG_VERSION_CACHE_SIZE", "4096"))
+ORG_VERSION_CACHE_TTL = float(os.getenv("ORG_VERSION_CACHE_TTL", "60"))
+
+org_columns_cache = TTLCache(maxsize=ORG_CONFIG_CACHE_SIZE, ttl=ORG_CONFIG_CACHE_TTL)
+filter_metadata_cache = TTLCache(maxsize=FILTER_METADATA_CACHE_SIZE, ttl=FILTER_METADATA_CACHE_TTL)
+org_version_cache = TTLCache(maxsize=ORG_VERSION_CACHE_SIZE, ttl=ORG_VERSION_CACHE_TTL)
+
+def _invalidator(cache: TTLCache):
+    def invalidate(payload: str) -> None:
+        if payload == invalidation.ALL_ORGS:
+            cache.clear()
+        else:
+            cache.pop(int(payload))
+    return invalidate
+
+invalidate_org_columns = _invalidator(org_columns_cache)
+invalidate_filter_metadata = _invalidator(filter_metadata_cache)
+invalidate_org_version = _invalidator(org_version_cache)
+
+# When each org (or ALL_ORGS) last changed, by NOTIFY arrival. The eviction
+# arrives from the primary, so a replica may still serve the old rows for up
+# to replica_router.max_staleness seconds afterwards.
+org_config_changed_at: Dict[str, float] = {}
+org_data_changed_at: Dict[str, float] = {}
+
+def _change_recorder(changed_at: Dict[str, float]):
+    def record(payload: str) -> None:
+        now = time.monotonic()
+        for key in [key for key, at in changed_at.items() if now - at > replica_router.max_staleness]:
+            del changed_at[key]
+        changed_at[payload] = now
+    return record
+
+def cacheable_read(db: AsyncSession, org_id: int, changed_at: Dict[str, float] = org_data_changed_at) -> bool:
+    """False if `db` is a replica that may not have replayed the org's last change yet.
+    Such reads are still served (with the version read alongside them) but not cached."""
+    if not changed_at or not replica_router.is_replica(db):
+        return True
+    last = max(changed_at.get(str(org_id), -math.inf), changed_at.get(invalidation.ALL_ORGS, -math.inf))
+    return time.monotonic() - last > replica_router.max_staleness
+
+invalidation.subscribe(invalidation.ORG_CONFIG_CHANNEL, invalidate_org_columns)
+invalidation.subscribe(invalidation.ORG_DATA_CHANNEL, invalidate_filter_metadata)
+invalidation.subscribe(invalidation.ORG_DATA_CHANNEL, invalidate_org_version)
+invalidation.subscribe(invalidation.ORG_CONFIG_CHANNEL, _change_recorder(org_config_changed_at))
+invalidation.subscribe(invalidation.ORG_DATA_CHANNEL, _change_recorder(org_data_changed_at))
+
+_LIKE_ESCAPE = re.compile(r"([\\%_])")
+_NON_DIGITS = re.compile(r"\D")
+_PHONE_QUERY = re.compile(r"[\d\s()+.\-]+")
+
+# Literal arguments (not bind parameters) so the expression matches the
+# ix_employees_phone_digits_trgm index under server-side prepared statements.
+_PHONE_DIGITS = func.regexp_replace(
+    Employee.phone, literal_column(r"'\D'"), literal_column("''"), literal_column("'g'")
+)
+
+# Stable ORDER BY shared by offset and cursor pagination; served by the
+# ix_employees_org_sort_key index from the 0002 migration.
+SORT_KEY = func.coalesce(Employee.last_name, literal_column("''"))
+
+def _like_pattern(value: str) -> str:
+    escaped = _LIKE_ESCAPE.sub(r"\\\1", value)
+    return f"%{escaped}%"
+
+def normalize_phone(value: Optional[str]) -> str:
+    return _NON_DIGITS.sub("", value or "")
+
+def phone_query_digits(q: Optional[str]) -> str:
+    """Digits of `q` when it reads as a phone number, else "" ("Room 4" must not match every phone with a 4)."""
+    if not q or not _PHONE_QUERY.fullmatch(q.strip()):
+        return ""
+    digits = normalize_phone(q)
+    return digits if len(digits) >= PHONE_QUERY_MIN_DIGITS else ""
+
+def _text_match(pattern, phone_pattern=None):
+    """`q` match against the LIKE `pattern` (and `phone_pattern` of its digits), given as values or bind parameters."""
+    if SEARCH_MODE != "trigram":
+        return or_(
+            func.lower(Employee.first_name).like(pattern, escape="\\"),
+            func.lower(Employee.last_name).like(pattern, escape="\\"),
+            func.lower(Employee.email).like(pattern, escape="\\"),
+            func.lower(Employee.phone).like(pattern, escape="\\")
+        )
+
+    # Each expression matches an index in alembic/versions/0001_trigram_search.py,
+    # so the planner can BitmapOr the GIN scans instead of scanning the org.
+    clauses = [
+        func.lower(Employee.first_name).like(pattern, escape="\\"),
+        func.lower(Employee.last_name).like(pattern, escape="\\"),
+        func.lower(Employee.email).like(pattern, escape="\\"),
+    ]
+    if phone_pattern is not None:
+        clauses.append(_PHONE_DIGITS.like(phone_pattern))
+    return or_(*clauses)
+
+def _text_search_clause(q: str):
+    params = _search_params(q, None, None, None, None)
+    return _text_match(params["pattern"], params.get("phone_pattern"))
+
+# Columns an org's visible_columns may project; anything else is ignored by
+# the query and serialized as null.
+PROJECTABLE_COLUMNS = {column.key: getattr(Employee, column.key) for column in Employee.__table__.columns}
+
+def _projection(columns: List[str]):
+    selected = [PROJECTABLE_COLUMNS[c] for c in dict.fromkeys(columns) if c in PROJECTABLE_COLUMNS and c != "id"]
+    # Pagination key rides along so cursor mode can encode the last row.
+    return [*selected, Employee.id, SORT_KEY.label("sort_key")]
+
+# List filters are bound as one array each (`column = ANY($n)`) rather than an
+# IN list, so the SQL text, and with it SQLAlchemy's compiled cache entry and
+# the server-side prepared statement, does not depend on how many values are sent.
+LIST_FILTERS = (
+    ("status", Employee.status), ("locations", Employee.location),
+    ("departments", Employee.department), ("positions", Employee.position),
+)
+BIND_TYPES = {
+    "org_id": Integer(), "pattern": String(), "phone_pattern": String(),
+    "status": ARRAY(String()), "locations": ARRAY(String()),
+    "departments": ARRAY(String()), "positions": ARRAY(String()),
+}
+
+def _search_params(q: Optional[str], status: Optional[List[str]], locations: Optional[List[str]],
+                   departments: Optional[List[str]], positions: Optional[List[str]]) -> Dict[str, object]:
+    """Bind values for the filters that are set. Which keys are present decides the statement shape."""
+    params = {}
+    for (name, _), values in zip(LIST_FILTERS, (status, locations, departments, positions)):
+        if values:
+            params[name] = [_facet_value(value) for value in values]
+    if q:
+        params["pattern"] = _like_pattern(q.lower())
+        digits = phone_query_digits(q) if SEARCH_MODE == "trigram" else ""
+        if digits:
+            params["phone_pattern"] = _like_pattern(digits)
+    return params
+
+def _where(names, bind) -> list:
+    """WHERE clauses for the filters in `names`; `bind(name)` supplies each bind parameter."""
+    clauses = [Employee.org_id == bind("org_id")]
+    for name, column in LIST_FILTERS:
+        if name in names:
+            clauses.append(column == any_(bind(name)))
+    if "pattern" in names:
+        clauses.append(_text_match(bind("pattern"), bind("phone_pattern") if "phone_pattern" in names else None))
+    return clauses
+
+def _named_bind(name: str):
+    return bindparam(name, type_=BIND_TYPES[name])
+
+def _filter(query, org_id: int, q: Optional[str], status: Optional[List[str]], locations: Optional[List[str]],
+            departments: Optional[List[str]], positions: Optional[List[str]]):
+    """Apply the search filters with their values inlined as anonymous binds (safe inside UNION ALL branches)."""
+    params = _search_params(q, status, locations, departments, positions)
+    params["org_id"] = org_id
+    return query.where(*_where(params, lambda name: literal(params[name], BIND_TYPES[name])))
+
+@lru_cache(maxsize=1024)
+def _search_statement(columns: Tuple[str, ...], filters: Tuple[str, ...], keyset: bool, with_total: bool):
+    """The search page statement for one shape, built once with named bind parameters.
+
+    Shapes vary only by visible columns, which filters are set, pagination
+    mode and with_total, so there are few of them and each is reused.
+    """
+    projection = _projection(list(columns))
+    if with_total:
+        projection.append(func.count().over().label("total_count"))
+    query = select(*projection).where(*_where(filters, _named_bind)).order_by(SORT_KEY, Employee.id)
+    if keyset:
+        # Keyset pagination: seek past the last row of the previous page.
+        after = tuple_(bindparam("after_key", type_=String()), bindparam("after_id", type_=Integer()))
+        query = query.where(tuple_(SORT_KEY, Employee.id) > after)
+    else:
+        query = query.offset(bindparam("offset", type_=Integer()))
+    return query.limit(bindparam("limit", type_=Integer())).execution_options(**{EXPLAIN_OPTION: True})
+
+async def search_employees(db: AsyncSession, org_id: int, q: Optional[str], offset: int, limit: int,
+                           status: Optional[List[str]], locations: Optional[List[str]],
+                           departments: Optional[List[str]], positions: Optional[List[str]],
+                           after: Optional[Tuple[str, int]] = None, columns: Optional[List[str]] = None,
+                           with_total: bool = False):
+    """Return plain rows holding only `columns` plus `id` and `sort_key`.
+
+    With `with_total`, every row also carries `total_count`, the number of
+    matches before OFFSET/LIMIT, computed by a window function in the same query.
+    """
+    params = _search_params(q, status, locations, departments, positions)
+    query = _search_statement(tuple(columns or ()), tuple(params), after is not None, with_total)
+    params["org_id"] = org_id
+    params["limit"] = limit
+    if after is not None:
+        params["after_key"], params["after_id"] = after
+    else:
+        params["offset"] = offset
+    result = await db.execute(query, params)
+    return result.all()
+
+@lru_cache(maxsize=256)
+def _export_statement(columns: Tuple[str, ...], filters: Tuple[str, ...]):
+    """Every matching row in search order, with the same named binds as _search_statement."""
+    return select(*_projection(list(columns))).where(*_where(filters, _named_bind)).order_by(SORT_KEY, Employee.id)
+
+async def stream_employees(db: AsyncSession, org_id: int, columns: List[str], chunk_rows: int,
+                           q: Optional[str] = None, status: Optional[List[str]] = None,
+                           locations: Optional[List[str]] = None, departments: Optional[List[str]] = None,
+                           positions: Optional[List[str]] = None) -> AsyncIterator[Sequence]:
+    """Yield all matching rows in lists of up to `chunk_rows`, read through a server-side cursor.
+
+    Only one chunk is held in memory at a time. The cursor lives in the
+    session's transaction, which stays open until the last chunk is consumed.
+    """
+    params = _search_params(q, status, locations, departments, positions)
+    query = _export_statement(tuple(columns), tuple(params)).execution_options(yield_per=chunk_rows)
+    params["org_id"] = org_id
+    await db.execute(text(f"SET LOCAL statement_timeout = {EXPORT_STATEMENT_TIMEOUT_MS}"))
+    result = await db.stream(query, params)
+    async for rows in result.partitions():
+        yield rows
+
+async def search_employees_batch(db: AsyncSession, searches: List[EmployeeSearchRequest],
+                                 columns: List[str]) -> List[list]:
+    """Run offset searches as one UNION ALL statement; returns one row list per search, in order.
+
+    Every branch projects the same `columns` (the union of the orgs' visible
+    columns) so the branches line up; rows carry `batch_index`.
+    """
+    projection = _projection(columns)
+    branches = [
+        _filter(select(*projection, literal(index, Integer).label("batch_index")), search.org_id,
+                search.search_query, search.status, search.locations, search.departments, search.positions)
+        .order_by(SORT_KEY, Employee.id).offset(search.offset).limit(search.limit)
+        for index, search in enumerate(searches)
+    ]
+    # A one-branch union would put a second ORDER BY on the branch's own.
+    query = branches[0] if len(branches) == 1 else union_all(*branches).order_by(
+        literal_column("batch_index"), literal_column("sort_key"), literal_column("id")
+    )
+    query = query.execution_options(**{EXPLAIN_OPTION: True})
+    pages = [[] for _ in searches]
+    for row in (await db.execute(query)).all():
+        pages[row.batch_index].append(row)
+    return pages
+
+async def count_employees(db: AsyncSession, org_id: int, q: Optional[str], status: Optional[List[str]],
+                          locations: Optional[List[str]], departments: Optional[List[str]],
+                          positions: Optional[List[str]]) -> int:
+    query = _filter(select(func.count()).select_from(Employee), org_id, q, status, locations, departments, positions)
+    return (await db.execute(query.execution_options(**{EXPLAIN_OPTION: True}))).scalar_one()
+
+# Fields type-ahead matches on; only the ones in an org's visible_columns are
+# matched or returned.
+SUGGEST_FIELDS = ("first_name", "last_name", "email")
+
+async def load_suggest_rows(db: AsyncSession, org_id: int, fields: List[str], since=None):
+    """Rows for app.suggest: `id`, `updated_at` and `fields`, optionally only those updated since `since`."""
+    query = select(Employee.id, Employee.updated_at, *(PROJECTABLE_COLUMNS[f] for f in fields))
+    query = query.where(Employee.org_id == org_id)
+    if since is not None:
+        query = query.where(Employee.updated_at >= since)
+    return (await db.execute(query.execution_options(**{EXPLAIN_OPTION: True}))).all()
+
+async def suggest_employees(db: AsyncSession, org_id: int, prefix: str, fields: List[str], limit: int):
+    """Prefix matches on `fields` straight from Postgres, for orgs too large for the in-memory index."""
+    pattern = _LIKE_ESCAPE.sub(r"\\\1", prefix.lower()) + "%"
+    expressions = [func.lower(PROJECTABLE_COLUMNS[f]) for f in fields]
+    if "first_name" in fields and "last_name" in fields:
+        expressions.append(func.lower(func.concat_ws(" ", Employee.first_name, Employee.last_name)))
+    query = (
+        select(*(PROJECTABLE_COLUMNS[f] for f in fields))
+        .where(Employee.org_id == org_id, or_(*(e.like(pattern, escape="\\") for e in expressions)))
+        .order_by(SORT_KEY, Employee.id)
+        .limit(limit)
+        .execution_options(**{EXPLAIN_OPTION: True})
+    )
+    return (await db.execute(query)).all()
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN (FORMAT JSON) wrapper so a statement keeps its bind parameters."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+@compiles(Explain, "postgresql")
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+async def estimate_employees(db: AsyncSession, org_id: int, q: Optional[str], status: Optional[List[str]],
+                             locations: Optional[List[str]], departments: Optional[List[str]],
+                             positions: Optional[List[str]]) -> int:
+    """Planner row estimate for the search filters; no rows are scanned."""
+    query = _filter(select(Employee.id), org_id, q, status, locations, departments, positions)
+    plan = (await db.execute(Explain(query))).scalar_one()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+async def get_org_columns(db: AsyncSession, org_id: int) -> List[str]:
+    # Missing orgs are cached as [] too, so unknown org_ids do not hit the DB
+    # on every request; the org_column_config trigger invalidates both cases.
+    columns = org_columns_cache.get(org_id)
+    if columns is not None:
+        return columns
+
+    result = await db.execute(select(OrgConfig.visible_columns).where(OrgConfig.org_id == org_id))
+    columns = result.scalar_one_or_none() or []
+    if cacheable_read(db, org_id, org_config_changed_at):
+        org_columns_cache.set(org_id, columns)
+    return columns
+
+def is_known_org(org_id: int) -> bool:
+    """Whether the org has a cached, non-empty column config; no database round trip."""
+    return bool(org_columns_cache.peek(org_id))
+
+async def get_org_columns_many(db: AsyncSession, org_ids: Iterable[int]) -> Dict[int, List[str]]:
+    """get_org_columns for several orgs, loading every cache miss in one query."""
+    found = {}
+    missing = []
+    for org_id in dict.fromkeys(org_ids):
+        columns = org_columns_cache.get(org_id)
+        if columns is None:
+            missing.append(org_id)
+        else:
+            found[org_id] = columns
+    if missing:
+        result = await db.execute(
+            select(OrgConfig.org_id, OrgConfig.visible_columns).where(OrgConfig.org_id.in_(missing))
+        )
+        loaded = dict(result.all())
+        for org_id in missing:
+            found[org_id] = loaded.get(org_id) or []
+            if cacheable_read(db, org_id, org_config_changed_at):
+                org_columns_cache.set(org_id, found[org_id])
+    return found
+
+async def get_org_version(db: AsyncSession, org_id: int) -> int:
+    """Version of the org's employee rows from org_data_version; 0 if it never changed since the 0008 migration."""
+    version = org_version_cache.get(org_id)
+    if version is not None:
+        return version
+
+    # Read from the same session as the rows it validates, so a lagging
+    # replica yields its own (older) version rather than a newer ETag on old rows.
+    result = await db.execute(select(OrgDataVersion.version).where(OrgDataVersion.org_id == org_id))
+    version = result.scalar_one_or_none() or 0
+    if cacheable_read(db, org_id):
+        org_version_cache.set(org_id, version)
+    return version
+
+# Facet columns in GROUPING() argument order; FACET_SETS maps the grouping()
+# bitmask of each grouping set back to its response key (a set bit means the
+# column is aggregated away in that row).
+FACETS = (("statuses", Employee.status), ("locations", Employee.location),
+          ("departments", Employee.department), ("positions", Employee.position))
+FACET_SETS = {
+    ((1 << len(FACETS)) - 1) ^ (1 << (len(FACETS) - 1 - i)): (i, key)
+    for i, (key, _) in enumerate(FACETS)
+}
+
+def _facet_value(value):
+    return value.value if isinstance(value, enum.Enum) else value
+
+def cached_filter_metadata(org_id: int) -> Optional[Dict]:
+    """get_filter_metadata's result if it is cached; never queries."""
+    return filter_metadata_cache.get(org_id)
+
+async def get_filter_metadata(db: AsyncSession, org_id: int) -> Dict:
+    metadata = filter_metadata_cache.get(org_id)
+    if metadata is not None:
+        return metadata
+
+    columns = [column for _, column in FACETS]
+    # One pass over the org's rows instead of a SELECT DISTINCT per facet;
+    # the empty grouping set () yields the org's total row count.
+    query = (
+        select(*columns, func.grouping(*columns).label("grouping"), func.count().label("count"))
+        .where(Employee.org_id == org_id)
+        .group_by(func.grouping_sets(*[tuple_(column) for column in columns], tuple_()))
+        .execution_options(**{EXPLAIN_OPTION: True})
+    )
+    result = await db.execute(query)
+
+    counts = {key: {} for key, _ in FACETS}
+    total = 0
+    for row in result:
+        facet = FACET_SETS.get(row.grouping)
+        if facet is None:
+            total = row.count
+            continue
+        index, key = facet
+        value = _facet_value(row[index])
+        if value is not None:
+            counts[key][value] = row.count
+
+    metadata = {key: sorted(values) for key, values in counts.items()}
+    metadata["counts"] = counts
+    metadata["total"] = total
+    if cacheable_read(db, org_id):
+        filter_metadata_cache.set(org_id, metadata)
+    return metadata
+
+def count_from_facets(metadata: Dict, q: Optional[str], status: Optional[List[str]], locations: Optional[List[str]],
+                      departments: Optional[List[str]], positions: Optional[List[str]]) -> Optional[int]:
+    """Exact total from cached facet counts when at most one facet is filtered and there is no q; else None."""
     if q:
-        pattern = f"%{q.lower()}%"
-        query = query.filter(or_(
-            func.lower(Employee.first_name).like(pattern),
-            func.lower(Employee.last_name).like(pattern),
-            func.lower(Employee.email).like(pattern),
-            func.lower(Employee.phone).like(pattern)
-        ))
-
-    return query.offset(offset).limit(limit).all()
-
-def get_org_columns(db: Session, org_id: int) -> List[str]:
-    config = db.query(OrgConfig).filter_by(org_id=org_id).first()
-    if config and config.visible_columns:
-        return config.visible_columns
-    return []
-
-def get_filter_metadata(db: Session, org_id: int):
-    query = db.query(Employee).filter(Employee.org_id == org_id)
-    return {
-        "statuses": [r[0] for r in query.with_entities(Employee.status).distinct().all()],
-        "locations": [r[0] for r in query.with_entities(Employee.location).distinct().all()],
-        "departments": [r[0] for r in query.with_entities(Employee.department).distinct().all()],
-        "positions": [r[0] for r in query.with_entities(Employee.position).distinct().all()],
-    }
\ No newline at end of file
+        return None
+    filters = [(key, values) for key, values in (("statuses", status), ("locations", locations),
+                                                 ("departments", departments), ("positions", positions)) if values]
+    if not filters:
+        return metadata["total"]
+    if len(filters) > 1:
+        return None
+    key, values = filters[0]
+    counts = metadata["counts"][key]
+    return sum(counts.get(_facet_value(value), 0) for value in set(values))
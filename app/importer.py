@@ -0,0 +1,291 @@
+"""Bulk employee import: stream CSV or NDJSON through COPY into a staging table,
+then merge into employees on the (org_id, email) natural key.
+
+    python -m app.importer employees.csv
+    python -m app.importer --org-id 7 --format ndjson - < employees.ndjson
+"""
+
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import sys
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import asyncpg
+import orjson
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import invalidation
+from app.models import EmployeeStatus
+
+logger = logging.getLogger(__name__)
+
+# The merge scans the whole staging table, so large files need more than DB_STATEMENT_TIMEOUT_MS.
+IMPORT_STATEMENT_TIMEOUT_MS = int(os.getenv("IMPORT_STATEMENT_TIMEOUT_MS", "600000"))
+IMPORT_READ_CHUNK_BYTES = int(os.getenv("IMPORT_READ_CHUNK_BYTES", "1048576"))
+FORMATS = ("csv", "ndjson")
+
+KEY_COLUMNS = ("org_id", "email")
+DATA_COLUMNS = ("first_name", "last_name", "phone", "department", "position", "location", "status", "avatar_url")
+IMPORT_COLUMNS = KEY_COLUMNS + DATA_COLUMNS
+STATUSES = [status.value for status in EmployeeStatus]
+
+STAGING = "employee_import"
+# Every column is text so that bad values surface as validation errors with a
+# line number instead of COPY failures; `line` keeps file order for dedupe.
+CREATE_STAGING = (
+    f"CREATE TEMP TABLE {STAGING} (line bigint GENERATED ALWAYS AS IDENTITY, "
+    + ", ".join(f'"{column}" text' for column in IMPORT_COLUMNS)
+    + ") ON COMMIT DROP"
+)
+# Normalized view of the staging rows; org_id falls back to the org_id the import was started with.
+STAGED = f"""
+    SELECT line,
+           coalesce(nullif(trim(org_id), ''), CAST(:org_id AS text)) AS org_id,
+           nullif(trim(email), '') AS email,
+           first_name, last_name, phone, department, "position", "location", avatar_url,
+           nullif(upper(trim(status)), '') AS status
+    FROM {STAGING}
+"""
+VALIDATE = f"""
+    SELECT count(*) AS received,
+           count(*) FILTER (WHERE email IS NULL) AS missing_email,
+           count(DISTINCT (org_id, email)) FILTER (WHERE email IS NOT NULL) AS distinct_rows,
+           min(line) FILTER (WHERE org_id IS NULL OR org_id !~ '^[1-9][0-9]{{0,8}}$') AS bad_org_id,
+           min(line) FILTER (WHERE org_id <> CAST(:org_id AS text)) AS other_org,
+           min(line) FILTER (WHERE status <> ALL(CAST(:statuses AS text[]))) AS bad_status
+    FROM ({STAGED}) s
+"""
+STATUS_TYPE = """
+    SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+    WHERE attrelid = 'employees'::regclass AND attname = 'status'
+"""
+# With the employees triggers (init.sql, migrations 0004/0008) enabled, the merge
+# itself bumps org_data_version and sends the NOTIFY; without them the import does both.
+VERSION_TRIGGERS = """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgrelid = 'employees'::regclass AND tgname = 'employees_notify_insert' AND tgenabled <> 'D'
+    ) AND to_regclass('org_data_version_seq') IS NOT NULL
+"""
+BUMP_VERSION = """
+    INSERT INTO org_data_version (org_id, version) VALUES (:org_id, 1)
+    ON CONFLICT (org_id) DO UPDATE SET version = org_data_version.version + 1
+"""
+
+def parse_header(line: bytes, org_id: Optional[int]) -> List[str]:
+    """Column names from a CSV header line, validated against IMPORT_COLUMNS."""
+    try:
+        columns = [name.strip().lower() for name in next(csv.reader([line.decode("utf-8-sig")]))]
+    except (StopIteration, UnicodeDecodeError, csv.Error) as e:
+        raise ValueError(f"Invalid CSV header: {e}") from e
+    unknown = [name for name in columns if name not in IMPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}; expected any of {', '.join(IMPORT_COLUMNS)}")
+    if len(set(columns)) != len(columns):
+        raise ValueError("Duplicate columns in CSV header")
+    check_key_columns(columns, org_id)
+    return columns
+
+def check_key_columns(columns, org_id: Optional[int]) -> None:
+    if "email" not in columns:
+        raise ValueError("An email column is required; it identifies employees within an org")
+    if "org_id" not in columns and org_id is None:
+        raise ValueError("An org_id column is required unless the org_id parameter is given")
+
+def parse_ndjson_line(line: bytes, number: int) -> Dict[str, Optional[str]]:
+    try:
+        record = orjson.loads(line)
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"Line {number}: invalid JSON: {e}") from e
+    if not isinstance(record, dict):
+        raise ValueError(f"Line {number}: expected a JSON object")
+    values = {}
+    for key, value in record.items():
+        if key not in IMPORT_COLUMNS:
+            raise ValueError(f"Line {number}: unknown field {key!r}")
+        if isinstance(value, bool) or value is not None and not isinstance(value, (str, int)):
+            raise ValueError(f"Line {number}: {key} must be a string or number")
+        values[key] = None if value is None else str(value)
+    return values
+
+async def _split_first_line(chunks: AsyncIterator[bytes]) -> Tuple[bytes, bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        if b"\n" in buffer:
+            break
+    header, _, rest = buffer.partition(b"\n")
+    return header.rstrip(b"\r"), rest
+
+async def _csv_body(rest: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    if rest:
+        yield rest
+    async for chunk in chunks:
+        yield chunk
+
+async def _copy_csv(connection, chunks: AsyncIterator[bytes], org_id: Optional[int]) -> List[str]:
+    header, rest = await _split_first_line(chunks)
+    if not header.strip():
+        raise ValueError("Empty CSV: expected a header line")
+    columns = parse_header(header, org_id)
+    await connection.copy_to_table(STAGING, source=_csv_body(rest, chunks), columns=columns, format="csv")
+    return columns
+
+async def _copy_ndjson(connection, chunks: AsyncIterator[bytes], org_id: Optional[int]) -> List[str]:
+    seen = set()
+
+    async def records():
+        number, buffer = 0, b""
+        async for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                number += 1
+                if line.strip():
+                    values = parse_ndjson_line(line, number)
+                    seen.update(values)
+                    yield tuple(values.get(column) for column in IMPORT_COLUMNS)
+        if buffer.strip():
+            values = parse_ndjson_line(buffer, number + 1)
+            seen.update(values)
+            yield tuple(values.get(column) for column in IMPORT_COLUMNS)
+
+    await connection.copy_records_to_table(STAGING, records=records(), columns=IMPORT_COLUMNS)
+    # Fields absent from every record are left alone on existing employees.
+    columns = [column for column in IMPORT_COLUMNS if column in seen]
+    if columns:
+        check_key_columns(columns, org_id)
+    return columns
+
+def merge_statement(columns: List[str], status_type: str) -> str:
+    """INSERT ... ON CONFLICT (org_id, email) from the staging table; returns per-org inserted/updated counts.
+
+    Only the imported columns are updated, and only when one of them changed,
+    so re-importing the same file rewrites nothing.
+    """
+    updated = [column for column in DATA_COLUMNS if column in columns]
+    inserted = [column for column in DATA_COLUMNS if column in columns and column != "status"]
+    insert_columns = ", ".join(f'"{c}"' for c in KEY_COLUMNS + tuple(inserted))
+    select_columns = ", ".join(f's."{c}"' for c in inserted)
+    if updated:
+        current = ", ".join(f'employees."{c}"' for c in updated)
+        incoming = ", ".join(f'EXCLUDED."{c}"' for c in updated)
+        assignments = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in updated)
+        # A one-column row constructor is just the parenthesized value, so this works for any count.
+        conflict = (f"DO UPDATE SET {assignments}, updated_at = EXCLUDED.updated_at "
+                    f"WHERE ({current}) IS DISTINCT FROM ({incoming})")
+    else:
+        conflict = "DO NOTHING"
+    return f"""
+        WITH merged AS (
+            INSERT INTO employees ({insert_columns}, status, created_at, updated_at)
+            SELECT DISTINCT ON (s.org_id, s.email)
+                   CAST(s.org_id AS integer), s.email{', ' + select_columns if select_columns else ''},
+                   CAST(coalesce(s.status, 'ACTIVE') AS {status_type}), now(), now()
+            FROM ({STAGED}) s
+            WHERE s.email IS NOT NULL
+            -- Within one file the last row for an employee wins.
+            ORDER BY s.org_id, s.email, s.line DESC
+            ON CONFLICT (org_id, email) {conflict}
+            -- xmax cannot be read back from a partitioned table; new rows are the ones created by this transaction.
+            RETURNING org_id, created_at = now() AS inserted
+        )
+        SELECT org_id, count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+        FROM merged GROUP BY org_id ORDER BY org_id
+    """
+
+async def import_employees(db: AsyncSession, chunks: AsyncIterator[bytes], import_format: str = "csv",
+                           org_id: Optional[int] = None) -> Dict:
+    """Stream one CSV or NDJSON file into employees in a single transaction.
+
+    Raises ValueError for malformed input, after rolling back. The orgs that
+    actually changed get a new org_data_version in the same transaction; their
+    caches are invalidated here, and in other workers through NOTIFY.
+    """
+    if import_format not in FORMATS:
+        raise ValueError(f"Unknown import format: {import_format}")
+    params = {"org_id": str(org_id) if org_id is not None else None}
+    try:
+        await db.execute(text(f"SET LOCAL statement_timeout = {IMPORT_STATEMENT_TIMEOUT_MS}"))
+        await db.execute(text(CREATE_STAGING))
+        raw = await (await db.connection()).get_raw_connection()
+        copy = _copy_csv if import_format == "csv" else _copy_ndjson
+        try:
+            columns = await copy(raw.driver_connection, chunks, org_id)
+        except asyncpg.DataError as e:
+            raise ValueError(f"Malformed {import_format.upper()}: {e}") from e
+
+        counts = (await db.execute(text(VALIDATE), {**params, "statuses": STATUSES})).one()
+        if counts.bad_org_id is not None:
+            raise ValueError(f"Row {counts.bad_org_id}: org_id must be a positive integer")
+        if counts.other_org is not None:
+            raise ValueError(f"Row {counts.other_org}: org_id differs from the org_id parameter {org_id}")
+        if counts.bad_status is not None:
+            raise ValueError(f"Row {counts.bad_status}: status must be one of {', '.join(STATUSES)}")
+
+        orgs = {}
+        if counts.distinct_rows:
+            status_type = (await db.execute(text(STATUS_TYPE))).scalar_one()
+            for org, inserted, updated in await db.execute(text(merge_statement(columns, status_type)), params):
+                orgs[org] = {"inserted": inserted, "updated": updated}
+            if orgs and not (await db.execute(text(VERSION_TRIGGERS))).scalar_one():
+                for org in orgs:
+                    await db.execute(text(BUMP_VERSION), {"org_id": org})
+                    await db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                     {"channel": invalidation.ORG_DATA_CHANNEL, "payload": str(org)})
+        await db.commit()
+    except BaseException:
+        await db.rollback()
+        raise
+
+    for org in orgs:
+        invalidation.dispatch(invalidation.ORG_DATA_CHANNEL, str(org))
+    inserted = sum(org["inserted"] for org in orgs.values())
+    updated = sum(org["updated"] for org in orgs.values())
+    summary = {
+        "received": counts.received,
+        "skipped": counts.missing_email,
+        "duplicates": counts.received - counts.missing_email - counts.distinct_rows,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": counts.distinct_rows - inserted - updated,
+        "orgs": {str(org): org_counts for org, org_counts in orgs.items()},
+    }
+    logger.info(f"Imported employees: {summary}")
+    return summary
+
+async def _read_file(f, chunk_bytes: int = IMPORT_READ_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    while chunk := f.read(chunk_bytes):
+        yield chunk
+
+async def _import_file(path: str, import_format: str, org_id: Optional[int]) -> Dict:
+    from app.db import AsyncSessionLocal, async_engine
+
+    try:
+        with (open(path, "rb") if path != "-" else sys.stdin.buffer) as f:
+            async with AsyncSessionLocal() as db:
+                return await import_employees(db, _read_file(f), import_format, org_id)
+    finally:
+        await async_engine.dispose()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import employees from CSV or NDJSON, merging on (org_id, email)")
+    parser.add_argument("path", help="File to import, or - for stdin")
+    parser.add_argument("--format", choices=FORMATS, help="Defaults to ndjson for .ndjson/.jsonl files, else csv")
+    parser.add_argument("--org-id", type=int, help="Org for rows without an org_id; rows for other orgs are rejected")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    import_format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    try:
+        summary = asyncio.run(_import_file(args.path, import_format, args.org_id))
+    except ValueError as e:
+        sys.exit(f"Import failed: {e}")
+    print(orjson.dumps(summary, option=orjson.OPT_INDENT_2).decode())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+import asyncpg
+
+logger = logging.getLogger(__name__)
+
+ORG_CONFIG_CHANNEL = "org_config_changed"
+ORG_DATA_CHANNEL = "org_data_changed"
+# Payload meaning "drop everything", also used after a reconnect because
+# notifications sent while disconnected are lost.
+ALL_ORGS = "*"
+
+CACHE_INVALIDATION_LISTEN = os.getenv("CACHE_INVALIDATION_LISTEN", "true").lower() == "true"
+LISTEN_RETRY_SECONDS = float(os.getenv("CACHE_INVALIDATION_RETRY", "5"))
+
+_handlers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+
+def subscribe(channel: str, handler: Callable[[str], None]) -> None:
+    """Call `handler(payload)` for every NOTIFY on `channel`."""
+    _handlers[channel].append(handler)
+
+def dispatch(channel: str, payload: str) -> None:
+    for handler in _handlers.get(channel, ()):
+        try:
+            handler(payload)
+        except Exception:
+            logger.exception(f"Invalidation handler failed for channel={channel} payload={payload}")
+
+class NotificationListener:
+    """Holds one dedicated asyncpg connection LISTENing on every subscribed channel."""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _on_notification(self, connection, pid, channel, payload):
+        dispatch(channel, payload)
+
+    async def _run(self) -> None:
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                for channel in list(_handlers):
+                    await connection.add_listener(channel, self._on_notification)
+                    dispatch(channel, ALL_ORGS)
+                logger.info(f"Listening for cache invalidations on {sorted(_handlers)}")
+                await closed.wait()
+                logger.warning("Cache invalidation listener connection closed")
+            except asyncio.CancelledError:
+                if connection is not None:
+                    await connection.close()
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation listener unavailable: {e}")
+            await asyncio.sleep(LISTEN_RETRY_SECONDS)
@@ -2,9 +2,16 @@ import logging
 import os
 import json
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from app.routers import search
-from app.rate_limiter import RateLimitMiddleware, limiter
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.engine import make_url
+from app import crud, metrics
+from app.routers import search, admin
+from app.rate_limiter import RateLimitMiddleware, limiter, policies
+from app.db import async_engine, DATABASE_URL
+from app.invalidation import NotificationListener, CACHE_INVALIDATION_LISTEN
+from app.replicas import replica_router
+from app.profiling import QUERY_PROFILING_ENABLED, profiler
+from app.result_cache import search_cache
 
 # Configure logging
 log_level = os.getenv("LOG_LEVEL", "INFO")
@@ -21,15 +28,36 @@ app = FastAPI(
 )
 
 # Add rate limiting middleware
-app.add_middleware(RateLimitMiddleware, rate_limiter=limiter)
+app.add_middleware(RateLimitMiddleware, rate_limiter=limiter, policies=policies)
+if metrics.METRICS_ENABLED:
+    # Added last so it is outermost and also times rate-limited requests.
+    app.add_middleware(metrics.MetricsMiddleware)
+    metrics.install_engine_events()
+    metrics.watch_cache("org_columns", crud.org_columns_cache)
+    metrics.watch_cache("filter_metadata", crud.filter_metadata_cache)
+    metrics.watch_cache("org_version", crud.org_version_cache)
+    metrics.watch_cache("search_results", search_cache.local)
 
 app.include_router(search.router, prefix="/employees", tags=["Search"])
+app.include_router(admin.router, prefix="/admin", tags=["Admin"])
+
+invalidation_listener = NotificationListener(
+    make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+)
 
 @app.get("/openapi.json", include_in_schema=False)
 async def get_openapi_json():
     """Serve the OpenAPI JSON schema"""
     return JSONResponse(content=app.openapi())
 
+@app.get(metrics.METRICS_PATH, include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint"""
+    if not metrics.METRICS_ENABLED:
+        return JSONResponse(status_code=404, content={"detail": "Not Found"})
+    body, content_type = metrics.render_metrics()
+    return Response(body, media_type=content_type)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -39,7 +67,20 @@ async def health_check():
 async def startup_event():
     logger.info("Employee Search API starting up...")
     logger.info(f"Rate limiting: {os.getenv('RATE_LIMIT_REQUESTS', '5')} requests per {os.getenv('RATE_LIMIT_WINDOW', '60')} seconds")
+    for policy in policies:
+        logger.info(f"Rate limit policy {policy.name}: {policy.limiter.limit} tokens on {policy.path}, keyed by {'/'.join(policy.key_by)}")
+    if QUERY_PROFILING_ENABLED:
+        logger.info(f"Query profiling on; EXPLAIN captured for statements over {profiler.slow_ms}ms")
+        profiler.install()
+    if CACHE_INVALIDATION_LISTEN:
+        invalidation_listener.start()
+    if replica_router.replicas:
+        logger.info(f"Routing reads over {len(replica_router.replicas)} replicas ({replica_router.strategy})")
+        replica_router.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Employee Search API shutting down...")
+    await invalidation_listener.stop()
+    await replica_router.stop()
+    await async_engine.dispose()
@@ -0,0 +1,178 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Server-Timing reveals how long the database took; disable if clients are untrusted.
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+METRICS_PATH = "/metrics"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+UNMATCHED_ROUTE = "<unmatched>"
+
+REQUEST_DURATION = Histogram("http_request_duration_seconds", "Request latency by route", ["route", "method"],
+                             buckets=LATENCY_BUCKETS)
+REQUEST_PHASE_DURATION = Histogram("http_request_phase_seconds",
+                                   "Per-request time spent in the database, waiting for a pooled connection, and serializing",
+                                   ["route", "method", "phase"], buckets=LATENCY_BUCKETS)
+REQUESTS = Counter("http_requests", "Responses by route and status", ["route", "method", "status"])
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "Time per SQL statement", buckets=FAST_BUCKETS)
+DB_POOL_CHECKOUT = Histogram("db_pool_checkout_seconds", "Time to get a connection from the pool, including connecting",
+                             buckets=FAST_BUCKETS)
+RATE_LIMIT_DECISIONS = Counter("rate_limit_decisions", "Rate limiter decisions by policy", ["policy", "decision"])
+
+# Bound once at import; the hot paths below never look up labels.
+_db_query_observe = DB_QUERY_DURATION.observe
+_pool_checkout_observe = DB_POOL_CHECKOUT.observe
+
+# Per-request accumulators: [db seconds, db statements, pool wait seconds, serialize seconds].
+DB, DB_STATEMENTS, POOL, SERIALIZE = range(4)
+_timings: ContextVar[Optional[List[float]]] = ContextVar("request_timings", default=None)
+
+def add_time(phase: int, seconds: float) -> None:
+    timings = _timings.get()
+    if timings is not None:
+        timings[phase] += seconds
+
+def observe_pool_checkout(seconds: float) -> None:
+    _pool_checkout_observe(seconds)
+    add_time(POOL, seconds)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    _db_query_observe(elapsed)
+    timings = _timings.get()
+    if timings is not None:
+        timings[DB] += elapsed
+        timings[DB_STATEMENTS] += 1
+
+def _handle_error(exception_context):
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+_ENGINE_EVENTS = (
+    ("before_cursor_execute", _before_cursor_execute),
+    ("after_cursor_execute", _after_cursor_execute),
+    ("handle_error", _handle_error),
+)
+
+def install_engine_events() -> None:
+    """Time every SQL statement; app.main calls this only when METRICS_ENABLED."""
+    for name, listener in _ENGINE_EVENTS:
+        if not event.contains(Engine, name, listener):
+            event.listen(Engine, name, listener)
+
+def uninstall_engine_events() -> None:
+    for name, listener in _ENGINE_EVENTS:
+        if event.contains(Engine, name, listener):
+            event.remove(Engine, name, listener)
+
+def rate_limit_counters(policy: str) -> Tuple[Counter, Counter]:
+    """(allowed, limited) counters for a rate limit policy, bound once per policy."""
+    return RATE_LIMIT_DECISIONS.labels(policy, "allowed"), RATE_LIMIT_DECISIONS.labels(policy, "limited")
+
+class CacheCollector:
+    """Reads the hit/miss counters the TTL caches already keep, at scrape time only."""
+
+    def __init__(self):
+        self.caches: Dict[str, object] = {}
+
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        entries = GaugeMetricFamily("cache_entries", "Entries currently cached", labels=["cache"])
+        for name, cache in self.caches.items():
+            hits.add_metric([name], cache.hits)
+            misses.add_metric([name], cache.misses)
+            entries.add_metric([name], len(cache))
+        yield hits
+        yield misses
+        yield entries
+
+cache_collector = CacheCollector()
+REGISTRY.register(cache_collector)
+
+def watch_cache(name: str, cache) -> None:
+    """Export hit, miss and size figures for a cache with `hits`, `misses` and `__len__`."""
+    cache_collector.caches[name] = cache
+
+class _RouteMetrics:
+    __slots__ = ("duration", "db", "pool", "serialize", "statuses", "route", "method")
+
+    def __init__(self, route: str, method: str):
+        self.route, self.method = route, method
+        self.duration = REQUEST_DURATION.labels(route, method)
+        self.db = REQUEST_PHASE_DURATION.labels(route, method, "db")
+        self.pool = REQUEST_PHASE_DURATION.labels(route, method, "pool")
+        self.serialize = REQUEST_PHASE_DURATION.labels(route, method, "serialize")
+        self.statuses: Dict[int, Counter] = {}
+
+    def count(self, status: int) -> None:
+        counter = self.statuses.get(status)
+        if counter is None:
+            counter = self.statuses[status] = REQUESTS.labels(self.route, self.method, str(status))
+        counter.inc()
+
+def server_timing(timings: List[float], total: float) -> bytes:
+    return (f'db;dur={timings[DB] * 1000:.2f};desc="{int(timings[DB_STATEMENTS])} queries", '
+            f"pool;dur={timings[POOL] * 1000:.2f}, serialize;dur={timings[SERIALIZE] * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}").encode()
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: times each request, feeds the route histograms and adds Server-Timing.
+
+    Label children are created the first time a route/method is seen and reused after that.
+    """
+
+    def __init__(self, app, server_timing_enabled: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing_enabled = server_timing_enabled
+        self._routes: Dict[Tuple[str, str], _RouteMetrics] = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        timings = [0.0, 0.0, 0.0, 0.0]
+        token = _timings.set(timings)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing_enabled:
+                    header = server_timing(timings, time.perf_counter() - started)
+                    message["headers"] = [*message.get("headers", ()), (b"server-timing", header)]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _timings.reset(token)
+            route = scope.get("route")
+            key = (route.path if route is not None else UNMATCHED_ROUTE, scope["method"])
+            metrics = self._routes.get(key)
+            if metrics is None:
+                metrics = self._routes[key] = _RouteMetrics(*key)
+            metrics.duration.observe(time.perf_counter() - started)
+            metrics.db.observe(timings[DB])
+            metrics.pool.observe(timings[POOL])
+            metrics.serialize.observe(timings[SERIALIZE])
+            metrics.count(status)
+
+def render_metrics() -> Tuple[bytes, str]:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
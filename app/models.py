@@ -1,7 +1,8 @@
 import enum
-from sqlalchemy import Column, Integer, String, Text, TIMESTAMP, ForeignKey, func, Enum
+from sqlalchemy import BigInteger, Column, Index, Integer, String, Text, TIMESTAMP, ForeignKey, func, Enum, event, text
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.dialects.postgresql import ARRAY
+from app.partitioning import partition_ddl
 
 class EmployeeStatus(enum.Enum):
     ACTIVE = "ACTIVE"
@@ -12,8 +13,14 @@ Base = declarative_base()
 
 class Employee(Base):
     __tablename__ = "employees"
+    # See app.partitioning; the partition key has to be part of the primary key.
+    __table_args__ = (
+        # Natural key for bulk imports (app.importer); includes the partition key as Postgres requires.
+        Index("ux_employees_org_email", "org_id", "email", unique=True),
+        {"postgresql_partition_by": "LIST (org_id)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     first_name = Column(String(100))
     last_name = Column(String(100))
     email = Column(String(255))
@@ -21,15 +28,25 @@ class Employee(Base):
     department = Column(String(100))
     position = Column(String(100))
     location = Column(String(255))
-    status = Column(Enum(EmployeeStatus), default=EmployeeStatus.ACTIVE)
+    # VARCHAR(20) as created by init.sql; deployed databases have no native employeestatus type.
+    status = Column(Enum(EmployeeStatus, native_enum=False, length=20), default=EmployeeStatus.ACTIVE)
     avatar_url = Column(Text)
     created_at = Column(TIMESTAMP, default=func.now())
-    updated_at = Column(TIMESTAMP, default=func.now())
-    org_id = Column(Integer, index=True)
-
+    updated_at = Column(TIMESTAMP, default=func.now(), onupdate=func.now())
+    org_id = Column(Integer, primary_key=True, index=True)
 
+@event.listens_for(Employee.__table__, "after_create")
+def create_employee_partitions(target, connection, **kw):
+    for statement in partition_ddl():
+        connection.execute(text(statement))
 
 class OrgConfig(Base):
     __tablename__ = "org_column_config"
     org_id = Column(Integer, primary_key=True, index=True)
     visible_columns = Column(ARRAY(Text))
+
+class OrgDataVersion(Base):
+    """Bumped by the employees triggers on every change to an org's rows; feeds HTTP ETags."""
+    __tablename__ = "org_data_version"
+    org_id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False)
@@ -0,0 +1,72 @@
+import argparse
+import logging
+import os
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+# employees is LIST-partitioned on org_id. Large tenants get a dedicated
+# partition each; everyone else lands in the DEFAULT partition, which is
+# itself HASH-partitioned on org_id so the long tail is spread evenly.
+# `WHERE org_id = :org_id` prunes down to exactly one leaf either way.
+EMPLOYEE_HASH_PARTITIONS = int(os.getenv("EMPLOYEE_HASH_PARTITIONS", "16"))
+EMPLOYEE_DEDICATED_ORGS = [
+    int(org_id) for org_id in os.getenv("EMPLOYEE_DEDICATED_ORGS", "").split(",") if org_id.strip()
+]
+
+TABLE = "employees"
+SHARED_PARTITION = f"{TABLE}_shared"
+
+def dedicated_partition(org_id: int) -> str:
+    return f"{TABLE}_org_{int(org_id)}"
+
+def partition_ddl(
+    hash_partitions: int = EMPLOYEE_HASH_PARTITIONS,
+    dedicated_orgs: List[int] = EMPLOYEE_DEDICATED_ORGS,
+) -> List[str]:
+    """Statements creating every partition of an already created partitioned employees table."""
+    statements = [
+        f"CREATE TABLE {dedicated_partition(org_id)} PARTITION OF {TABLE} FOR VALUES IN ({int(org_id)})"
+        for org_id in dedicated_orgs
+    ]
+    statements.append(f"CREATE TABLE {SHARED_PARTITION} PARTITION OF {TABLE} DEFAULT PARTITION BY HASH (org_id)")
+    statements.extend(
+        f"CREATE TABLE {SHARED_PARTITION}_p{remainder} PARTITION OF {SHARED_PARTITION} "
+        f"FOR VALUES WITH (MODULUS {hash_partitions}, REMAINDER {remainder})"
+        for remainder in range(hash_partitions)
+    )
+    return statements
+
+def promote_tenant(connection: Connection, org_id: int) -> None:
+    """Move one org out of the shared partition into its own.
+
+    Runs in the caller's transaction and holds an ACCESS EXCLUSIVE lock on the
+    shared partition while ATTACH validates it, so run it off-peak.
+    """
+    partition = dedicated_partition(org_id)
+    connection.execute(text(f"CREATE TABLE {partition} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    connection.execute(text(f"INSERT INTO {partition} SELECT * FROM {TABLE} WHERE org_id = :org_id"), {"org_id": org_id})
+    connection.execute(text(f"DELETE FROM {TABLE} WHERE org_id = :org_id"), {"org_id": org_id})
+    # ATTACH builds the parent's indexes on the new partition.
+    connection.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {partition} FOR VALUES IN ({int(org_id)})"))
+    connection.execute(text(f"ANALYZE {partition}"))
+    logger.info(f"Moved org_id={org_id} to dedicated partition {partition}")
+
+def main() -> None:
+    from app.db import engine
+
+    parser = argparse.ArgumentParser(description="Manage employees table partitions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    promote = subparsers.add_parser("promote", help="Give a large tenant its own partition")
+    promote.add_argument("org_id", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    with engine.begin() as connection:
+        promote_tenant(connection, args.org_id)
+
+if __name__ == "__main__":
+    main()
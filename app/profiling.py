@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.db import async_engine
+
+logger = logging.getLogger(__name__)
+
+QUERY_PROFILING_ENABLED = os.getenv("QUERY_PROFILING_ENABLED", "false").lower() == "true"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# EXPLAIN ANALYZE runs the query a second time, so each fingerprint is
+# explained at most once per interval, and only one EXPLAIN runs at a time.
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "true").lower() == "true"
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+QUERY_PROFILE_MAX_STATEMENTS = int(os.getenv("QUERY_PROFILE_MAX_STATEMENTS", "500"))
+ORDER_BY = ("total_ms", "mean_ms", "max_ms", "calls", "rows")
+# Execution option marking a statement as safe to run again under EXPLAIN
+# ANALYZE. Only plain reads set it; `SELECT pg_notify(...)` or `nextval(...)`
+# start with SELECT too but would repeat their side effects.
+EXPLAIN_OPTION = "explain_when_slow"
+
+# asyncpg binds look like $3::VARCHAR or $5::TIMESTAMP WITHOUT TIME ZONE.
+_PARAM = re.compile(r"\$\d+(::\w+(\s+(WITH|WITHOUT|TIME|ZONE|PRECISION|VARYING)\b)*(\[\])?)?|%\(\w+\)s|%s|\?")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(\s*,\s*\?)+\s*\)")
+_SPACE = re.compile(r"\s+")
+
+def fingerprint(statement: str) -> str:
+    """Statement text with bind parameters and literals replaced by ?, so
+    `IN ($4, $5)` and `IN ($4)`, or different org ids, share one entry."""
+    normalized = _LITERAL.sub("?", _PARAM.sub("?", statement))
+    normalized = _IN_LIST.sub("(?)", normalized)
+    return _SPACE.sub(" ", normalized).strip()
+
+def _explainable(statement: str, context) -> bool:
+    # Never EXPLAIN ANALYZE anything with side effects: it would run them again.
+    return bool(context is not None and context.execution_options.get(EXPLAIN_OPTION)) \
+        and statement.lstrip()[:6].upper() == "SELECT"
+
+class QueryStats:
+    __slots__ = ("id", "fingerprint", "calls", "total_ms", "max_ms", "rows", "slow_calls", "last_seen",
+                 "slowest_parameters", "plan", "plan_captured_at", "plan_error")
+
+    def __init__(self, fingerprint_id: str, text: str):
+        self.id = fingerprint_id
+        self.fingerprint = text
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.slow_calls = 0
+        self.last_seen = 0.0
+        self.slowest_parameters = None
+        self.plan = None
+        self.plan_captured_at = None
+        self.plan_error = None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id, "fingerprint": self.fingerprint, "calls": self.calls,
+            "total_ms": round(self.total_ms, 3), "mean_ms": round(self.mean_ms, 3),
+            "max_ms": round(self.max_ms, 3), "rows": self.rows, "slow_calls": self.slow_calls,
+            "last_seen": self.last_seen, "slowest_parameters": self.slowest_parameters,
+            "plan": self.plan, "plan_captured_at": self.plan_captured_at, "plan_error": self.plan_error,
+        }
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+class QueryProfiler:
+    """Aggregates every SQL statement by fingerprint and captures EXPLAIN (ANALYZE, BUFFERS)
+    for statements slower than `slow_ms`. Installed on all engines through Engine events."""
+
+    def __init__(self, slow_ms: float = SLOW_QUERY_MS, explain: bool = SLOW_QUERY_EXPLAIN,
+                 explain_interval: float = SLOW_QUERY_EXPLAIN_INTERVAL, max_statements: int = QUERY_PROFILE_MAX_STATEMENTS,
+                 explain_engine=None):
+        self.slow_ms = slow_ms
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.max_statements = max_statements
+        self.explain_engine = explain_engine
+        self.stats: Dict[str, QueryStats] = {}
+        self.installed = False
+        self._lock = Lock()
+        self._explaining: Optional[asyncio.Task] = None
+        self._fingerprints: Dict[str, tuple] = {}
+
+    def install(self) -> None:
+        if not self.installed:
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            event.listen(Engine, "handle_error", self._handle_error)
+            self.installed = True
+
+    def uninstall(self) -> None:
+        if self.installed:
+            event.remove(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(Engine, "after_cursor_execute", self._after_cursor_execute)
+            event.remove(Engine, "handle_error", self._handle_error)
+            self.installed = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats.clear()
+
+    def top(self, limit: int = 20, order_by: str = "total_ms") -> List[Dict[str, Any]]:
+        with self._lock:
+            ranked = sorted(self.stats.values(), key=lambda s: getattr(s, order_by), reverse=True)[:limit]
+            return [s.as_dict() for s in ranked]
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("profile_started", []).append(time.perf_counter())
+
+    def _handle_error(self, exception_context):
+        connection = exception_context.connection
+        started = connection.info.get("profile_started") if connection is not None else None
+        if started:
+            started.pop()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get("profile_started")
+        if not started:
+            # Began before install().
+            return
+        elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+        if statement.startswith("EXPLAIN"):
+            return
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else 0
+        self.record(statement, parameters, elapsed_ms, rows, explainable=_explainable(statement, context))
+
+    def _fingerprint(self, statement: str) -> tuple:
+        # Statements come from a handful of compiled shapes; normalize each text once.
+        cached = self._fingerprints.get(statement)
+        if cached is None:
+            text = fingerprint(statement)
+            cached = (hashlib.blake2b(text.encode(), digest_size=8).hexdigest(), text)
+            if len(self._fingerprints) >= self.max_statements * 4:
+                self._fingerprints.clear()
+            self._fingerprints[statement] = cached
+        return cached
+
+    def record(self, statement: str, parameters, elapsed_ms: float, rows: int, explainable: bool = False) -> None:
+        fingerprint_id, text = self._fingerprint(statement)
+        slow = elapsed_ms >= self.slow_ms
+        with self._lock:
+            stats = self.stats.get(fingerprint_id)
+            if stats is None:
+                if len(self.stats) >= self.max_statements:
+                    # Keep the heavy hitters; drop the cheapest fingerprint.
+                    del self.stats[min(self.stats.values(), key=lambda s: s.total_ms).id]
+                stats = self.stats[fingerprint_id] = QueryStats(fingerprint_id, text)
+            stats.calls += 1
+            stats.total_ms += elapsed_ms
+            stats.rows += rows
+            stats.last_seen = time.time()
+            if elapsed_ms > stats.max_ms:
+                stats.max_ms = elapsed_ms
+                stats.slowest_parameters = repr(parameters)[:500]
+            if not slow:
+                return
+            stats.slow_calls += 1
+            explain = explainable and self._should_explain(stats)
+        logger.warning(f"Slow query {elapsed_ms:.1f}ms rows={rows} id={fingerprint_id}: {text[:200]}")
+        if explain:
+            self._explaining = asyncio.get_running_loop().create_task(self._explain(stats, statement, parameters))
+
+    def _should_explain(self, stats: QueryStats) -> bool:
+        if not self.explain or self.explain_engine is None:
+            return False
+        if self._explaining is not None and not self._explaining.done():
+            return False
+        if stats.plan_captured_at is not None and time.time() - stats.plan_captured_at < self.explain_interval:
+            return False
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Sync engine outside the event loop; nothing to schedule the EXPLAIN on.
+            return False
+        # Claim the slot now so concurrent slow calls do not all schedule one.
+        stats.plan_captured_at = time.time()
+        return True
+
+    async def _explain(self, stats: QueryStats, statement: str, parameters) -> None:
+        try:
+            async with self.explain_engine.connect() as connection:
+                result = await connection.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)
+                plan = "\n".join(row[0] for row in result.fetchall())
+                await connection.rollback()
+            with self._lock:
+                stats.plan, stats.plan_error = plan, None
+                stats.plan_captured_at = time.time()
+            logger.info(f"Captured plan for slow query {stats.id}")
+        except Exception as e:
+            logger.warning(f"EXPLAIN failed for slow query {stats.id}: {e}")
+            with self._lock:
+                stats.plan_error = str(e)[:500]
+
+profiler = QueryProfiler(explain_engine=async_engine)
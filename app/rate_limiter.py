@@ -1,20 +1,49 @@
 import os
+import math
+import hashlib
 import time
 import logging
 from datetime import datetime, timedelta
 from collections import defaultdict
 from threading import Lock
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+from urllib.parse import parse_qs
+import orjson
+from starlette.responses import Response
+from app import crud
+from app.metrics import rate_limit_counters
 
 logger = logging.getLogger(__name__)
 
-class RateLimiter:
-    def __init__(self, limit: int, interval_sec: int):
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    # Seconds until the client's budget is fully replenished.
+    reset_after: float
+    # Seconds until the next request would be allowed; 0 when allowed.
+    retry_after: float
+
+class RateLimitBackend:
+    """Interface the middleware uses; implementations decide where counters live."""
+
+    limit: int
+
+    async def hit(self, key: str, cost: int = 1) -> RateLimitDecision:
+        """Charge `cost` requests against `key`'s budget."""
+        raise NotImplementedError
+
+    async def record_failure(self, key: str) -> None:
+        pass
+
+class RateLimiter(RateLimitBackend):
+    """In-process sliding-window log; each worker enforces its own budget."""
+
+    def __init__(self, limit: int, interval_sec: int, max_keys: int = 100000):
         self.limit = limit
         self.interval = timedelta(seconds=interval_sec)
         self.access_times = defaultdict(list)
+        self.max_keys = max_keys
         self.lock = Lock()
         self.last_cleanup = time.time()
         self.cleanup_interval = 300 
@@ -38,18 +67,31 @@ class RateLimiter:
                 self.last_cleanup = current_time
                 logger.debug(f"Rate limiter cleanup: removed {len(ips_to_remove)} inactive IPs")
 
-    def is_allowed(self, ip: str) -> bool:
+    def check(self, ip: str, cost: int = 1) -> RateLimitDecision:
         self._cleanup_old_entries()
+        cost = min(cost, self.limit)
 
         with self.lock:
             now = datetime.now()
+            if ip not in self.access_times and len(self.access_times) >= self.max_keys:
+                # Full: forget the longest-tracked client rather than grow without bound.
+                del self.access_times[next(iter(self.access_times))]
             access_list = [t for t in self.access_times[ip] if now - t < self.interval]
             self.access_times[ip] = access_list
 
-            if len(access_list) < self.limit:
-                self.access_times[ip].append(now)
-                return True
-            return False
+            allowed = len(access_list) + cost <= self.limit
+            if allowed:
+                access_list.extend([now] * cost)
+            window = self.interval.total_seconds()
+            reset_after = window - (now - access_list[0]).total_seconds() if access_list else 0.0
+            retry_after = 0.0
+            if not allowed:
+                # The next slot frees up when enough of the oldest entries age out.
+                retry_after = window - (now - access_list[len(access_list) + cost - self.limit - 1]).total_seconds()
+            return RateLimitDecision(allowed, self.limit, max(self.limit - len(access_list), 0), reset_after, retry_after)
+
+    def is_allowed(self, ip: str) -> bool:
+        return self.check(ip).allowed
 
     def record_request(self, ip: str, success: bool = True):
         if not success:
@@ -57,50 +99,406 @@ class RateLimiter:
                 now = datetime.now()
                 self.access_times[ip].append(now)
 
+    async def hit(self, key: str, cost: int = 1) -> RateLimitDecision:
+        return self.check(key, cost)
+
+    async def record_failure(self, key: str) -> None:
+        self.record_request(key, success=False)
+
+class GCRARateLimiter(RateLimitBackend):
+    """In-process GCRA: one theoretical arrival time (TAT) float per key.
+
+    Allows `limit` requests in a burst, refilling one every interval/limit
+    seconds. Idle keys are dropped by a timing wheel that only visits the
+    slots whose deadlines have passed, instead of sweeping every key.
+    """
+
+    def __init__(self, limit: int, interval_sec: int, wheel_slots: int = 64, max_keys: int = 100000):
+        self.limit = limit
+        self.interval = float(interval_sec)
+        self.emission = self.interval / limit
+        self.tat: Dict[str, float] = {}
+        self.max_keys = max_keys
+        self.lock = Lock()
+        # A TAT is never more than one interval ahead, so one revolution of
+        # the wheel spans every live deadline.
+        self.tick = self.interval / (wheel_slots - 1)
+        self.wheel: List[Set[str]] = [set() for _ in range(wheel_slots)]
+        self.wheel_tick = int(time.monotonic() / self.tick)
+
+    def _schedule(self, key: str, deadline: float):
+        self.wheel[int(deadline / self.tick) % len(self.wheel)].add(key)
+
+    def _expire(self, now: float):
+        current_tick = int(now / self.tick)
+        steps = min(current_tick - self.wheel_tick, len(self.wheel))
+        for step in range(1, steps + 1):
+            index = (self.wheel_tick + step) % len(self.wheel)
+            slot, self.wheel[index] = self.wheel[index], set()
+            for key in slot:
+                tat = self.tat.get(key)
+                if tat is None:
+                    continue
+                if tat <= now:
+                    del self.tat[key]
+                else:
+                    # The key was hit again after being scheduled; move it
+                    # to the slot of its current deadline.
+                    self._schedule(key, tat)
+        self.wheel_tick = max(self.wheel_tick, current_tick)
+
+    def _charge(self, key: str, cost: int, enforce: bool) -> RateLimitDecision:
+        cost = min(cost, self.limit)
+        now = time.monotonic()
+        with self.lock:
+            self._expire(now)
+            tat = self.tat.get(key)
+            current_tat = max(tat or now, now)
+            new_tat = current_tat + cost * self.emission
+            if enforce and new_tat - self.interval > now:
+                return RateLimitDecision(False, self.limit, 0, current_tat - now, new_tat - self.interval - now)
+            if tat is None:
+                if len(self.tat) >= self.max_keys:
+                    # Its wheel entry is skipped once the TAT is gone.
+                    del self.tat[next(iter(self.tat))]
+                self._schedule(key, new_tat)
+            self.tat[key] = new_tat
+            remaining = max(int((self.interval - (new_tat - now)) / self.emission), 0)
+            return RateLimitDecision(True, self.limit, remaining, new_tat - now, 0.0)
+
+    def is_allowed(self, key: str) -> bool:
+        return self._charge(key, 1, enforce=True).allowed
+
+    async def hit(self, key: str, cost: int = 1) -> RateLimitDecision:
+        return self._charge(key, cost, enforce=True)
+
+    async def record_failure(self, key: str) -> None:
+        self._charge(key, 1, enforce=False)
+
+# GCRA: one key per client holding its theoretical arrival time (TAT) in ms.
+# Uses the Redis clock so every replica agrees on "now".
+GCRA_SCRIPT = """
+local emission = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then
+    tat = now
+end
+-- TAT stays in whole milliseconds: PX only accepts integers. Flooring the
+-- increment keeps a full burst of `limit` within the tolerance.
+local new_tat = tat + math.floor(cost * emission)
+local allow_at = new_tat - tolerance
+if allow_at > now then
+    return {0, 0, allow_at - now, tat - now}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.max(1, math.ceil(new_tat - now)))
+local remaining = math.floor((tolerance - (new_tat - now)) / emission)
+return {1, remaining, 0, new_tat - now}
+"""
+
+class RedisRateLimiter(RateLimitBackend):
+    """GCRA limiter evaluated atomically in Redis, so all replicas share one budget per client."""
+
+    def __init__(self, client, limit: int, interval_sec: int, prefix: str = "ratelimit:", fail_open: bool = True):
+        self.client = client
+        self.limit = limit
+        self.interval_ms = interval_sec * 1000
+        self.emission_ms = self.interval_ms / limit
+        self.prefix = prefix
+        self.fail_open = fail_open
+        self.script = client.register_script(GCRA_SCRIPT)
+
+    async def _evaluate(self, key: str, cost: int):
+        return await self.script(keys=[self.prefix + key], args=[self.emission_ms, self.interval_ms, cost])
+
+    async def hit(self, key: str, cost: int = 1) -> RateLimitDecision:
+        try:
+            allowed, remaining, retry_after_ms, reset_after_ms = await self._evaluate(key, min(cost, self.limit))
+        except Exception as e:
+            logger.error(f"Redis rate limiter unavailable, {'allowing' if self.fail_open else 'rejecting'} request: {e}")
+            return RateLimitDecision(self.fail_open, self.limit, 0, 0.0, 0.0 if self.fail_open else self.interval_ms / 1000)
+        return RateLimitDecision(bool(allowed), self.limit, int(remaining), reset_after_ms / 1000, retry_after_ms / 1000)
+
+    async def record_failure(self, key: str) -> None:
+        # Mirrors RateLimiter: a failed request is charged a second time.
+        try:
+            await self._evaluate(key, 1)
+        except Exception as e:
+            logger.error(f"Redis rate limiter unavailable: {e}")
+
 RATE_LIMIT_REQUESTS = int(os.getenv("RATE_LIMIT_REQUESTS", "5"))
 RATE_LIMIT_WINDOW = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+# Only used by the memory backend: sliding_log keeps a timestamp per request,
+# gcra keeps a single float per client.
+RATE_LIMIT_ALGORITHM = os.getenv("RATE_LIMIT_ALGORITHM", "sliding_log").lower()
+RATE_LIMIT_FAIL_OPEN = os.getenv("RATE_LIMIT_FAIL_OPEN", "true").lower() == "true"
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Clients tracked per in-process limiter; the oldest is forgotten beyond this.
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Comma-separated keys accepted for `key_by: ["api_key"]`; any other
+# X-API-Key is ignored and the request is keyed by client IP.
+RATE_LIMIT_API_KEYS = [key.strip() for key in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if key.strip()]
+
+RATE_LIMIT_POLICIES = os.getenv("RATE_LIMIT_POLICIES", "")
+
+_redis_client = None
+
+def _get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        import redis.asyncio as redis
+        _redis_client = redis.Redis.from_url(REDIS_URL)
+    return _redis_client
+
+def create_rate_limiter(backend: str = RATE_LIMIT_BACKEND, algorithm: str = RATE_LIMIT_ALGORITHM,
+                        limit: int = RATE_LIMIT_REQUESTS, interval_sec: int = RATE_LIMIT_WINDOW,
+                        name: str = "default") -> RateLimitBackend:
+    if backend == "redis":
+        return RedisRateLimiter(_get_redis_client(), limit=limit, interval_sec=interval_sec,
+                                prefix=f"ratelimit:{name}:", fail_open=RATE_LIMIT_FAIL_OPEN)
+    if backend == "memory" and algorithm == "gcra":
+        return GCRARateLimiter(limit=limit, interval_sec=interval_sec, max_keys=RATE_LIMIT_MAX_KEYS)
+    if backend == "memory" and algorithm == "sliding_log":
+        return RateLimiter(limit=limit, interval_sec=interval_sec, max_keys=RATE_LIMIT_MAX_KEYS)
+    if backend == "memory":
+        raise ValueError(f"Unknown RATE_LIMIT_ALGORITHM: {algorithm}")
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+class RateLimitPolicy:
+    """A budget for requests under `path`, keyed by the first available of `key_by`.
+
+    `key_by` entries are "api_key" (an X-API-Key listed in RATE_LIMIT_API_KEYS),
+    "org" (org_id query parameter of an existing org) or "ip". Requests cost `base_cost` tokens, plus `query_cost`
+    when a `q` search is present, plus one token per extra `rows_per_token`
+    rows requested through `limit`.
+    """
+
+    def __init__(self, name: str, limiter: RateLimitBackend, window: int, path: str = "/",
+                 key_by=("ip",), base_cost: int = 1, query_cost: int = 0, rows_per_token: int = 0):
+        self.name = name
+        self.limiter = limiter
+        self.window = window
+        self.path = path
+        self.key_by = tuple(key_by)
+        self.base_cost = base_cost
+        self.query_cost = query_cost
+        self.rows_per_token = rows_per_token
+        self.needs_query = "org" in self.key_by or bool(query_cost) or bool(rows_per_token)
+        self.allowed_counter, self.limited_counter = rate_limit_counters(name)
+        self.rate_limited_body = orjson.dumps({
+            "error": "Rate limit exceeded",
+            "message": "Too many requests. Please try again later.",
+            "detail": f"Rate limit: {limiter.limit} requests per {window} seconds",
+            "retry_after": window
+        })
+
+    def over_budget_body(self, cost: int) -> bytes:
+        # Sent without Retry-After: waiting would not help, the request has to get cheaper.
+        return orjson.dumps({"detail": f"Request costs {cost} rate limit tokens but the limit is "
+                                       f"{self.limiter.limit} per {self.window} seconds"})
+
+    def matches(self, path: str) -> bool:
+        return path == self.path or path.startswith(self.path.rstrip("/") + "/")
+
+    def cost(self, params: Dict[str, List[str]]) -> int:
+        limit = params.get("limit", [""])[0]
+        return self.search_cost(params.get("q", [""])[0], int(limit) if limit.isdigit() else None)
+
+    def search_cost(self, q: Optional[str], limit: Optional[int]) -> int:
+        cost = self.base_cost
+        if self.query_cost and q and q.strip():
+            cost += self.query_cost
+        if self.rows_per_token:
+            rows = limit if limit is not None else DEFAULT_PAGE_SIZE
+            cost += max(math.ceil(rows / self.rows_per_token) - 1, 0)
+        return cost
+
+def load_policies(raw: str) -> List[RateLimitPolicy]:
+    """Parse RATE_LIMIT_POLICIES, a JSON list such as
+    [{"name": "search", "path": "/employees/search", "key_by": ["api_key", "org", "ip"],
+      "limit": 600, "window": 60, "query_cost": 4, "rows_per_token": 50}]
+    """
+    policies = []
+    for spec in orjson.loads(raw) if raw.strip() else []:
+        limit = int(spec.get("limit", RATE_LIMIT_REQUESTS))
+        window = int(spec.get("window", RATE_LIMIT_WINDOW))
+        limiter = create_rate_limiter(limit=limit, interval_sec=window, name=spec["name"])
+        policies.append(RateLimitPolicy(
+            spec["name"], limiter, window, path=spec.get("path", "/"), key_by=spec.get("key_by", ["ip"]),
+            base_cost=int(spec.get("base_cost", 1)), query_cost=int(spec.get("query_cost", 0)),
+            rows_per_token=int(spec.get("rows_per_token", 0)),
+        ))
+    # Most specific path wins.
+    policies.sort(key=lambda policy: len(policy.path), reverse=True)
+    return policies
+
+limiter = create_rate_limiter()
+policies = load_policies(RATE_LIMIT_POLICIES)
+
+EXEMPT_PATHS = frozenset(["/docs", "/redoc", "/openapi.json", "/health", "/metrics"])
+# Matches the default page size of GET /employees/search.
+DEFAULT_PAGE_SIZE = 50
+
+def _api_key_digest(api_key: bytes) -> str:
+    return hashlib.sha256(api_key).hexdigest()[:24]
 
-limiter = RateLimiter(limit=RATE_LIMIT_REQUESTS, interval_sec=RATE_LIMIT_WINDOW)
+def _rate_limit_headers(decision: RateLimitDecision) -> List[tuple]:
+    return [
+        (b"x-ratelimit-limit", str(decision.limit).encode()),
+        (b"x-ratelimit-remaining", str(decision.remaining).encode()),
+        (b"x-ratelimit-reset", str(math.ceil(decision.reset_after)).encode()),
+    ]
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app, rate_limiter: RateLimiter):
-        super().__init__(app)
+def _retry_after_header(decision: RateLimitDecision) -> tuple:
+    return (b"retry-after", str(max(math.ceil(decision.retry_after), 1)).encode())
+
+async def charge_searches(scope, searches) -> Optional[Response]:
+    """Charge a batch request for each of its `(q, limit)` searches, less the flat cost the
+    middleware already took from the request. Returns the 429 response if that exceeds the
+    remaining budget, or a 422 if the batch costs more than the whole budget and can never run."""
+    charged = scope.get("state", {}).get("rate_limit")
+    if charged is None:
+        return None
+    policy, key, paid, headers = charged
+    total = sum(policy.search_cost(q, limit) for q, limit in searches)
+    if total > policy.limiter.limit:
+        return Response(policy.over_budget_body(total), status_code=422, media_type="application/json")
+    cost = total - paid
+    if cost <= 0:
+        return None
+    decision = await policy.limiter.hit(key, cost)
+    # The middleware adds these to whichever response is sent.
+    headers[:] = _rate_limit_headers(decision)
+    if decision.allowed:
+        return None
+    policy.limited_counter.inc()
+    logger.warning(f"Rate limit exceeded for {key} (policy={policy.name}, {len(searches)} searches)")
+    response = Response(policy.rate_limited_body, status_code=429, media_type="application/json")
+    response.raw_headers.append(_retry_after_header(decision))
+    return response
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware: no Request object, no response stream wrapping.
+
+    Requests are charged against the first matching policy, falling back to
+    `rate_limiter` keyed by client IP.
+    """
+
+    def __init__(self, app, rate_limiter: RateLimitBackend, policies: Optional[List[RateLimitPolicy]] = None,
+                 api_keys: Optional[List[str]] = None, known_org: Callable[[int], bool] = crud.is_known_org,
+                 max_org_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.app = app
         self.rate_limiter = rate_limiter
+        self.policies = policies or []
+        keys = RATE_LIMIT_API_KEYS if api_keys is None else api_keys
+        self.api_key_digests = frozenset(_api_key_digest(key.encode()) for key in keys)
+        self.known_org = known_org
+        self.max_org_keys = max_org_keys
+        self.org_keys: Set[int] = set()
+        self.default_policy = RateLimitPolicy("default", rate_limiter, RATE_LIMIT_WINDOW)
 
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope, receive, send):
         # Skip rate limiting for health checks and docs
-        if request.url.path in ["/docs", "/redoc", "/openapi.json", "/health"]:
-            return await call_next(request)
-
-        client_ip = self._get_client_ip(request)
-
-        if not self.rate_limiter.is_allowed(client_ip):
-            logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            return JSONResponse(
-                status_code=429,
-                content={
-                    "error": "Rate limit exceeded",
-                    "message": "Too many requests. Please try again later.",
-                    "detail": f"Rate limit: {RATE_LIMIT_REQUESTS} requests per {RATE_LIMIT_WINDOW} seconds",
-                    "retry_after": RATE_LIMIT_WINDOW
-                },
-                headers={"Retry-After": str(RATE_LIMIT_WINDOW)}
-            )
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        policy = self._match_policy(scope["path"])
+        params = parse_qs(scope["query_string"].decode("latin-1")) if policy.needs_query else {}
+        key = self._get_client_key(policy, scope, params)
+        cost = policy.cost(params)
+        if cost > policy.limiter.limit:
+            body = policy.over_budget_body(cost)
+            await send({
+                "type": "http.response.start",
+                "status": 422,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        decision = await policy.limiter.hit(key, cost)
+        headers = _rate_limit_headers(decision)
+
+        if not decision.allowed:
+            policy.limited_counter.inc()
+            logger.warning(f"Rate limit exceeded for {key} (policy={policy.name})")
+            await send({
+                "type": "http.response.start",
+                "status": 429,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(policy.rate_limited_body)).encode()),
+                    _retry_after_header(decision),
+                    *headers,
+                ],
+            })
+            await send({"type": "http.response.body", "body": policy.rate_limited_body})
+            return
+
+        policy.allowed_counter.inc()
+        # Lets endpoints whose cost depends on the body charge the rest (charge_searches).
+        scope.setdefault("state", {})["rate_limit"] = (policy, key, cost, headers)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", ()), *headers]
+            await send(message)
 
         try:
-            response = await call_next(request)
-            return response
-        except Exception as e:
-            self.rate_limiter.record_request(client_ip, success=False)
-            raise e
+            await self.app(scope, receive, send_with_headers)
+        except Exception:
+            await policy.limiter.record_failure(key)
+            raise
 
-    def _get_client_ip(self, request: Request) -> str:
-        forwarded_for = request.headers.get("X-Forwarded-For")
-        if forwarded_for:
-            return forwarded_for.split(",")[0].strip()
+    def _match_policy(self, path: str) -> RateLimitPolicy:
+        for policy in self.policies:
+            if policy.matches(path):
+                return policy
+        return self.default_policy
 
-        real_ip = request.headers.get("X-Real-IP")
-        if real_ip:
-            return real_ip
+    def _org_key_allowed(self, org_id: int) -> bool:
+        if org_id in self.org_keys:
+            return True
+        if len(self.org_keys) >= self.max_org_keys or not self.known_org(org_id):
+            return False
+        self.org_keys.add(org_id)
+        return True
 
-        return request.client.host if request.client else "unknown"
\ No newline at end of file
+    def _get_client_key(self, policy: RateLimitPolicy, scope, params: Dict[str, List[str]]) -> str:
+        forwarded_for = real_ip = api_key = None
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                forwarded_for = value
+            elif name == b"x-real-ip":
+                real_ip = value
+            elif name == b"x-api-key":
+                api_key = value
+
+        for source in policy.key_by:
+            if source == "api_key" and api_key:
+                # Hashed so raw keys never end up in Redis key names or logs.
+                digest = _api_key_digest(api_key)
+                if digest in self.api_key_digests:
+                    return "key:" + digest
+                # An unknown key would otherwise mint a fresh budget per request.
+                break
+            if source == "org":
+                org_id = params.get("org_id", [""])[0]
+                if org_id.isdigit() and self._org_key_allowed(int(org_id)):
+                    # Through int so "01" and "1" share one budget.
+                    return f"org:{int(org_id)}"
+                # Made-up org ids, like made-up API keys, must not mint fresh budgets.
+                break
+            if source == "ip":
+                break
+
+        if forwarded_for:
+            return "ip:" + forwarded_for.decode("latin-1").split(",")[0].strip()
+        if real_ip:
+            return "ip:" + real_ip.decode("latin-1")
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
@@ -0,0 +1,158 @@
+import asyncio
+import itertools
+import logging
+import math
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import exc, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.db import AsyncSessionLocal, create_async_db_engine
+
+logger = logging.getLogger(__name__)
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# round_robin | least_connections
+REPLICA_ROUTING = os.getenv("REPLICA_ROUTING", "round_robin").lower()
+# Replicas replaying WAL more than this many seconds behind the primary are
+# skipped until they catch up; 0 disables the bound.
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "10"))
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+
+# Zero when every received WAL record has been replayed, so an idle primary
+# does not make its replicas look stale. That only holds while WAL is still
+# arriving: with no streaming receiver, or one that has heard nothing from the
+# primary within wal_receiver_timeout, the lag is unknown (NULL).
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver
+            WHERE status = 'streaming'
+              AND (current_setting('wal_receiver_timeout') = '0'
+                   OR now() - last_msg_receipt_time <= CAST(current_setting('wal_receiver_timeout') AS interval))
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+class Replica:
+    def __init__(self, url: str, engine=None):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = engine if engine is not None else create_async_db_engine(url)
+        self.sessionmaker = async_sessionmaker(bind=self.engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+        # Unhealthy until the first check has measured the lag.
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.in_use = 0
+
+class ReplicaRouter:
+    """Spreads read-only sessions over healthy replicas, falling back to the primary."""
+
+    def __init__(self, replicas: List[Replica], strategy: str = REPLICA_ROUTING,
+                 max_lag: float = REPLICA_MAX_LAG_SECONDS, interval: float = REPLICA_HEALTH_INTERVAL,
+                 primary: async_sessionmaker = AsyncSessionLocal):
+        if strategy not in ("round_robin", "least_connections"):
+            raise ValueError(f"Unknown replica routing strategy: {strategy}")
+        self.replicas = replicas
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.interval = interval
+        self.primary = primary
+        self._turn = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def max_staleness(self) -> float:
+        """How far behind the primary a replica handed out by `session` can be: the lag
+        bound plus one health-check interval (unbounded when the lag bound is disabled)."""
+        return self.max_lag + self.interval if self.max_lag > 0 else math.inf
+
+    def is_replica(self, db) -> bool:
+        bind = getattr(db, "bind", None)
+        return any(bind is replica.engine for replica in self.replicas)
+
+    def pick(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.strategy == "least_connections":
+            return min(healthy, key=lambda replica: replica.in_use)
+        return healthy[next(self._turn) % len(healthy)]
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        replica = self.pick()
+        if replica is None:
+            async with self.primary() as db:
+                yield db
+            return
+        replica.in_use += 1
+        try:
+            async with replica.sessionmaker() as db:
+                yield db
+        except Exception as e:
+            if _is_disconnect(e):
+                self._mark_down(replica, e)
+            raise
+        finally:
+            replica.in_use -= 1
+
+    async def _lag(self, replica: Replica) -> float:
+        async with replica.engine.connect() as connection:
+            return await connection.scalar(LAG_QUERY)
+
+    async def check(self, replica: Replica) -> None:
+        try:
+            lag = await asyncio.wait_for(self._lag(replica), timeout=self.interval)
+        except Exception as e:
+            self._mark_down(replica, e)
+            return
+        if lag is None:
+            replica.lag = None
+            self._mark_down(replica, RuntimeError("WAL receiver is not streaming from the primary"))
+            return
+        replica.lag = float(lag)
+        healthy = self.max_lag <= 0 or replica.lag <= self.max_lag
+        if healthy != replica.healthy:
+            if healthy:
+                logger.info(f"Replica {replica.name} is serving reads (lag {replica.lag:.1f}s)")
+            else:
+                logger.warning(f"Replica {replica.name} is {replica.lag:.1f}s behind, routing reads elsewhere")
+        replica.healthy = healthy
+
+    def _mark_down(self, replica: Replica, error: Exception) -> None:
+        if replica.healthy:
+            logger.warning(f"Replica {replica.name} unavailable, routing reads elsewhere: {error}")
+        replica.healthy = False
+
+    def start(self) -> None:
+        if self.replicas and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+            await asyncio.sleep(self.interval)
+
+def _is_disconnect(error: Exception) -> bool:
+    if isinstance(error, exc.DBAPIError):
+        return error.connection_invalidated or isinstance(error, exc.InterfaceError)
+    return isinstance(error, OSError)
+
+replica_router = ReplicaRouter([Replica(url) for url in DATABASE_REPLICA_URLS])
@@ -0,0 +1,135 @@
+import asyncio
+import hashlib
+import logging
+import os
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+from app.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "30"))
+# Optional second tier shared by every worker and replica of the API.
+RESULT_CACHE_REDIS = os.getenv("RESULT_CACHE_REDIS", "false").lower() == "true"
+RESULT_CACHE_REDIS_URL = os.getenv("RESULT_CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+class SearchResult(NamedTuple):
+    rows: List[Any]
+    total: Optional[int]
+    total_exact: bool
+
+def _normalize_list(values) -> Optional[List[str]]:
+    # `column = ANY(array)` ignores order and duplicates, so ?departments=A&departments=B
+    # and B&A share an entry. The values are bound as sent, so they are keyed as sent.
+    if not values:
+        return None
+    return sorted({str(getattr(v, "value", v)) for v in values})
+
+def search_key(org_id: int, version: int, columns: List[str], q: Optional[str], status, locations, departments,
+               positions, offset: int, limit: int, after: Optional[Tuple[str, int]], include_total: bool) -> str:
+    """Cache key for one search. The org's data version acts as its generation:
+    any write bumps it, so entries from before the write are never read again.
+
+    Only differences crud ignores are normalized away: `q` is matched
+    lowercased, and list filters as sets. Whitespace is significant to both.
+    """
+    normalized = [
+        list(columns), q.lower() if q else None,
+        _normalize_list(status), _normalize_list(locations), _normalize_list(departments), _normalize_list(positions),
+        offset, limit, list(after) if after is not None else None, include_total,
+    ]
+    digest = hashlib.blake2b(orjson.dumps(normalized), digest_size=16).hexdigest()
+    return f"search:{org_id}:{version}:{digest}"
+
+@lru_cache(maxsize=256)
+def _row_type(fields: Tuple[str, ...]):
+    return namedtuple("CachedRow", fields)
+
+def encode_search(result: SearchResult) -> bytes:
+    fields = list(result.rows[0]._fields) if result.rows else []
+    return orjson.dumps({"fields": fields, "rows": [tuple(row) for row in result.rows],
+                         "total": result.total, "total_exact": result.total_exact})
+
+def decode_search(raw: bytes) -> SearchResult:
+    data = orjson.loads(raw)
+    row_type = _row_type(tuple(data["fields"]))
+    return SearchResult([row_type(*row) for row in data["rows"]], data["total"], data["total_exact"])
+
+class ResultCache:
+    """Two-tier cache (in-process LRU, then optional Redis) with per-key request coalescing."""
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL, redis_client=None,
+                 encode: Callable[[Any], bytes] = encode_search, decode: Callable[[bytes], Any] = decode_search):
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.redis = redis_client
+        self.encode = encode
+        self.decode = decode
+        self._pending: Dict[str, asyncio.Future] = {}
+        self.loads = 0
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        while (pending := self._pending.get(key)) is not None:
+            # Another request is already computing this key; share its result.
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only retry when the leader was cancelled (client went away),
+                # not this request.
+                if not pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        try:
+            value = await self._redis_get(key)
+            if value is None:
+                self.loads += 1
+                value = await load()
+                await self._redis_set(key, value)
+            self.local.set(key, value)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting; do not log "exception was never retrieved".
+            future.exception()
+            raise
+        finally:
+            del self._pending[key]
+
+    async def _redis_get(self, key: str) -> Any:
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"Result cache Redis read failed, querying the database: {e}")
+            return None
+        return self.decode(raw) if raw is not None else None
+
+    async def _redis_set(self, key: str, value: Any) -> None:
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(key, self.encode(value), px=int(self.ttl * 1000))
+        except Exception as e:
+            logger.warning(f"Result cache Redis write failed: {e}")
+
+def _create_redis_client():
+    import redis.asyncio as redis
+    return redis.Redis.from_url(RESULT_CACHE_REDIS_URL)
+
+search_cache = ResultCache(redis_client=_create_redis_client() if RESULT_CACHE_REDIS else None)
@@ -0,0 +1,62 @@
+import logging
+import os
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app import importer, invalidation
+from app.profiling import ORDER_BY, profiler
+from app.routers.search import get_primary_db
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    # Admin endpoints are disabled entirely unless ADMIN_TOKEN is configured.
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin access denied")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.post("/cache/org-config/invalidate")
+async def invalidate_org_config(
+    org_id: Optional[int] = Query(None, gt=0, description="Organization to invalidate; omit to invalidate all"),
+    db: AsyncSession = Depends(get_primary_db)
+):
+    payload = str(org_id) if org_id is not None else invalidation.ALL_ORGS
+    logger.info(f"Invalidating org config cache for {payload}")
+
+    invalidation.dispatch(invalidation.ORG_CONFIG_CHANNEL, payload)
+    # Fan out to the other workers and replicas through their listeners.
+    await db.execute(text("SELECT pg_notify(:channel, :payload)"),
+                     {"channel": invalidation.ORG_CONFIG_CHANNEL, "payload": payload})
+    await db.commit()
+    return {"invalidated": payload}
+
+@router.post("/employees/import")
+async def import_employees(
+    request: Request,
+    import_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$", description="csv (with a header line) or ndjson"),
+    org_id: Optional[int] = Query(None, gt=0, description="Org for rows without an org_id; rows for other orgs are rejected"),
+    db: AsyncSession = Depends(get_primary_db)
+):
+    """Merge the request body into employees on (org_id, email) and invalidate the orgs that changed."""
+    try:
+        return await importer.import_employees(db, request.stream(), import_format, org_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/queries")
+async def top_queries(
+    limit: int = Query(20, ge=1, le=200, description="Number of statements to return"),
+    order_by: str = Query("total_ms", pattern=f"^({'|'.join(ORDER_BY)})$", description="Ranking: " + ", ".join(ORDER_BY)),
+):
+    """Statements seen by this worker, grouped by fingerprint, with plans captured for slow ones."""
+    return {"enabled": profiler.installed, "slow_query_ms": profiler.slow_ms, "queries": profiler.top(limit, order_by)}
+
+@router.post("/queries/reset")
+async def reset_queries():
+    profiler.reset()
+    return {"reset": True}
@@ -1,24 +1,56 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
-from sqlalchemy.orm import Session
+import os
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, Query
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
-from app.db import SessionLocal
+from app.db import AsyncSessionLocal
+from app.rate_limiter import charge_searches
+from app.replicas import replica_router
 from app import crud, utils
+from app.suggest import suggest_index
+from app.result_cache import RESULT_CACHE_ENABLED, SearchResult, search_cache, search_key
 from app.schemas import FilterMetadata, EmployeeSearchRequest, EmployeeOut, EmployeeStatus
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
+# include_total: orgs up to this many employees get an exact count, larger
+# ones a planner estimate unless the cached facet counts answer exactly.
+EXACT_COUNT_THRESHOLD = int(os.getenv("EXACT_COUNT_THRESHOLD", "10000"))
+BATCH_MAX_SEARCHES = int(os.getenv("BATCH_MAX_SEARCHES", "20"))
+SUGGEST_MAX_LIMIT = int(os.getenv("SUGGEST_MAX_LIMIT", "25"))
+# Rows fetched from the export cursor, and serialized, per chunk of the response.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+# Sent with every ETag; "no-cache" lets browsers and proxies store responses
+# but revalidate each time, which a matching If-None-Match answers with 304.
+HTTP_CACHE_CONTROL = os.getenv("HTTP_CACHE_CONTROL", "private, no-cache")
+
+async def get_db():
+    """Read-only session on a healthy replica, or the primary when none is available."""
+    async with replica_router.session() as db:
+        yield db
+
+async def get_primary_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+def get_db_sessions():
+    """Read session factory for streamed responses, whose body is sent after the request's
+    dependencies have closed their sessions."""
+    return replica_router.session
+
+def cache_validators(request: Request, version: int, *parts):
+    """ETag headers for an org-scoped GET, plus a 304 response if the client already holds that version."""
+    etag = utils.make_etag(version, *parts, sorted(request.query_params.multi_items()))
+    headers = {"ETag": etag, "Cache-Control": HTTP_CACHE_CONTROL}
+    if utils.etag_matches(request.headers.get("if-none-match"), etag):
+        return headers, Response(status_code=304, headers=headers)
+    return headers, None
 
 @router.get("/search")
-def search_employees(
+async def search_employees(
     request: Request,
     org_id: int = Query(..., gt=0, description="Organization ID must be positive"),
     search_query: Optional[str] = Query(None, alias="q", max_length=100, description="Search query for employee names and email"),
@@ -28,17 +60,181 @@ def search_employees(
     positions: Optional[List[str]] = Query(None, description="Filter by positions"),
     offset: int = Query(0, ge=0, description="Pagination offset"),
     limit: int = Query(50, ge=1, le=100, description="Number of results to return (max 100)"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(None, description="Keyset pagination cursor; pass an empty value for the first page"),
+    include_total: bool = Query(False, description="Also return the total number of matches (exact or estimated)"),
+    response_format: str = Query("json", alias="format", pattern="^(json|ndjson)$", description="json (default) or ndjson (one employee per line, streamed)"),
+    db: AsyncSession = Depends(get_db)
 ):
     logger.info(f"Search request for org_id={org_id}, search_query='{search_query}', filters={{status={status}, locations={locations}, departments={departments}, positions={positions}}}")
 
-    columns = crud.get_org_columns(db, org_id)
+    columns = await crud.get_org_columns(db, org_id)
+    if not columns:
+        raise HTTPException(status_code=404, detail="Organization config not found")
+
+    after = None
+    if cursor:
+        try:
+            after = utils.decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # Checked before any search query runs; the org version is cached until
+    # the employees triggers NOTIFY a change.
+    version = await crud.get_org_version(db, org_id)
+    headers, not_modified = cache_validators(request, version, columns)
+    if not_modified is not None:
+        return not_modified
+
+    filters = (search_query, status, locations, departments, positions)
+    page_offset = offset if cursor is None else 0
+
+    async def run_search() -> SearchResult:
+        total = None
+        total_exact = True
+        window_total = False
+        if include_total:
+            # Facet counts only when already cached: computing them scans the whole org,
+            # which costs more than the count they would save. Otherwise the planner's
+            # estimate of the org's size picks the mode.
+            metadata = crud.cached_filter_metadata(org_id)
+            if metadata is not None:
+                total = crud.count_from_facets(metadata, *filters)
+                org_size = metadata["total"]
+            else:
+                org_size = await crud.estimate_employees(db, org_id, None, None, None, None, None)
+            if total is None and org_size > EXACT_COUNT_THRESHOLD:
+                total = await crud.estimate_employees(db, org_id, *filters) if any(filters) else org_size
+                total_exact = False
+            # Small orgs in offset mode: count(*) OVER () rides along in the page query.
+            window_total = total is None and cursor is None
+
+        employees = await crud.search_employees(db, org_id, search_query, page_offset, limit,
+                                                status, locations, departments, positions, after=after,
+                                                columns=columns, with_total=window_total)
+
+        if include_total and total is None:
+            if employees and window_total:
+                total = employees[0].total_count
+            else:
+                # Cursor mode, or an offset past the last match.
+                total = await crud.count_employees(db, org_id, *filters)
+        return SearchResult(employees, total, total_exact)
+
+    if RESULT_CACHE_ENABLED:
+        # Keyed on the org version, so a write makes older entries unreachable;
+        # concurrent identical misses share one query.
+        key = search_key(org_id, version, columns, *filters, page_offset, limit, after, include_total)
+        employees, total, total_exact = await search_cache.get_or_load(key, run_search)
+    else:
+        employees, total, total_exact = await run_search()
+
+    next_cursor = None
+    if cursor is not None and len(employees) == limit:
+        last = employees[-1]
+        next_cursor = utils.encode_cursor(last.sort_key, last.id)
+
+    if response_format == "ndjson":
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        if include_total:
+            headers["X-Total-Count"] = str(total)
+            headers["X-Total-Count-Exact"] = "true" if total_exact else "false"
+        return StreamingResponse(utils.iter_ndjson(employees, columns), media_type="application/x-ndjson", headers=headers)
+
+    # Rendered straight to orjson bytes; skips FastAPI's jsonable_encoder pass.
+    items = utils.render_rows(employees, columns)
+    if cursor is None and not include_total:
+        return Response(utils.render_json(items), media_type="application/json", headers=headers)
+
+    page = {"items": items}
+    if cursor is not None:
+        page["next_cursor"] = next_cursor
+    if include_total:
+        page["total"] = total
+        page["total_exact"] = total_exact
+    return Response(utils.render_json(page), media_type="application/json", headers=headers)
+
+@router.get("/export")
+async def export_employees(
+    org_id: int = Query(..., gt=0, description="Organization ID must be positive"),
+    search_query: Optional[str] = Query(None, alias="q", max_length=100, description="Search query for employee names and email"),
+    status: Optional[List[EmployeeStatus]] = Query(None, description="Filter by employee status"),
+    locations: Optional[List[str]] = Query(None, description="Filter by locations"),
+    departments: Optional[List[str]] = Query(None, description="Filter by departments"),
+    positions: Optional[List[str]] = Query(None, description="Filter by positions"),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$", description="csv (default, with a header line) or ndjson"),
+    db: AsyncSession = Depends(get_db),
+    sessions = Depends(get_db_sessions)
+):
+    """Every matching employee in one streamed response, in search order, limited to the org's visible columns."""
+    columns = await crud.get_org_columns(db, org_id)
+    if not columns:
+        raise HTTPException(status_code=404, detail="Organization config not found")
+    logger.info(f"Export request for org_id={org_id}, format={export_format}, search_query='{search_query}', filters={{status={status}, locations={locations}, departments={departments}, positions={positions}}}")
+
+    render = utils.render_csv if export_format == "csv" else utils.render_ndjson
+
+    async def body():
+        if export_format == "csv":
+            yield utils.render_csv((), columns, header=True)
+        async with sessions() as export_db:
+            async for rows in crud.stream_employees(export_db, org_id, columns, EXPORT_CHUNK_ROWS, search_query,
+                                                    status, locations, departments, positions):
+                yield render(rows, columns)
+
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="employees-{org_id}.{export_format}"'}
+    return StreamingResponse(body(), media_type=media_type, headers=headers)
+
+@router.post("/search/batch")
+async def search_employees_batch(
+    request: Request,
+    searches: List[EmployeeSearchRequest] = Body(..., min_length=1, max_length=BATCH_MAX_SEARCHES),
+    db: AsyncSession = Depends(get_db)
+):
+    """Run several searches in one request and one query; returns one result list per search, in order."""
+    logger.info(f"Batch search request with {len(searches)} searches for org_ids={sorted({s.org_id for s in searches})}")
+
+    # Each search is charged like a GET /employees/search before any query runs.
+    rate_limited = await charge_searches(request.scope, [(search.search_query, search.limit) for search in searches])
+    if rate_limited is not None:
+        return rate_limited
+
+    org_columns = await crud.get_org_columns_many(db, [search.org_id for search in searches])
+    missing = sorted(org_id for org_id, columns in org_columns.items() if not columns)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Organization config not found for org_id {missing}")
+
+    columns = list(dict.fromkeys(column for search in searches for column in org_columns[search.org_id]))
+    pages = await crud.search_employees_batch(db, searches, columns)
+    results = [utils.render_rows(rows, org_columns[search.org_id]) for search, rows in zip(searches, pages)]
+    return Response(utils.render_json(results), media_type="application/json")
+
+@router.get("/suggest")
+async def suggest_employees(
+    org_id: int = Query(..., gt=0, description="Organization ID must be positive"),
+    prefix: str = Query(..., alias="q", min_length=1, max_length=100, description="Prefix of a first name, last name, full name or email"),
+    limit: int = Query(10, ge=1, le=SUGGEST_MAX_LIMIT, description="Number of suggestions to return"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Type-ahead over the org's visible name fields, served from the in-memory suggest index."""
+    columns = await crud.get_org_columns(db, org_id)
     if not columns:
         raise HTTPException(status_code=404, detail="Organization config not found")
+    fields = [field for field in crud.SUGGEST_FIELDS if field in columns]
+    if not fields:
+        return Response(b"[]", media_type="application/json")
 
-    employees = crud.search_employees(db, org_id, search_query, offset, limit, status, locations, departments, positions)
-    return [utils.serialize_employee(emp, columns) for emp in employees]
+    suggestions = await suggest_index.suggest(db, org_id, fields, prefix, limit)
+    if suggestions is None:
+        rows = await crud.suggest_employees(db, org_id, prefix, fields, limit)
+        suggestions = utils.render_rows(rows, fields)
+    return Response(utils.render_json(suggestions), media_type="application/json")
 
 @router.get("/filters/metadata", response_model=FilterMetadata)
-def get_filter_metadata(org_id: int, db: Session = Depends(get_db)):
-    return crud.get_filter_metadata(db, org_id)
\ No newline at end of file
+async def get_filter_metadata(org_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    headers, not_modified = cache_validators(request, await crud.get_org_version(db, org_id))
+    if not_modified is not None:
+        return not_modified
+    response.headers.update(headers)
+    return await crud.get_filter_metadata(db, org_id)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, field_validator, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Dict
 from enum import Enum
 
 class EmployeeStatus(str, Enum):
@@ -47,4 +47,6 @@ class FilterMetadata(BaseModel):
     statuses: List[str]
     locations: List[str]
     departments: List[str]
-    positions: List[str]
\ No newline at end of file
+    positions: List[str]
+    counts: Dict[str, Dict[str, int]] = Field(default_factory=dict, description="Employee count per value of each filter")
+    total: Optional[int] = Field(None, description="Total employees in the organization")
\ No newline at end of file
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import crud, invalidation
+
+logger = logging.getLogger(__name__)
+
+# Memory budget: total (term, id) entries across all cached orgs. Least
+# recently used orgs are dropped to stay under it; an org that alone would
+# exceed it is answered from Postgres instead.
+SUGGEST_MAX_ENTRIES = int(os.getenv("SUGGEST_MAX_ENTRIES", "500000"))
+# Upper bound on staleness when NOTIFY is unavailable; org_data_changed marks
+# an org for refresh immediately.
+SUGGEST_REFRESH_SECONDS = float(os.getenv("SUGGEST_REFRESH_SECONDS", "30"))
+# Re-read rows this far behind the watermark, covering transactions that
+# committed after a refresh with an earlier now().
+SUGGEST_REFRESH_OVERLAP = timedelta(seconds=float(os.getenv("SUGGEST_REFRESH_OVERLAP", "60")))
+
+def normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").casefold().split())
+
+class OrgNameIndex:
+    """Sorted (term, employee id) pairs for one org, searched by prefix with bisect."""
+
+    def __init__(self, fields: Tuple[str, ...]):
+        self.fields = fields
+        self.records: Dict[int, tuple] = {}
+        self.entries: List[Tuple[str, int]] = []
+        self.watermark = None
+        self.refreshed_at = 0.0
+        self.stale = True
+        self.lock = asyncio.Lock()
+
+    def due(self, refresh_seconds: float) -> bool:
+        return self.stale or self.refreshed_at + refresh_seconds <= time.monotonic()
+
+    def _terms(self, record: tuple) -> set:
+        values = dict(zip(self.fields, record))
+        terms = {normalize(value) for value in record}
+        if "first_name" in values and "last_name" in values:
+            # "ann sm" should find Ann Smith.
+            terms.add(normalize(f"{values['first_name'] or ''} {values['last_name'] or ''}"))
+        terms.discard("")
+        return terms
+
+    def load(self, rows: Iterable) -> None:
+        self.records = {}
+        self.watermark = None
+        self._track(rows)
+        self.entries = sorted(
+            (term, employee_id) for employee_id, record in self.records.items() for term in self._terms(record)
+        )
+
+    def apply(self, rows: Iterable) -> None:
+        for employee_id, old, new in self._track(rows):
+            for term in self._terms(old) if old is not None else ():
+                position = bisect_left(self.entries, (term, employee_id))
+                if position < len(self.entries) and self.entries[position] == (term, employee_id):
+                    del self.entries[position]
+            for term in self._terms(new):
+                insort(self.entries, (term, employee_id))
+
+    def _track(self, rows: Iterable) -> List[tuple]:
+        changes = []
+        for row in rows:
+            record = tuple(row[2:])
+            old = self.records.get(row.id)
+            if old != record:
+                changes.append((row.id, old, record))
+                self.records[row.id] = record
+            if row.updated_at is not None and (self.watermark is None or row.updated_at > self.watermark):
+                self.watermark = row.updated_at
+        return changes
+
+    def search(self, prefix: str, limit: int) -> List[dict]:
+        prefix = normalize(prefix)
+        matches = []
+        seen = set()
+        position = bisect_left(self.entries, (prefix,))
+        while position < len(self.entries) and len(matches) < limit:
+            term, employee_id = self.entries[position]
+            if not term.startswith(prefix):
+                break
+            if employee_id not in seen:
+                seen.add(employee_id)
+                matches.append(dict(zip(self.fields, self.records[employee_id])))
+            position += 1
+        return matches
+
+class SuggestIndex:
+    """Per-org OrgNameIndex instances, built lazily and kept within SUGGEST_MAX_ENTRIES."""
+
+    def __init__(self, max_entries: int = SUGGEST_MAX_ENTRIES, refresh_seconds: float = SUGGEST_REFRESH_SECONDS):
+        self.max_entries = max_entries
+        self.refresh_seconds = refresh_seconds
+        self._orgs: "OrderedDict[int, OrgNameIndex]" = OrderedDict()
+        # Orgs too large to index, until their next refresh is due.
+        self._oversized: Dict[int, float] = {}
+
+    def entries(self) -> int:
+        return sum(len(index.entries) for index in self._orgs.values())
+
+    async def suggest(self, db: AsyncSession, org_id: int, fields: List[str], prefix: str,
+                      limit: int) -> Optional[List[dict]]:
+        """Top `limit` prefix matches, or None if the org is too large to index."""
+        fields = tuple(fields)
+        if self._oversized.get(org_id, 0.0) > time.monotonic():
+            return None
+        index = self._orgs.get(org_id)
+        if index is None or index.fields != fields:
+            index = OrgNameIndex(fields)
+            self._orgs[org_id] = index
+        self._orgs.move_to_end(org_id)
+
+        if index.due(self.refresh_seconds):
+            async with index.lock:
+                # Another request may have refreshed while this one waited.
+                if index.due(self.refresh_seconds):
+                    await self._refresh(db, org_id, index)
+            if self._orgs.get(org_id) is not index:
+                return None
+        return index.search(prefix, limit)
+
+    async def _refresh(self, db: AsyncSession, org_id: int, index: OrgNameIndex) -> None:
+        started = time.monotonic()
+        # Cleared up front so a NOTIFY arriving mid-refresh triggers another one.
+        index.stale = False
+        total = await crud.count_employees(db, org_id, None, None, None, None, None)
+        # Each employee contributes up to one term per field plus the full name.
+        if total * (len(index.fields) + 1) > self.max_entries:
+            logger.info(f"Suggest index for org_id={org_id} skipped: {total} employees exceed the memory budget")
+            self._orgs.pop(org_id, None)
+            self._oversized[org_id] = started + self.refresh_seconds
+            return
+
+        if index.watermark is not None:
+            since = index.watermark - SUGGEST_REFRESH_OVERLAP
+            index.apply(await crud.load_suggest_rows(db, org_id, list(index.fields), since=since))
+        if index.watermark is None or len(index.records) != total:
+            # First build, or rows were deleted or moved to another org.
+            index.load(await crud.load_suggest_rows(db, org_id, list(index.fields)))
+            logger.info(f"Built suggest index for org_id={org_id}: {len(index.entries)} entries "
+                        f"in {(time.monotonic() - started) * 1000:.1f}ms")
+        index.refreshed_at = time.monotonic()
+        if not crud.cacheable_read(db, org_id):
+            # Read from a replica that may predate the last change; refresh again next time.
+            index.stale = True
+        self._evict(keep=org_id)
+
+    def _evict(self, keep: int) -> None:
+        total = self.entries()
+        while total > self.max_entries and len(self._orgs) > 1:
+            org_id = next(iter(self._orgs))
+            if org_id == keep:
+                self._orgs.move_to_end(org_id)
+                continue
+            total -= len(self._orgs.pop(org_id).entries)
+
+    def mark_stale(self, payload: str) -> None:
+        orgs = list(self._orgs.values()) if payload == invalidation.ALL_ORGS else [self._orgs.get(int(payload))]
+        for index in orgs:
+            if index is not None:
+                index.stale = True
+        if payload == invalidation.ALL_ORGS:
+            self._oversized.clear()
+        else:
+            self._oversized.pop(int(payload), None)
+
+    def drop(self, payload: str) -> None:
+        if payload == invalidation.ALL_ORGS:
+            self._orgs.clear()
+        else:
+            self._orgs.pop(int(payload), None)
+
+suggest_index = SuggestIndex()
+
+# Data changes refresh incrementally on the next keystroke; a visible_columns
+# change alters the indexed fields, so that org is rebuilt from scratch.
+invalidation.subscribe(invalidation.ORG_DATA_CHANNEL, suggest_index.mark_stale)
+invalidation.subscribe(invalidation.ORG_CONFIG_CHANNEL, suggest_index.drop)
@@ -1,4 +1,106 @@
-from typing import List
+import base64
+import csv
+import enum
+import hashlib
+import io
+import time
+from functools import lru_cache
+from operator import attrgetter
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+import orjson
+from app import metrics
+from app.models import Employee
+
+EMPLOYEE_COLUMNS = frozenset(Employee.__table__.columns.keys())
+NDJSON_CHUNK_ROWS = 50
 
 def serialize_employee(emp, columns: List[str]) -> dict:
-    return {col: getattr(emp, col, None) for col in columns}
\ No newline at end of file
+    return {col: getattr(emp, col, None) for col in columns}
+
+@lru_cache(maxsize=1024)
+def compile_row_serializer(columns: Tuple[str, ...]) -> Callable[[object], dict]:
+    """Build a row -> dict function for one org's visible_columns, resolved once per column set."""
+    if not columns or not EMPLOYEE_COLUMNS.issuperset(columns):
+        return lambda row: serialize_employee(row, columns)
+    if len(columns) == 1:
+        key, = columns
+        getter = attrgetter(key)
+        return lambda row: {key: getter(row)}
+    getter = attrgetter(*columns)
+    return lambda row: dict(zip(columns, getter(row)))
+
+def render_json(payload) -> bytes:
+    started = time.perf_counter()
+    body = orjson.dumps(payload)
+    metrics.add_time(metrics.SERIALIZE, time.perf_counter() - started)
+    return body
+
+def render_rows(rows: Iterable, columns: List[str]) -> List[dict]:
+    started = time.perf_counter()
+    serialize = compile_row_serializer(tuple(columns))
+    items = [serialize(row) for row in rows]
+    metrics.add_time(metrics.SERIALIZE, time.perf_counter() - started)
+    return items
+
+def iter_ndjson(rows: Iterable, columns: List[str], chunk_rows: int = NDJSON_CHUNK_ROWS) -> Iterator[bytes]:
+    """Yield newline-delimited JSON in chunks of `chunk_rows` rows."""
+    serialize = compile_row_serializer(tuple(columns))
+    chunk = []
+    for row in rows:
+        chunk.append(orjson.dumps(serialize(row), option=orjson.OPT_APPEND_NEWLINE))
+        if len(chunk) >= chunk_rows:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+
+def render_ndjson(rows: Iterable, columns: List[str]) -> bytes:
+    started = time.perf_counter()
+    serialize = compile_row_serializer(tuple(columns))
+    body = b"".join(orjson.dumps(serialize(row), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+    metrics.add_time(metrics.SERIALIZE, time.perf_counter() - started)
+    return body
+
+def _csv_value(value):
+    return value.value if isinstance(value, enum.Enum) else value
+
+def render_csv(rows: Iterable, columns: List[str], header: bool = False) -> bytes:
+    """CSV lines for `rows` in `columns` order; NULLs become empty fields."""
+    started = time.perf_counter()
+    serialize = compile_row_serializer(tuple(columns))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows([_csv_value(value) for value in serialize(row).values()] for row in rows)
+    metrics.add_time(metrics.SERIALIZE, time.perf_counter() - started)
+    return buffer.getvalue().encode()
+
+def encode_cursor(sort_key: Optional[str], employee_id: int) -> str:
+    raw = orjson.dumps([sort_key or "", employee_id])
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """Decode a cursor from encode_cursor; raises ValueError if it is malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_key, employee_id = orjson.loads(raw)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(sort_key, str) or not isinstance(employee_id, int):
+        raise ValueError("Invalid cursor")
+    return sort_key, employee_id
+
+def make_etag(*parts) -> str:
+    """Weak ETag over JSON-serializable parts (org version, visible columns, query parameters)."""
+    digest = hashlib.blake2b(orjson.dumps(parts), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match uses weak comparison, so W/ prefixes are ignored on both sides."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
@@ -0,0 +1,50 @@
+"""Value pools and the org size distribution shared by the seeder and the load driver."""
+
+import random
+from typing import List
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda", "William", "Elizabeth",
+    "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Priya", "Wei", "Ahmed", "Sofia", "Hiroshi", "Olga", "Carlos", "Fatima", "Lars", "Amara",
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Patel", "Chen", "Khan", "Rossi", "Tanaka", "Ivanova", "Silva", "Haddad", "Nielsen", "Okafor",
+]
+DEPARTMENTS = ["Engineering", "Marketing", "Sales", "HR", "Support", "Finance", "Legal", "Operations"]
+LOCATIONS = ["New York", "San Francisco", "Berlin", "London", "Chennai", "Singapore", "Toronto", "Sydney"]
+POSITIONS = ["Manager", "Developer", "Analyst", "Intern", "Executive", "Designer", "Consultant", "Director"]
+STATUSES = ["ACTIVE", "NOT_STARTED", "TERMINATED"]
+# Rotated over the seeded orgs so responses exercise different projections.
+COLUMN_SETS = [
+    ["first_name", "last_name", "department", "position"],
+    ["first_name", "email", "phone", "location"],
+    ["first_name", "last_name", "department", "location", "position"],
+    ["first_name", "last_name", "email", "phone", "department", "position", "location", "status"],
+]
+
+def zipf_weights(orgs: int, skew: float) -> List[float]:
+    """Weight of org rank 1..orgs proportional to 1 / rank**skew; skew 0 is uniform."""
+    return [1 / rank ** skew for rank in range(1, orgs + 1)]
+
+def org_sizes(rows: int, orgs: int, skew: float) -> List[int]:
+    """Split `rows` over `orgs` with a Zipf distribution: a few huge tenants and a long tail of small ones."""
+    weights = zipf_weights(orgs, skew)
+    total = sum(weights)
+    sizes = [max(1, int(rows * w / total)) for w in weights]
+    # Rounding leftovers go to the largest tenant.
+    sizes[0] += rows - sum(sizes)
+    return sizes
+
+class OrgSampler:
+    """Picks org ids with the same skew as the seeded sizes, so big tenants get most of the traffic."""
+
+    def __init__(self, orgs: int, skew: float, first_org: int = 1, rng: random.Random = None):
+        self.org_ids = list(range(first_org, first_org + orgs))
+        self.weights = zipf_weights(orgs, skew)
+        self.rng = rng or random.Random()
+
+    def __call__(self) -> int:
+        return self.rng.choices(self.org_ids, self.weights)[0]
@@ -0,0 +1,207 @@
+"""Drive a running API with a weighted request mix and report latency percentiles and QPS.
+
+    python -m bench.run --base-url http://localhost:8000 --concurrency 32 --duration 60
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --compare bench/baseline.json   # exits 1 on regression
+
+The workload is a JSONL file, one request template per line (see
+bench/workload.jsonl). By default templates are sampled by "weight"; with
+--replay they are sent in file order, which replays a captured request log.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.data import DEPARTMENTS, FIRST_NAMES, LAST_NAMES, LOCATIONS, POSITIONS, OrgSampler
+
+logger = logging.getLogger("bench.run")
+
+DEFAULT_WORKLOAD = "bench/workload.jsonl"
+PERCENTILES = (50, 95, 99)
+
+def load_workload(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        entries = [json.loads(line) for line in f if line.strip() and not line.lstrip().startswith("#")]
+    for entry in entries:
+        entry.setdefault("name", f"{entry.get('method', 'GET')} {entry['path']}")
+        entry.setdefault("weight", 1)
+        entry.setdefault("method", "GET")
+    return entries
+
+def placeholder_values(org_id: int, rng: random.Random) -> Dict[str, Any]:
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {
+        "org": org_id,
+        "q": rng.choice([first, last, f"{first} {last}", first.lower()[:3]]),
+        "prefix": rng.choice([first, last])[:rng.randint(1, 4)],
+        "department": rng.choice(DEPARTMENTS),
+        "location": rng.choice(LOCATIONS),
+        "position": rng.choice(POSITIONS),
+    }
+
+def expand(template: Any, values: Dict[str, Any]) -> Any:
+    """Fill {placeholders} in a template. A string that is exactly one placeholder keeps the value's type."""
+    if isinstance(template, dict):
+        return {key: expand(value, values) for key, value in template.items()}
+    if isinstance(template, list):
+        return [expand(value, values) for value in template]
+    if isinstance(template, str):
+        if template.startswith("{") and template.endswith("}") and template[1:-1] in values:
+            return values[template[1:-1]]
+        return template.format(**values)
+    return template
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Counter] = defaultdict(Counter)
+        self.errors: Counter = Counter()
+
+    def record(self, name: str, status: Optional[int], seconds: float) -> None:
+        if status is None:
+            self.errors[name] += 1
+            self.statuses[name]["error"] += 1
+            return
+        self.statuses[name][str(status)] += 1
+        # 429s are the rate limiter, not the endpoint; keep them out of the latency figures.
+        if status < 400:
+            self.latencies[name].append(seconds * 1000)
+        else:
+            self.errors[name] += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        def stats(latencies: List[float], statuses: Counter, errors: int) -> Dict[str, Any]:
+            ordered = sorted(latencies)
+            result = {"requests": sum(statuses.values()), "errors": errors, "statuses": dict(statuses),
+                      "qps": round(len(ordered) / elapsed, 1) if elapsed else 0.0}
+            for pct in PERCENTILES:
+                value = percentile(ordered, pct)
+                result[f"p{pct}_ms"] = round(value, 2) if value is not None else None
+            result["max_ms"] = round(ordered[-1], 2) if ordered else None
+            return result
+
+        endpoints = {name: stats(self.latencies[name], self.statuses[name], self.errors[name])
+                     for name in sorted(self.statuses)}
+        overall = stats(list(itertools.chain.from_iterable(self.latencies.values())),
+                        sum(self.statuses.values(), Counter()), sum(self.errors.values()))
+        return {"elapsed_s": round(elapsed, 2), "overall": overall, "endpoints": endpoints}
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regressions of current against baseline: p95 slower, or QPS lower, by more than `tolerance`."""
+    regressions = []
+    sections = [("overall", current["overall"], baseline["overall"])]
+    sections += [(name, stats, baseline["endpoints"][name])
+                 for name, stats in current["endpoints"].items() if name in baseline.get("endpoints", {})]
+    for name, now, before in sections:
+        if now.get("p95_ms") is not None and before.get("p95_ms"):
+            if now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {now['p95_ms']}ms vs baseline {before['p95_ms']}ms")
+        if before.get("qps") and now["qps"] < before["qps"] * (1 - tolerance):
+            regressions.append(f"{name}: {now['qps']} QPS vs baseline {before['qps']} QPS")
+    return regressions
+
+async def run(args) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    entries = load_workload(args.workload)
+    sample_org = OrgSampler(args.orgs, args.skew, args.first_org, rng)
+    weights = [entry["weight"] for entry in entries]
+    ordered = itertools.cycle(entries)
+    recorder = Recorder()
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    deadline = measure_from + args.duration
+
+    async def worker(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            entry = next(ordered) if args.replay else rng.choices(entries, weights)[0]
+            values = placeholder_values(sample_org(), rng)
+            request = {"params": expand(entry.get("params"), values)}
+            if "json" in entry:
+                request["json"] = expand(entry["json"], values)
+            sent = time.perf_counter()
+            try:
+                response = await client.request(entry["method"], entry["path"], **request)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                logger.debug(f"{entry['name']} failed: {e}")
+                status = None
+            if sent >= measure_from:
+                recorder.record(entry["name"], status, time.perf_counter() - sent)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=args.timeout) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+    return recorder.summary(time.perf_counter() - measure_from)
+
+def print_report(report: Dict[str, Any]) -> None:
+    header = f"{'endpoint':<20} {'requests':>9} {'errors':>7} {'qps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["endpoints"].items()) + [("overall", report["overall"])]
+    for name, s in rows:
+        cells = [s[key] if s[key] is not None else "-" for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        print(f"{name:<20} {s['requests']:>9} {s['errors']:>7} {s['qps']:>8} " + " ".join(f"{c:>8}" for c in cells))
+    statuses = report["overall"]["statuses"]
+    if statuses.get("429"):
+        print(f"\n{statuses['429']} requests were rate limited; raise RATE_LIMIT_REQUESTS on the server under test.")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the Employee Search API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--workload", default=DEFAULT_WORKLOAD, help="JSONL file of request templates")
+    parser.add_argument("--replay", action="store_true", help="Send workload entries in file order instead of by weight")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent connections")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Seconds of unmeasured traffic first")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--orgs", type=int, default=200, help="Org ids to target; match bench.seed")
+    parser.add_argument("--first-org", type=int, default=1)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for picking orgs; match bench.seed")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the report as the new baseline")
+    parser.add_argument("--compare", metavar="PATH", help="Fail if the report regresses against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression, as a fraction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    logger.info(f"{args.concurrency} connections against {args.base_url} for {args.duration}s (+{args.warmup}s warmup)")
+    report = asyncio.run(run(args))
+    report["config"] = {key: getattr(args, key) for key in ("workload", "replay", "concurrency", "duration", "orgs", "skew", "seed")}
+    print_report(report)
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -28,6 +28,83 @@ CREATE TABLE IF NOT EXISTS public.org_column_config (
     visible_columns TEXT[]
 );
 
+-- Per-org data version behind the search/metadata ETags; bumped by the
+-- employees triggers below (same as migrations 0004 and 0008)
+CREATE SEQUENCE IF NOT EXISTS public.org_data_version_seq;
+CREATE TABLE IF NOT EXISTS public.org_data_version (
+    org_id INTEGER PRIMARY KEY,
+    version BIGINT NOT NULL
+);
+
+-- Statement-level triggers: every changed org gets a fresh version from one
+-- global sequence and a NOTIFY that evicts the API's per-org caches
+CREATE OR REPLACE FUNCTION public.notify_org_data_changed() RETURNS trigger AS $$
+DECLARE
+    changed_org integer;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        UPDATE org_data_version SET version = nextval('org_data_version_seq');
+        PERFORM pg_notify('org_data_changed', '*');
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        FOR changed_org IN SELECT DISTINCT org_id FROM new_rows WHERE org_id IS NOT NULL LOOP
+            INSERT INTO org_data_version (org_id, version) VALUES (changed_org, nextval('org_data_version_seq')) ON CONFLICT (org_id) DO UPDATE SET version = EXCLUDED.version;
+            PERFORM pg_notify('org_data_changed', changed_org::text);
+        END LOOP;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        FOR changed_org IN SELECT DISTINCT org_id FROM old_rows WHERE org_id IS NOT NULL LOOP
+            INSERT INTO org_data_version (org_id, version) VALUES (changed_org, nextval('org_data_version_seq')) ON CONFLICT (org_id) DO UPDATE SET version = EXCLUDED.version;
+            PERFORM pg_notify('org_data_changed', changed_org::text);
+        END LOOP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER employees_notify_insert AFTER INSERT ON public.employees
+    REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_org_data_changed();
+CREATE OR REPLACE TRIGGER employees_notify_update AFTER UPDATE ON public.employees
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_org_data_changed();
+CREATE OR REPLACE TRIGGER employees_notify_delete AFTER DELETE ON public.employees
+    REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION public.notify_org_data_changed();
+CREATE OR REPLACE TRIGGER employees_notify_truncate AFTER TRUNCATE ON public.employees
+    FOR EACH STATEMENT EXECUTE FUNCTION public.notify_org_data_changed();
+
+-- visible_columns changes evict every worker's cached org config (same as migration 0003)
+CREATE OR REPLACE FUNCTION public.notify_org_config_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('org_config_changed', '*');
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('org_config_changed', OLD.org_id::text);
+    ELSE
+        PERFORM pg_notify('org_config_changed', NEW.org_id::text);
+    END IF;
+    IF TG_OP = 'UPDATE' AND NEW.org_id <> OLD.org_id THEN
+        PERFORM pg_notify('org_config_changed', OLD.org_id::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER org_column_config_notify AFTER INSERT OR UPDATE OR DELETE ON public.org_column_config
+    FOR EACH ROW EXECUTE FUNCTION public.notify_org_config_changed();
+CREATE OR REPLACE TRIGGER org_column_config_notify_truncate AFTER TRUNCATE ON public.org_column_config
+    FOR EACH STATEMENT EXECUTE FUNCTION public.notify_org_config_changed();
+
+-- Every write path bumps updated_at, which the suggest index refreshes by (same as migration 0007)
+CREATE OR REPLACE FUNCTION public.employees_touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER employees_touch_updated_at BEFORE UPDATE ON public.employees
+    FOR EACH ROW EXECUTE FUNCTION public.employees_touch_updated_at();
+
 -- ============================================================================
 -- 2. CREATE INDEXES FOR PERFORMANCE
 -- ============================================================================
@@ -36,6 +113,8 @@ CREATE TABLE IF NOT EXISTS public.org_column_config (
 CREATE INDEX IF NOT EXISTS ix_employees_id ON public.employees USING btree (id);
 CREATE INDEX IF NOT EXISTS ix_employees_org_id ON public.employees USING btree (org_id);
 CREATE INDEX IF NOT EXISTS ix_org_column_config_org_id ON public.org_column_config USING btree (org_id);
+-- Natural key for bulk imports (app/importer.py)
+CREATE UNIQUE INDEX IF NOT EXISTS ux_employees_org_email ON public.employees USING btree (org_id, email);
 
 -- Search and filter indexes
 CREATE INDEX IF NOT EXISTS idx_employees_status ON public.employees(status);
@@ -48,6 +127,9 @@ CREATE INDEX IF NOT EXISTS idx_employees_first_name_lower ON public.employees(LO
 CREATE INDEX IF NOT EXISTS idx_employees_last_name_lower ON public.employees(LOWER(last_name));
 CREATE INDEX IF NOT EXISTS idx_employees_email_lower ON public.employees(LOWER(email));
 
+-- Incremental suggest index refreshes (rows changed since a watermark)
+CREATE INDEX IF NOT EXISTS ix_employees_org_updated_at ON public.employees (org_id, updated_at);
+
 -- ============================================================================
 -- 3. INSERT ORGANIZATION CONFIGURATION
 -- ============================================================================
@@ -0,0 +1,70 @@
+"""
+Unit tests for the benchmark harness helpers.
+Run with: pytest tests/test_bench.py -v
+"""
+
+import random
+import pytest
+from bench.data import OrgSampler, org_sizes
+from bench.run import Recorder, compare, expand, load_workload, percentile
+from bench.seed import batches
+
+pytestmark = pytest.mark.unit
+
+def test_org_sizes_are_skewed_and_sum_to_rows():
+    sizes = org_sizes(100_000, 50, 1.1)
+    assert sum(sizes) == 100_000
+    assert sizes == sorted(sizes, reverse=True)
+    assert sizes[0] > 10 * sizes[-1] >= 10
+    assert len(set(org_sizes(1000, 10, 0))) == 1
+
+def test_org_sampler_favours_large_orgs():
+    sample = OrgSampler(100, 1.1, first_org=10, rng=random.Random(1))
+    picks = [sample() for _ in range(2000)]
+    assert min(picks) >= 10 and max(picks) < 110
+    assert picks.count(10) > picks.count(60) * 5
+
+def test_batches_split_on_row_budget():
+    assert list(batches([1, 2, 3, 4], [5, 5, 5, 1], batch_rows=10)) == [([1, 2], [5, 5]), ([3, 4], [5, 1])]
+
+def test_expand_keeps_types_of_whole_placeholders():
+    values = {"org": 7, "q": "ann", "department": "HR"}
+    template = {"org_id": "{org}", "q": "{q}", "departments": ["{department}"], "note": "org {org}", "limit": 5}
+    assert expand(template, values) == {"org_id": 7, "q": "ann", "departments": ["HR"], "note": "org 7", "limit": 5}
+    assert expand(None, values) is None
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) is None
+
+def test_recorder_keeps_errors_out_of_latencies():
+    recorder = Recorder()
+    recorder.record("search", 200, 0.010)
+    recorder.record("search", 200, 0.030)
+    recorder.record("search", 429, 0.001)
+    recorder.record("search", None, 5.0)
+    summary = recorder.summary(elapsed=2.0)["endpoints"]["search"]
+    assert summary["requests"] == 4 and summary["errors"] == 2
+    assert summary["statuses"] == {"200": 2, "429": 1, "error": 1}
+    assert summary["p99_ms"] == 30.0 and summary["qps"] == 1.0
+
+def test_compare_flags_p95_and_qps_regressions():
+    baseline = {"overall": {"p95_ms": 100.0, "qps": 500.0}, "endpoints": {"search": {"p95_ms": 50.0, "qps": 300.0}}}
+    same = {"overall": {"p95_ms": 105.0, "qps": 480.0}, "endpoints": {"search": {"p95_ms": 52.0, "qps": 290.0}}}
+    assert compare(same, baseline, tolerance=0.10) == []
+
+    slower = {"overall": {"p95_ms": 105.0, "qps": 400.0}, "endpoints": {"search": {"p95_ms": 80.0, "qps": 300.0},
+                                                                       "new": {"p95_ms": 1.0, "qps": 1.0}}}
+    regressions = compare(slower, baseline, tolerance=0.10)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("overall: 400.0 QPS")
+    assert regressions[1].startswith("search: p95 80.0ms")
+
+def test_shipped_workload_loads():
+    entries = load_workload("bench/workload.jsonl")
+    assert {e["path"] for e in entries} >= {"/employees/search", "/employees/filters/metadata"}
+    assert all(e["weight"] > 0 and e["method"] in ("GET", "POST") for e in entries)
@@ -0,0 +1,98 @@
+"""
+Unit tests for the in-process caches and their invalidation paths.
+Run with: pytest tests/test_cache.py -v
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, Mock, patch
+import pytest
+from fastapi.testclient import TestClient
+from app import crud, invalidation
+from app.cache import TTLCache
+from app.main import app
+from app.routers import admin
+from app.routers.search import get_primary_db
+
+pytestmark = pytest.mark.unit
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    cache.get(1)
+    cache.set(3, "c")
+    assert cache.get(1) == "a"
+    assert cache.get(2) is None
+    assert cache.get(3) == "c"
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(maxsize=2, ttl=60)
+    with patch("app.cache.time.monotonic", return_value=1000.0):
+        cache.set("key", "value")
+    with patch("app.cache.time.monotonic", return_value=1059.0):
+        assert cache.get("key") == "value"
+    with patch("app.cache.time.monotonic", return_value=1061.0):
+        assert cache.get("key") is None
+
+def test_ttl_cache_peek_leaves_recency_and_stats():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    assert cache.peek(1) == "a" and cache.peek(3) is None
+    assert (cache.hits, cache.misses) == (0, 0)
+    cache.set(3, "c")
+    assert cache.get(1) is None
+
+def test_get_org_columns_is_cached_until_notified():
+    crud.org_columns_cache.clear()
+    db = Mock()
+    db.execute = AsyncMock(return_value=Mock(scalar_one_or_none=Mock(return_value=["first_name"])))
+
+    assert asyncio.run(crud.get_org_columns(db, 42)) == ["first_name"]
+    assert asyncio.run(crud.get_org_columns(db, 42)) == ["first_name"]
+    assert db.execute.await_count == 1
+
+    invalidation.dispatch(invalidation.ORG_CONFIG_CHANNEL, "42")
+    asyncio.run(crud.get_org_columns(db, 42))
+    assert db.execute.await_count == 2
+
+def test_get_org_version_is_cached_until_notified():
+    crud.org_version_cache.clear()
+    db = Mock()
+    db.execute = AsyncMock(return_value=Mock(scalar_one_or_none=Mock(return_value=None)))
+
+    # Orgs without a version row have never changed since the migration.
+    assert asyncio.run(crud.get_org_version(db, 42)) == 0
+    assert asyncio.run(crud.get_org_version(db, 42)) == 0
+    assert db.execute.await_count == 1
+
+    db.execute.return_value = Mock(scalar_one_or_none=Mock(return_value=5))
+    invalidation.dispatch(invalidation.ORG_DATA_CHANNEL, "42")
+    assert asyncio.run(crud.get_org_version(db, 42)) == 5
+
+def test_admin_invalidate_requires_token():
+    client = TestClient(app)
+    with patch.object(admin, "ADMIN_TOKEN", None):
+        assert client.post("/admin/cache/org-config/invalidate").status_code == 403
+    with patch.object(admin, "ADMIN_TOKEN", "secret"):
+        response = client.post("/admin/cache/org-config/invalidate", headers={"X-Admin-Token": "wrong"})
+        assert response.status_code == 403
+
+def test_admin_invalidate_notifies_workers():
+    crud.org_columns_cache.set(7, ["email"])
+    db = Mock(execute=AsyncMock(), commit=AsyncMock())
+    previous_override = app.dependency_overrides.get(get_primary_db)
+    app.dependency_overrides[get_primary_db] = lambda: db
+    try:
+        client = TestClient(app)
+        with patch.object(admin, "ADMIN_TOKEN", "secret"):
+            response = client.post("/admin/cache/org-config/invalidate?org_id=7", headers={"X-Admin-Token": "secret"})
+    finally:
+        if previous_override is not None:
+            app.dependency_overrides[get_primary_db] = previous_override
+        else:
+            app.dependency_overrides.pop(get_primary_db, None)
+
+    assert response.status_code == 200
+    assert crud.org_columns_cache.get(7) is None
+    assert db.execute.await_args.args[1] == {"channel": "org_config_changed", "payload": "7"}
@@ -0,0 +1,54 @@
+"""
+Unit tests for bulk import parsing and the merge statement.
+Run with: pytest tests/test_importer.py -v
+"""
+
+import asyncio
+import pytest
+from app.importer import _split_first_line, merge_statement, parse_header, parse_ndjson_line
+
+pytestmark = pytest.mark.unit
+
+async def chunks(*parts):
+    for part in parts:
+        yield part
+
+def test_parse_header_normalizes_and_validates_columns():
+    assert parse_header(b"\xef\xbb\xbfEmail, First_Name ,org_id", None) == ["email", "first_name", "org_id"]
+    assert parse_header(b"email,status", org_id=7) == ["email", "status"]
+    with pytest.raises(ValueError, match="Unknown columns: salary"):
+        parse_header(b"org_id,email,salary", None)
+    with pytest.raises(ValueError, match="Duplicate"):
+        parse_header(b"org_id,email,email", None)
+    with pytest.raises(ValueError, match="email column is required"):
+        parse_header(b"org_id,first_name", None)
+    with pytest.raises(ValueError, match="org_id column is required"):
+        parse_header(b"email,first_name", None)
+
+def test_parse_ndjson_line_stringifies_scalars():
+    assert parse_ndjson_line(b'{"org_id": 3, "email": "a@b.c", "phone": null}', 1) == \
+        {"org_id": "3", "email": "a@b.c", "phone": None}
+    with pytest.raises(ValueError, match="Line 4: invalid JSON"):
+        parse_ndjson_line(b'{"email": ', 4)
+    with pytest.raises(ValueError, match="expected a JSON object"):
+        parse_ndjson_line(b'["a@b.c"]', 1)
+    with pytest.raises(ValueError, match="unknown field 'salary'"):
+        parse_ndjson_line(b'{"email": "a@b.c", "salary": 1}', 1)
+    with pytest.raises(ValueError, match="status must be a string or number"):
+        parse_ndjson_line(b'{"email": "a@b.c", "status": true}', 1)
+
+def test_split_first_line_across_chunks():
+    header, rest = asyncio.run(_split_first_line(chunks(b"org_id,em", b"ail\r\n1,a@b.c\n", b"2,c@d.e\n")))
+    assert header == b"org_id,email"
+    assert rest == b"1,a@b.c\n"
+
+def test_merge_statement_updates_only_imported_columns():
+    sql = merge_statement(["org_id", "email", "first_name", "status"], "employeestatus")
+    assert 'INSERT INTO employees ("org_id", "email", "first_name", status, created_at, updated_at)' in sql
+    assert "CAST(coalesce(s.status, 'ACTIVE') AS employeestatus)" in sql
+    assert ('DO UPDATE SET "first_name" = EXCLUDED."first_name", "status" = EXCLUDED."status", '
+            "updated_at = EXCLUDED.updated_at") in sql
+    assert 'WHERE (employees."first_name", employees."status") IS DISTINCT FROM' in sql
+    assert "last_name" not in sql.split("FROM (")[0]
+
+    assert "ON CONFLICT (org_id, email) DO NOTHING" in merge_statement(["org_id", "email"], "employeestatus")
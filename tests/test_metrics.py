@@ -0,0 +1,107 @@
+"""
+Unit tests for request timing, Server-Timing headers and the Prometheus endpoint.
+Run with: pytest tests/test_metrics.py -v
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import Response
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from app import metrics, utils
+from app.cache import TTLCache
+from app.rate_limiter import RateLimiter, RateLimitMiddleware
+
+pytestmark = pytest.mark.unit
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def make_app(**middleware_kwargs):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, rate_limiter=RateLimiter(limit=2, interval_sec=60))
+    app.add_middleware(metrics.MetricsMiddleware, **middleware_kwargs)
+
+    @app.get("/things/{thing_id}")
+    async def thing(thing_id: int):
+        metrics.add_time(metrics.DB, 0.004)
+        return Response(utils.render_json(utils.render_rows([], ["first_name"])), media_type="application/json")
+
+    return app
+
+def test_server_timing_and_route_histograms():
+    client = TestClient(make_app())
+    before = sample("http_request_duration_seconds_count", route="/things/{thing_id}", method="GET")
+    db_before = sample("http_request_phase_seconds_sum", route="/things/{thing_id}", method="GET", phase="db")
+
+    response = client.get("/things/1")
+    client.get("/things/2")
+
+    timing = response.headers["Server-Timing"]
+    assert timing.startswith('db;dur=4.00;desc="0 queries", pool;dur=0.00, serialize;dur=')
+    assert "total;dur=" in timing
+    # Path parameters are folded into the route template.
+    assert sample("http_request_duration_seconds_count", route="/things/{thing_id}", method="GET") == before + 2
+    assert sample("http_request_phase_seconds_sum", route="/things/{thing_id}", method="GET", phase="db") == \
+        pytest.approx(db_before + 0.008)
+    assert sample("http_requests_total", route="/things/{thing_id}", method="GET", status="200") >= 2
+
+def test_rate_limited_and_unmatched_requests_are_counted():
+    client = TestClient(make_app(server_timing_enabled=False))
+    limited_before = sample("rate_limit_decisions_total", policy="default", decision="limited")
+    unmatched_before = sample("http_requests_total", route=metrics.UNMATCHED_ROUTE, method="GET", status="429")
+
+    responses = [client.get("/things/1", headers={"X-Forwarded-For": "9.9.9.9"}) for _ in range(3)]
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert "Server-Timing" not in responses[0].headers
+    assert sample("rate_limit_decisions_total", policy="default", decision="limited") == limited_before + 1
+    assert sample("http_requests_total", route=metrics.UNMATCHED_ROUTE, method="GET", status="429") == unmatched_before + 1
+
+def test_engine_events_time_statements_per_request():
+    metrics.install_engine_events()
+    engine = create_engine("sqlite://")
+    before = sample("db_query_duration_seconds_count")
+    timings = [0.0, 0.0, 0.0, 0.0]
+    token = metrics._timings.set(timings)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+            with pytest.raises(Exception):
+                connection.execute(text("SELECT * FROM missing_table"))
+            assert connection.info["query_started"] == []
+    finally:
+        metrics._timings.reset(token)
+    assert timings[metrics.DB_STATEMENTS] == 2 and timings[metrics.DB] > 0
+    assert sample("db_query_duration_seconds_count") == before + 2
+
+def test_engine_events_are_not_registered_until_installed():
+    metrics.uninstall_engine_events()
+    try:
+        before = sample("db_query_duration_seconds_count")
+        with create_engine("sqlite://").connect() as connection:
+            connection.execute(text("SELECT 1"))
+            assert "query_started" not in connection.info
+        assert sample("db_query_duration_seconds_count") == before
+    finally:
+        metrics.install_engine_events()
+
+def test_cache_collector_reports_hit_counters():
+    cache = TTLCache(maxsize=10, ttl=60)
+    metrics.watch_cache("test_cache", cache)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert sample("cache_hits_total", cache="test_cache") == 1
+    assert sample("cache_misses_total", cache="test_cache") == 1
+    assert sample("cache_entries", cache="test_cache") == 1
+    del metrics.cache_collector.caches["test_cache"]
+
+def test_metrics_endpoint_serves_prometheus_text():
+    from app.main import app
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert 'cache_hits_total{cache="org_columns"}' in response.text
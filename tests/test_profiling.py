@@ -0,0 +1,151 @@
+"""
+Unit tests for the slow-query profiler.
+Run with: pytest tests/test_profiling.py -v
+"""
+
+import asyncio
+import pytest
+from sqlalchemy import create_engine, text
+from app.profiling import QueryProfiler, fingerprint
+
+pytestmark = pytest.mark.unit
+
+SEARCH = ("SELECT employees.first_name FROM employees WHERE employees.org_id = $1::INTEGER "
+          "AND employees.department IN ($2::VARCHAR, $3::VARCHAR) ORDER BY employees.id LIMIT $4::INTEGER")
+
+class FakeResult:
+    def fetchall(self):
+        return [("Limit  (actual time=0.01..0.02 rows=1 loops=1)",), ("  Buffers: shared hit=3",)]
+
+class FakeConnection:
+    def __init__(self, statements):
+        self.statements = statements
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def exec_driver_sql(self, statement, parameters):
+        self.statements.append((statement, parameters))
+        return FakeResult()
+
+    async def rollback(self):
+        pass
+
+class FakeEngine:
+    def __init__(self):
+        self.statements = []
+
+    def connect(self):
+        return FakeConnection(self.statements)
+
+def test_fingerprint_collapses_parameters_literals_and_in_lists():
+    assert fingerprint(SEARCH) == ("SELECT employees.first_name FROM employees WHERE employees.org_id = ? "
+                                   "AND employees.department IN (?) ORDER BY employees.id LIMIT ?")
+    assert fingerprint(SEARCH.replace("$2::VARCHAR, $3::VARCHAR", "$2::VARCHAR")) == fingerprint(SEARCH)
+    assert fingerprint("SELECT 1 FROM t WHERE name = 'o''brien'\n  AND id IN (1, 2, 3)") == \
+        "SELECT ? FROM t WHERE name = ? AND id IN (?)"
+    assert fingerprint("SELECT * FROM t WHERE a = %(a_1)s") == "SELECT * FROM t WHERE a = ?"
+    assert fingerprint("SELECT * FROM t WHERE a > $1::TIMESTAMP WITHOUT TIME ZONE AND b = $2::VARCHAR[]") == \
+        "SELECT * FROM t WHERE a > ? AND b = ?"
+
+def test_record_aggregates_by_fingerprint_and_ranks():
+    profiler = QueryProfiler(slow_ms=1000, explain=False)
+    profiler.record(SEARCH, (1, "HR", "IT", 50), 5.0, 10)
+    profiler.record(SEARCH.replace("$2::VARCHAR, $3::VARCHAR", "$2::VARCHAR"), (2, "HR", 50), 15.0, 3)
+    profiler.record("SELECT count(*) FROM employees", (), 1.0, 1)
+    profiler.record("SELECT count(*) FROM employees", (), 1.0, 1)
+    profiler.record("SELECT count(*) FROM employees", (), 1.0, 1)
+
+    search, count = profiler.top()
+    assert search["calls"] == 2 and search["total_ms"] == 20.0 and search["mean_ms"] == 10.0
+    assert search["max_ms"] == 15.0 and search["rows"] == 13
+    assert search["slowest_parameters"] == "(2, 'HR', 50)"
+    assert search["slow_calls"] == 0 and search["plan"] is None
+    assert [q["calls"] for q in profiler.top(order_by="calls")] == [3, 2]
+    assert len(profiler.top(limit=1)) == 1
+
+    profiler.reset()
+    assert profiler.top() == []
+
+def test_cheapest_fingerprint_evicted_when_full():
+    profiler = QueryProfiler(slow_ms=1000, explain=False, max_statements=2)
+    profiler.record("SELECT a FROM t", (), 5.0, 1)
+    profiler.record("SELECT b FROM t", (), 1.0, 1)
+    profiler.record("SELECT c FROM t", (), 3.0, 1)
+    assert [q["fingerprint"] for q in profiler.top()] == ["SELECT a FROM t", "SELECT c FROM t"]
+
+def test_slow_selects_are_explained_once_per_interval():
+    engine = FakeEngine()
+    profiler = QueryProfiler(slow_ms=10, explain_interval=300, explain_engine=engine)
+
+    async def run():
+        profiler.record(SEARCH, (1, "HR", "IT", 50), 50.0, 10, explainable=True)
+        await profiler._explaining
+        profiler.record(SEARCH, (1, "HR", "IT", 50), 60.0, 10, explainable=True)
+        profiler.record("UPDATE employees SET first_name = $1::VARCHAR", ("x",), 50.0, 1)
+        profiler.record(SEARCH, (1, "HR", "IT", 50), 1.0, 10, explainable=True)
+
+    asyncio.run(run())
+    assert engine.statements == [("EXPLAIN (ANALYZE, BUFFERS) " + SEARCH, (1, "HR", "IT", 50))]
+    search = next(q for q in profiler.top() if q["fingerprint"].startswith("SELECT"))
+    assert search["slow_calls"] == 2 and search["calls"] == 3
+    assert search["plan"].startswith("Limit")
+
+def test_only_statements_marked_explainable_are_explained():
+    from app.profiling import EXPLAIN_OPTION
+    engine = create_engine("sqlite://")
+    explain_engine = FakeEngine()
+    profiler = QueryProfiler(slow_ms=0, explain_interval=0, explain_engine=explain_engine)
+    profiler.install()
+
+    async def run():
+        with engine.connect() as connection:
+            # Unmarked, like `SELECT pg_notify(...)`, so never run a second time.
+            connection.execute(text("SELECT 1"))
+            assert profiler._explaining is None
+            connection.execute(text("SELECT 2").execution_options(**{EXPLAIN_OPTION: True}))
+            await profiler._explaining
+
+    try:
+        asyncio.run(run())
+    finally:
+        profiler.uninstall()
+    assert explain_engine.statements == [("EXPLAIN (ANALYZE, BUFFERS) SELECT 2", ())]
+
+def test_installed_profiler_sees_engine_statements():
+    engine = create_engine("sqlite://")
+    profiler = QueryProfiler(slow_ms=1000)
+    profiler.install()
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+            connection.execute(text("SELECT 2"))
+            with pytest.raises(Exception):
+                connection.execute(text("SELECT * FROM missing_table"))
+            assert connection.info["profile_started"] == []
+    finally:
+        profiler.uninstall()
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 3"))
+    assert profiler.top()[0]["calls"] == 2
+
+def test_admin_queries_endpoint():
+    from unittest.mock import patch
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.routers import admin
+
+    profiler = QueryProfiler(slow_ms=1000, explain=False)
+    profiler.record(SEARCH, (1, "HR", "IT", 50), 5.0, 10)
+    client = TestClient(app)
+    with patch.object(admin, "ADMIN_TOKEN", "secret"), patch.object(admin, "profiler", profiler):
+        assert client.get("/admin/queries").status_code == 403
+        response = client.get("/admin/queries?order_by=mean_ms&limit=5", headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert response.json()["queries"][0]["calls"] == 1
+        assert client.get("/admin/queries?order_by=bogus", headers={"X-Admin-Token": "secret"}).status_code == 422
+        assert client.post("/admin/queries/reset", headers={"X-Admin-Token": "secret"}).json() == {"reset": True}
+    assert profiler.top() == []
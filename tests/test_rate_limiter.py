@@ -0,0 +1,326 @@
+"""
+Unit tests for the rate limiter backends.
+The Redis backend runs against fakeredis (with Lua support) when installed.
+Run with: pytest tests/test_rate_limiter.py -v
+"""
+
+import asyncio
+import pytest
+from app.rate_limiter import (GCRARateLimiter, RateLimiter, RateLimitPolicy, RedisRateLimiter,
+                              create_rate_limiter, load_policies)
+
+pytestmark = pytest.mark.unit
+
+def run(coro):
+    return asyncio.run(coro)
+
+def test_memory_backend_hit():
+    limiter = RateLimiter(limit=2, interval_sec=60)
+    decisions = [run(limiter.hit("10.0.0.1")) for _ in range(3)]
+    assert [d.allowed for d in decisions] == [True, True, False]
+    assert [d.remaining for d in decisions] == [1, 0, 0]
+    assert 59 < decisions[2].retry_after <= 60
+    assert run(limiter.hit("10.0.0.2")).allowed
+
+def test_create_rate_limiter_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        create_rate_limiter("memcached")
+
+@pytest.fixture
+def fake_redis():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return fakeredis.FakeAsyncRedis()
+
+def test_redis_backend_shares_budget_between_replicas(fake_redis):
+    async def scenario():
+        replica_a = RedisRateLimiter(fake_redis, limit=3, interval_sec=60)
+        replica_b = RedisRateLimiter(fake_redis, limit=3, interval_sec=60)
+        results = [await replica_a.hit("10.0.0.1"), await replica_b.hit("10.0.0.1"),
+                   await replica_a.hit("10.0.0.1"), await replica_b.hit("10.0.0.1")]
+        other_client = await replica_b.hit("10.0.0.2")
+        return results, other_client
+
+    results, other_client = run(scenario())
+    assert [d.allowed for d in results] == [True, True, True, False]
+    assert [d.remaining for d in results[:3]] == [2, 1, 0]
+    assert 19 < results[3].retry_after <= 20
+    assert other_client.allowed
+
+@pytest.mark.parametrize("limit, interval_sec", [(7, 60), (3, 10)])
+def test_redis_backend_handles_fractional_emission_interval(fake_redis, limit, interval_sec):
+    async def scenario():
+        limiter = RedisRateLimiter(fake_redis, limit=limit, interval_sec=interval_sec)
+        results = [await limiter.hit("10.0.0.1") for _ in range(limit + 1)]
+        return results, await fake_redis.get("ratelimit:10.0.0.1"), await fake_redis.pttl("ratelimit:10.0.0.1")
+
+    results, tat, ttl = run(scenario())
+    assert [d.allowed for d in results] == [True] * limit + [False]
+    assert tat.isdigit()
+    assert 0 < ttl <= interval_sec * 1000
+
+def test_redis_backend_fails_open_when_unreachable():
+    class BrokenScript:
+        async def __call__(self, keys, args):
+            raise ConnectionError("redis down")
+
+    class BrokenClient:
+        def register_script(self, script):
+            return BrokenScript()
+
+    assert run(RedisRateLimiter(BrokenClient(), limit=1, interval_sec=60).hit("ip")).allowed
+    assert not run(RedisRateLimiter(BrokenClient(), limit=1, interval_sec=60, fail_open=False).hit("ip")).allowed
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def test_gcra_allows_burst_then_refills(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("app.rate_limiter.time.monotonic", clock)
+    limiter = GCRARateLimiter(limit=3, interval_sec=30)
+
+    assert [limiter.is_allowed("ip") for _ in range(4)] == [True, True, True, False]
+    clock.now += 10  # one emission interval
+    assert limiter.is_allowed("ip")
+    assert not limiter.is_allowed("ip")
+
+def test_gcra_timing_wheel_drops_idle_keys(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("app.rate_limiter.time.monotonic", clock)
+    limiter = GCRARateLimiter(limit=5, interval_sec=60)
+
+    for i in range(1000):
+        limiter.is_allowed(f"10.0.{i // 256}.{i % 256}")
+    assert len(limiter.tat) == 1000
+
+    clock.now += 5  # each key's TAT is one emission interval (12s) ahead
+    limiter.is_allowed("active")
+    assert len(limiter.tat) == 1001
+
+    clock.now += 8
+    limiter.is_allowed("active")
+    assert set(limiter.tat) == {"active"}
+
+def test_gcra_keeps_rescheduled_keys(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr("app.rate_limiter.time.monotonic", clock)
+    limiter = GCRARateLimiter(limit=2, interval_sec=10)
+
+    limiter.is_allowed("ip")  # scheduled for its first deadline, t=1005
+    clock.now += 4
+    limiter.is_allowed("ip")  # deadline moves to t=1010
+    clock.now += 3  # past the scheduled slot, before the current deadline
+    limiter.is_allowed("other")
+    assert "ip" in limiter.tat
+    assert limiter.is_allowed("ip")
+    assert not limiter.is_allowed("ip")
+
+def test_create_rate_limiter_selects_gcra():
+    assert isinstance(create_rate_limiter("memory", "gcra"), GCRARateLimiter)
+    assert isinstance(create_rate_limiter("memory", "sliding_log"), RateLimiter)
+    with pytest.raises(ValueError):
+        create_rate_limiter("memory", "leaky")
+
+def make_app(limiter):
+    from fastapi import FastAPI
+    from fastapi.responses import StreamingResponse
+    from app.rate_limiter import RateLimitMiddleware
+
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, rate_limiter=limiter)
+
+    @app.get("/items")
+    async def items():
+        return {"ok": True}
+
+    @app.get("/stream")
+    async def stream():
+        return StreamingResponse(iter([b"a\n", b"b\n"]), media_type="application/x-ndjson")
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    return app
+
+def test_middleware_adds_headers_and_short_circuits():
+    from fastapi.testclient import TestClient
+    client = TestClient(make_app(RateLimiter(limit=2, interval_sec=60)))
+
+    first = client.get("/items", headers={"X-Forwarded-For": "1.2.3.4, 10.0.0.1"})
+    assert first.status_code == 200
+    assert first.headers["X-RateLimit-Limit"] == "2"
+    assert first.headers["X-RateLimit-Remaining"] == "1"
+    assert first.headers["X-RateLimit-Reset"] == "60"
+
+    streamed = client.get("/stream", headers={"X-Forwarded-For": "1.2.3.4"})
+    assert streamed.text == "a\nb\n"
+    assert streamed.headers["X-RateLimit-Remaining"] == "0"
+
+    blocked = client.get("/items", headers={"X-Forwarded-For": "1.2.3.4"})
+    assert blocked.status_code == 429
+    assert blocked.json()["error"] == "Rate limit exceeded"
+    assert blocked.headers["Retry-After"] == "60"
+
+    assert client.get("/items", headers={"X-Real-IP": "5.6.7.8"}).status_code == 200
+    for _ in range(5):
+        assert client.get("/health", headers={"X-Forwarded-For": "1.2.3.4"}).status_code == 200
+
+def test_sliding_log_charges_cost():
+    limiter = RateLimiter(limit=5, interval_sec=60)
+    assert limiter.check("ip", cost=4).remaining == 1
+    assert not limiter.check("ip", cost=2).allowed
+    assert limiter.check("ip", cost=1).allowed
+
+def test_load_policies_and_costs():
+    policies = load_policies(
+        '[{"name": "metadata", "path": "/employees/filters", "limit": 100},'
+        ' {"name": "employees", "path": "/employees", "key_by": ["api_key", "org", "ip"], "limit": 20,'
+        '  "window": 60, "query_cost": 4, "rows_per_token": 50}]'
+    )
+    assert [p.name for p in policies] == ["metadata", "employees"]
+    employees = policies[1]
+    assert employees.matches("/employees/search") and not employees.matches("/employeesearch")
+    assert employees.cost({}) == 1
+    assert employees.cost({"q": ["alice"]}) == 5
+    assert employees.cost({"q": ["alice"], "limit": ["100"]}) == 6
+    assert employees.cost({"q": [" "], "limit": ["20"]}) == 1
+
+def test_middleware_policies_key_by_org_and_weight_cost():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.rate_limiter import RateLimitMiddleware
+
+    app = FastAPI()
+    search_policy = RateLimitPolicy("search", RateLimiter(limit=6, interval_sec=60), 60, path="/employees/search",
+                                    key_by=("api_key", "org", "ip"), query_cost=4)
+    metadata_policy = RateLimitPolicy("metadata", RateLimiter(limit=100, interval_sec=60), 60,
+                                      path="/employees/filters/metadata")
+    app.add_middleware(RateLimitMiddleware, rate_limiter=RateLimiter(limit=1, interval_sec=60),
+                       policies=[metadata_policy, search_policy], api_keys=["k1"], known_org=lambda org_id: org_id in (1, 2))
+
+    @app.get("/employees/search")
+    async def search():
+        return []
+
+    @app.get("/employees/filters/metadata")
+    async def metadata():
+        return {}
+
+    client = TestClient(app)
+    # Two clients behind different IPs share org 1's budget; a q= search costs 5 tokens.
+    assert client.get("/employees/search?org_id=1&q=al", headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 200
+    assert client.get("/employees/search?org_id=1", headers={"X-Forwarded-For": "2.2.2.2"}).status_code == 200
+    blocked = client.get("/employees/search?org_id=1", headers={"X-Forwarded-For": "3.3.3.3"})
+    assert blocked.status_code == 429
+    assert blocked.json()["detail"] == "Rate limit: 6 requests per 60 seconds"
+
+    # Other orgs, API keys and cheap metadata calls are unaffected.
+    assert client.get("/employees/search?org_id=2").status_code == 200
+    assert client.get("/employees/search?org_id=1", headers={"X-API-Key": "k1"}).status_code == 200
+    for _ in range(10):
+        assert client.get("/employees/filters/metadata?org_id=1", headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 200
+
+def test_middleware_ignores_unknown_api_keys():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.rate_limiter import RateLimitMiddleware
+
+    app = FastAPI()
+    policy = RateLimitPolicy("search", RateLimiter(limit=1, interval_sec=60), 60, path="/employees/search",
+                             key_by=("api_key", "org", "ip"))
+    app.add_middleware(RateLimitMiddleware, rate_limiter=RateLimiter(limit=1, interval_sec=60),
+                       policies=[policy], api_keys=["k1"])
+
+    @app.get("/employees/search")
+    async def search():
+        return []
+
+    client = TestClient(app)
+    headers = {"X-Forwarded-For": "1.1.1.1"}
+    # Made-up keys do not mint new budgets: the request is charged to the client IP instead.
+    assert client.get("/employees/search?org_id=1", headers={**headers, "X-API-Key": "a"}).status_code == 200
+    assert client.get("/employees/search?org_id=2", headers={**headers, "X-API-Key": "b"}).status_code == 429
+    assert client.get("/employees/search", headers={**headers, "X-API-Key": "k1"}).status_code == 200
+
+@pytest.mark.parametrize("backend", [RateLimiter, GCRARateLimiter])
+def test_memory_backends_bound_tracked_keys(backend):
+    limiter = backend(limit=1, interval_sec=60, max_keys=3)
+    for i in range(10):
+        assert run(limiter.hit(f"10.0.0.{i}")).allowed
+    tracked = limiter.access_times if backend is RateLimiter else limiter.tat
+    assert list(tracked) == ["10.0.0.7", "10.0.0.8", "10.0.0.9"]
+    assert not run(limiter.hit("10.0.0.9")).allowed
+
+def test_batch_is_charged_per_search():
+    from fastapi import FastAPI, Request
+    from fastapi.testclient import TestClient
+    from app.rate_limiter import RateLimitMiddleware, charge_searches
+
+    app = FastAPI()
+    policy = RateLimitPolicy("search", RateLimiter(limit=12, interval_sec=60), 60, path="/employees/search",
+                             query_cost=4)
+    app.add_middleware(RateLimitMiddleware, rate_limiter=RateLimiter(limit=1, interval_sec=60), policies=[policy])
+
+    @app.post("/employees/search/batch")
+    async def batch(request: Request):
+        searches = [(search.get("search_query"), search.get("limit")) for search in await request.json()]
+        return await charge_searches(request.scope, searches) or []
+
+    client = TestClient(app)
+    # 1 + 5 + 1 tokens: the middleware's flat token counts towards the first search.
+    response = client.post("/employees/search/batch", json=[{}, {"search_query": "al"}, {}])
+    assert response.status_code == 200
+    assert response.headers["x-ratelimit-remaining"] == "5"
+    blocked = client.post("/employees/search/batch", json=[{"search_query": "al"}, {"search_query": "bo"}])
+    assert blocked.status_code == 429
+    assert blocked.json()["detail"] == "Rate limit: 12 requests per 60 seconds"
+    assert int(blocked.headers["retry-after"]) >= 1
+    assert client.post("/employees/search/batch", json=[{}]).status_code == 200
+    # A batch costing more than the whole budget can never be served: 422, not a 429 to retry.
+    too_big = client.post("/employees/search/batch", json=[{}] * 13, headers={"X-Forwarded-For": "9.9.9.9"})
+    assert too_big.status_code == 422
+    assert "retry-after" not in too_big.headers
+    assert too_big.json()["detail"] == "Request costs 13 rate limit tokens but the limit is 12 per 60 seconds"
+
+    # A single GET over the budget is refused the same way instead of being let through.
+    @app.get("/employees/search")
+    async def search():
+        return []
+
+    assert client.get("/employees/search?q=a&limit=20", headers={"X-Forwarded-For": "7.7.7.7"}).status_code == 200
+    policy.rows_per_token = 1
+    response = client.get("/employees/search?q=a&limit=20", headers={"X-Forwarded-For": "8.8.8.8"})
+    assert response.status_code == 422 and "retry-after" not in response.headers
+
+def test_middleware_keys_only_known_orgs_by_org():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from app.rate_limiter import RateLimitMiddleware
+
+    app = FastAPI()
+    policy = RateLimitPolicy("search", RateLimiter(limit=2, interval_sec=60), 60, path="/employees/search",
+                             key_by=("org", "ip"))
+    app.add_middleware(RateLimitMiddleware, rate_limiter=RateLimiter(limit=1, interval_sec=60), policies=[policy],
+                       known_org=lambda org_id: org_id in (1, 2, 3), max_org_keys=2)
+
+    @app.get("/employees/search")
+    async def search():
+        return []
+
+    client = TestClient(app)
+    # "01" and "1" are one org and share its budget, whatever the client IP.
+    assert client.get("/employees/search?org_id=01", headers={"X-Forwarded-For": "1.1.1.1"}).status_code == 200
+    assert client.get("/employees/search?org_id=1", headers={"X-Forwarded-For": "2.2.2.2"}).status_code == 200
+    assert client.get("/employees/search?org_id=001", headers={"X-Forwarded-For": "3.3.3.3"}).status_code == 429
+    # Rotating made-up org ids is charged to the client IP.
+    headers = {"X-Forwarded-For": "4.4.4.4"}
+    assert [client.get(f"/employees/search?org_id={org_id}", headers=headers).status_code
+            for org_id in (100, 101, 102)] == [200, 200, 429]
+    # Past max_org_keys, further real orgs are keyed by IP too.
+    assert client.get("/employees/search?org_id=2", headers={"X-Forwarded-For": "5.5.5.5"}).status_code == 200
+    assert client.get("/employees/search?org_id=3", headers=headers).status_code == 429
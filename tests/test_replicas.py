@@ -0,0 +1,149 @@
+"""
+Unit tests for read-replica routing.
+Run with: pytest tests/test_replicas.py -v
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+import pytest
+from sqlalchemy import exc
+from app.replicas import Replica, ReplicaRouter
+
+pytestmark = pytest.mark.unit
+
+def make_replica(name, lag=0.0, healthy=True):
+    engine = MagicMock()
+    connection = AsyncMock()
+    connection.scalar.return_value = lag
+    engine.connect.return_value.__aenter__.return_value = connection
+    replica = Replica(f"postgresql://reader@{name}/assessment", engine=engine)
+    replica.sessionmaker = MagicMock(return_value=AsyncMock(__aenter__=AsyncMock(return_value=name)))
+    replica.healthy = healthy
+    return replica
+
+def make_router(replicas, **kwargs):
+    primary = MagicMock(return_value=AsyncMock(__aenter__=AsyncMock(return_value="primary")))
+    return ReplicaRouter(replicas, primary=primary, **kwargs)
+
+async def session_name(router):
+    async with router.session() as db:
+        return db
+
+def test_round_robin_cycles_over_healthy_replicas():
+    a, b, c = make_replica("a"), make_replica("b", healthy=False), make_replica("c")
+    router = make_router([a, b, c])
+    assert [router.pick() for _ in range(4)] == [a, c, a, c]
+
+def test_least_connections_prefers_idle_replica():
+    a, b = make_replica("a"), make_replica("b")
+    a.in_use = 3
+    router = make_router([a, b], strategy="least_connections")
+    assert router.pick() is b
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        make_router([], strategy="random")
+
+def test_falls_back_to_primary_without_healthy_replicas():
+    router = make_router([make_replica("a", healthy=False)])
+    assert asyncio.run(session_name(router)) == "primary"
+    assert asyncio.run(session_name(make_router([]))) == "primary"
+
+def test_session_uses_replica_and_tracks_in_use():
+    replica = make_replica("a")
+    router = make_router([replica])
+
+    async def check():
+        async with router.session() as db:
+            assert db == "a"
+            assert replica.in_use == 1
+        assert replica.in_use == 0
+
+    asyncio.run(check())
+
+def test_disconnect_marks_replica_down():
+    replica = make_replica("a")
+    router = make_router([replica])
+    disconnect = exc.DBAPIError("SELECT 1", {}, OSError("connection reset"), connection_invalidated=True)
+
+    async def fail():
+        async with router.session():
+            raise disconnect
+
+    with pytest.raises(exc.DBAPIError):
+        asyncio.run(fail())
+    assert not replica.healthy
+    assert replica.in_use == 0
+
+def test_query_errors_keep_replica_healthy():
+    replica = make_replica("a")
+    router = make_router([replica])
+
+    async def fail():
+        async with router.session():
+            raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        asyncio.run(fail())
+    assert replica.healthy
+
+def test_check_enforces_staleness_bound():
+    fresh, stale = make_replica("a", lag=2.0, healthy=False), make_replica("b", lag=30.0)
+    router = make_router([fresh, stale], max_lag=10)
+    asyncio.run(router.check(fresh))
+    asyncio.run(router.check(stale))
+    assert fresh.healthy and fresh.lag == 2.0
+    assert not stale.healthy
+
+def test_check_without_staleness_bound():
+    replica = make_replica("a", lag=3600.0, healthy=False)
+    asyncio.run(make_router([replica], max_lag=0).check(replica))
+    assert replica.healthy
+
+def test_check_marks_replica_without_wal_receiver_down():
+    # LAG_QUERY returns NULL when the replica has stopped receiving WAL, even
+    # though its received and replayed positions still match.
+    replica = make_replica("a", lag=None)
+    asyncio.run(make_router([replica], max_lag=0).check(replica))
+    assert not replica.healthy and replica.lag is None
+
+def test_check_marks_unreachable_replica_down():
+    replica = make_replica("a")
+    replica.engine.connect.return_value.__aenter__.side_effect = OSError("connection refused")
+    asyncio.run(make_router([replica]).check(replica))
+    assert not replica.healthy
+
+def test_max_staleness():
+    assert make_router([], max_lag=10, interval=5).max_staleness == 15
+    assert make_router([], max_lag=0).max_staleness == float("inf")
+
+def test_replica_reads_after_a_change_are_not_cached(monkeypatch):
+    from app import crud, invalidation
+
+    replica = make_replica("a")
+    router = make_router([replica], max_lag=10, interval=5)
+    monkeypatch.setattr(crud, "replica_router", router)
+    crud.org_data_changed_at.clear()
+    crud.org_version_cache.clear()
+
+    def session(version):
+        db = MagicMock(bind=replica.engine)
+        db.execute = AsyncMock(return_value=MagicMock(scalar_one_or_none=MagicMock(return_value=version)))
+        return db
+
+    crud._change_recorder(crud.org_data_changed_at)("7")
+    # Served with the replica's own version, but the next request asks again.
+    assert asyncio.run(crud.get_org_version(session(3), 7)) == 3
+    assert crud.org_version_cache.get(7) is None
+    # The primary, other orgs and replicas past the staleness window are cached as before.
+    primary = session(4)
+    primary.bind = MagicMock()
+    assert crud.cacheable_read(primary, 7)
+    assert crud.cacheable_read(session(3), 8)
+    crud.org_data_changed_at["7"] -= 16
+    assert asyncio.run(crud.get_org_version(session(4), 7)) == 4
+    assert crud.org_version_cache.get(7) == 4
+    crud._change_recorder(crud.org_data_changed_at)(invalidation.ALL_ORGS)
+    assert not crud.cacheable_read(session(4), 8)
+    crud.org_data_changed_at.clear()
+    crud.org_version_cache.clear()
@@ -0,0 +1,120 @@
+"""
+Unit tests for the search result cache.
+Run with: pytest tests/test_result_cache.py -v
+"""
+
+import asyncio
+from collections import namedtuple
+from unittest.mock import AsyncMock
+import pytest
+from app.result_cache import ResultCache, SearchResult, decode_search, encode_search, search_key
+from app.schemas import EmployeeStatus
+
+pytestmark = pytest.mark.unit
+
+Row = namedtuple("Row", ["first_name", "id", "sort_key"])
+
+def make_key(**overrides):
+    args = dict(org_id=1, version=3, columns=["first_name"], q=None, status=None, locations=None,
+                departments=None, positions=None, offset=0, limit=50, after=None, include_total=False)
+    args.update(overrides)
+    return search_key(**args)
+
+def test_search_key_normalizes_request():
+    assert make_key(departments=["IT", "HR", "IT"]) == make_key(departments=["HR", "IT"])
+    assert make_key(status=[EmployeeStatus.ACTIVE]) == make_key(status=["ACTIVE"])
+    assert make_key(q="Ann Smith") == make_key(q="ann smith")
+    assert make_key(q="") == make_key()
+    assert make_key(departments=[]) == make_key()
+
+def test_search_key_keeps_values_the_query_binds():
+    # q=" " is a LIKE '% %' search and " NY" matches nothing; neither may share the plain listing's entry.
+    assert make_key(q=" ") != make_key()
+    assert make_key(q="ann  smith") != make_key(q="ann smith")
+    assert make_key(locations=[" NY"]) != make_key(locations=["NY"])
+    assert make_key(departments=[""]) != make_key()
+    assert make_key(version=4) != make_key()
+    assert make_key(offset=50) != make_key()
+    assert make_key().startswith("search:1:3:")
+
+def test_search_result_round_trip():
+    result = SearchResult([Row("Ann", 1, "smith")], 1, True)
+    decoded = decode_search(encode_search(result))
+    assert decoded.rows[0].first_name == "Ann" and decoded.rows[0].sort_key == "smith"
+    assert decoded.total == 1 and decoded.total_exact is True
+    assert decode_search(encode_search(SearchResult([], None, True))).rows == []
+
+def test_concurrent_misses_run_one_load():
+    cache = ResultCache(maxsize=10, ttl=60)
+    calls = 0
+
+    async def load():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return SearchResult([Row("Ann", 1, "smith")], None, True)
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_load("k", load) for _ in range(20)))
+        assert all(r is results[0] for r in results)
+        await cache.get_or_load("k", load)
+
+    asyncio.run(run())
+    assert calls == 1
+
+def test_failed_load_reaches_every_waiter_and_is_not_cached():
+    cache = ResultCache(maxsize=10, ttl=60)
+
+    async def load():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("db down")
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_load("k", load) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    asyncio.run(run())
+    assert cache.local.get("k") is None
+
+def test_waiter_retries_when_leader_is_cancelled():
+    cache = ResultCache(maxsize=10, ttl=60)
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def fast():
+        return SearchResult([], 0, True)
+
+    async def run():
+        leader = asyncio.create_task(cache.get_or_load("k", slow))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_load("k", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert (await waiter).total == 0
+
+    asyncio.run(run())
+
+def test_redis_tier_shared_between_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeAsyncRedis()
+    worker_a, worker_b = ResultCache(10, 60, redis_client=client), ResultCache(10, 60, redis_client=client)
+    load = AsyncMock(return_value=SearchResult([Row("Ann", 1, "smith")], 1, True))
+
+    async def run():
+        await worker_a.get_or_load("k", load)
+        result = await worker_b.get_or_load("k", load)
+        assert result.rows[0].first_name == "Ann"
+        assert 0 < await client.pttl("k") <= 60000
+
+    asyncio.run(run())
+    assert load.await_count == 1
+
+def test_redis_errors_fall_back_to_loading():
+    broken = AsyncMock()
+    broken.get.side_effect = ConnectionError("redis down")
+    broken.set.side_effect = ConnectionError("redis down")
+    cache = ResultCache(10, 60, redis_client=broken)
+    load = AsyncMock(return_value=SearchResult([], 0, True))
+    assert asyncio.run(cache.get_or_load("k", load)).total == 0
+    assert load.await_count == 1
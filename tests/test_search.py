@@ -6,8 +6,10 @@ Run with: pytest tests/test_search.py -v
 
 from fastapi.testclient import TestClient
 from unittest.mock import Mock, patch
+import json
 from app.main import app
 from app.routers.search import get_db
+from app.result_cache import search_cache
 import pytest
 
 # Mark all tests in this file as unit tests
@@ -26,6 +28,13 @@ app.user_middleware = [m for m in app.user_middleware if not isinstance(m.cls, t
 
 client = TestClient(app)
 
+@pytest.fixture(autouse=True)
+def org_version():
+    # Mocked crud calls would otherwise be answered from the result cache.
+    search_cache.local.clear()
+    with patch('app.crud.get_org_version', return_value=1) as mock_get_org_version:
+        yield mock_get_org_version
+
 mock_employees = [
     {
         "first_name": "Alice",
@@ -58,6 +67,31 @@ mock_filter_metadata = {
     "positions": ["Manager", "Dev", "Analyst", "Intern", "Executive"]
 }
 
+def test_search_statement_is_reused_across_filter_values():
+    import asyncio
+    from unittest.mock import AsyncMock
+    from sqlalchemy.dialects import postgresql
+    from app import crud
+
+    db = Mock()
+    db.execute = AsyncMock()
+    columns = ["first_name", "department"]
+    asyncio.run(crud.search_employees(db, 1, "ann", 0, 20, None, None, ["HR"], None, columns=columns))
+    asyncio.run(crud.search_employees(db, 2, "bob", 40, 50, None, None, ["HR", "IT", "Sales"], None, columns=columns))
+    (first, first_params), (second, second_params) = [call.args for call in db.execute.await_args_list]
+
+    assert first is second
+    assert first_params == {"departments": ["HR"], "pattern": "%ann%", "org_id": 1, "limit": 20, "offset": 0}
+    assert second_params["departments"] == ["HR", "IT", "Sales"] and second_params["org_id"] == 2
+    sql = str(first.compile(dialect=postgresql.dialect()))
+    assert "employees.department = ANY (%(departments)s::VARCHAR[])" in sql
+    assert " IN " not in sql
+
+    asyncio.run(crud.search_employees(db, 1, None, 0, 20, None, None, None, None, after=("smith", 7), columns=columns))
+    keyset, params = db.execute.await_args.args
+    assert keyset is not first
+    assert params == {"org_id": 1, "limit": 20, "after_key": "smith", "after_id": 7}
+
 @patch('app.crud.get_org_columns')
 @patch('app.crud.search_employees')
 def test_search_employees(mock_search_employees, mock_get_org_columns):
@@ -88,6 +122,45 @@ def test_search_filters_metadata(mock_get_filter_metadata):
 
     mock_get_filter_metadata.assert_called_once()
 
+def test_get_filter_metadata_single_grouped_query():
+    import asyncio
+    from unittest.mock import AsyncMock
+    from sqlalchemy.dialects import postgresql
+    from app import crud
+    from app.models import EmployeeStatus as ModelStatus
+
+    def row(grouping, count, status=None, location=None, department=None, position=None):
+        return Mock(grouping=grouping, count=count,
+                    __getitem__=lambda self, i: (status, location, department, position)[i])
+
+    crud.filter_metadata_cache.clear()
+    db = Mock()
+    db.execute = AsyncMock(return_value=[
+        row(0b0111, 2, status=ModelStatus.ACTIVE),
+        row(0b0111, 1, status=ModelStatus.TERMINATED),
+        row(0b1011, 3, location="NY"),
+        row(0b1101, 2, department="HR"),
+        row(0b1101, 1, department=None),
+        row(0b1110, 3, position="Dev"),
+        row(0b1111, 3),
+    ])
+
+    metadata = asyncio.run(crud.get_filter_metadata(db, 1))
+    assert metadata["statuses"] == ["ACTIVE", "TERMINATED"]
+    assert metadata["departments"] == ["HR"]
+    assert metadata["counts"]["statuses"] == {"ACTIVE": 2, "TERMINATED": 1}
+    assert metadata["total"] == 3
+
+    sql = str(db.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+    assert "GROUPING SETS" in sql.upper()
+
+    # Served from the per-org cache until an employees NOTIFY arrives.
+    asyncio.run(crud.get_filter_metadata(db, 1))
+    assert db.execute.await_count == 1
+    crud.invalidate_filter_metadata("1")
+    asyncio.run(crud.get_filter_metadata(db, 1))
+    assert db.execute.await_count == 2
+
 @patch('app.crud.get_org_columns')
 @patch('app.crud.search_employees')
 def test_search_with_query(mock_search_employees, mock_get_org_columns):
@@ -136,3 +209,320 @@ def test_search_employees_org_not_found(mock_get_org_columns):
     response = client.get("/employees/search?org_id=999")
     assert response.status_code == 404
     assert "Organization config not found" in response.json()["detail"]
+
+def test_search_projects_only_visible_columns():
+    from sqlalchemy.dialects import postgresql
+    from app import crud
+
+    query = crud.select(*crud._projection(["first_name", "department", "not_a_column", "first_name"]))
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    assert "employees.first_name" in sql and "employees.department" in sql
+    assert "avatar_url" not in sql and "created_at" not in sql
+    assert [c.name for c in query.selected_columns] == ["first_name", "department", "id", "sort_key"]
+
+def test_normalize_phone():
+    from app.crud import normalize_phone
+    assert normalize_phone("+1-555-0101") == "15550101"
+    assert normalize_phone("alice") == ""
+    assert normalize_phone(None) == ""
+
+def test_text_search_clause_uses_phone_digits():
+    from sqlalchemy.dialects import postgresql
+    from app import crud
+
+    compiled = str(crud._text_search_clause("555-01").compile(dialect=postgresql.dialect()))
+    assert "regexp_replace(employees.phone" in compiled
+
+    compiled = str(crud._text_search_clause("alice").compile(dialect=postgresql.dialect()))
+    assert "phone" not in compiled
+
+def test_unknown_search_mode_is_rejected():
+    import os
+    import subprocess
+    import sys
+    env = {**os.environ, "SEARCH_MODE": "trigrams"}
+    result = subprocess.run([sys.executable, "-c", "import app.crud"], env=env, capture_output=True, text=True)
+    assert result.returncode != 0
+    assert "Unknown SEARCH_MODE: trigrams" in result.stderr
+
+def test_phone_clause_only_for_phone_like_queries():
+    from app.crud import _search_params, phone_query_digits
+    assert phone_query_digits("+1 (555) 0101") == "15550101"
+    assert phone_query_digits("555.01") == "55501"
+    for q in ("Room 4", "alice2", "Building 42B", "4", ""):
+        assert phone_query_digits(q) == ""
+    assert "phone_pattern" not in _search_params("Room 4", None, None, None, None)
+    assert _search_params("555-01", None, None, None, None)["phone_pattern"] == "%55501%"
+
+@patch('app.crud.get_org_columns')
+@patch('app.crud.search_employees')
+def test_search_cursor_pagination(mock_search_employees, mock_get_org_columns):
+    from app.utils import decode_cursor, encode_cursor
+    mock_get_org_columns.return_value = mock_org_columns
+    mock_search_employees.return_value = [Mock(id=7, sort_key="Brown", **mock_employees[1])]
+
+    response = client.get("/employees/search?org_id=1&limit=1&cursor=")
+    assert response.status_code == 200
+    page = response.json()
+    assert page["items"][0]["first_name"] == "Bob"
+    assert decode_cursor(page["next_cursor"]) == ("Brown", 7)
+    assert mock_search_employees.call_args.kwargs["after"] is None
+    assert mock_search_employees.call_args.kwargs["columns"] == mock_org_columns
+
+    response = client.get(f"/employees/search?org_id=1&limit=2&cursor={encode_cursor('Brown', 7)}")
+    assert response.status_code == 200
+    assert response.json()["next_cursor"] is None
+    assert mock_search_employees.call_args.kwargs["after"] == ("Brown", 7)
+
+@patch('app.crud.get_org_columns')
+@patch('app.crud.search_employees')
+def test_search_ndjson_stream(mock_search_employees, mock_get_org_columns):
+    mock_get_org_columns.return_value = ["first_name", "email"]
+    mock_search_employees.return_value = [Mock(**emp) for emp in mock_employees]
+
+    response = client.get("/employees/search?org_id=1&format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {"first_name": "Alice", "email": "alice@example.com"},
+        {"first_name": "Bob", "email": "bob@example.com"},
+    ]
+
+def test_compile_row_serializer():
+    from app.utils import compile_row_serializer
+    row = Mock(first_name="Alice", email="alice@example.com")
+
+    assert compile_row_serializer(("first_name", "email"))(row) == {"first_name": "Alice", "email": "alice@example.com"}
+    assert compile_row_serializer(("email",))(row) == {"email": "alice@example.com"}
+    assert compile_row_serializer(("first_name", "unknown"))(Mock(spec=["first_name"], first_name="Alice")) == {
+        "first_name": "Alice", "unknown": None}
+    assert compile_row_serializer(("first_name", "email")) is compile_row_serializer(("first_name", "email"))
+
+@patch('app.crud.get_org_columns')
+def test_search_invalid_cursor(mock_get_org_columns):
+    mock_get_org_columns.return_value = mock_org_columns
+
+    response = client.get("/employees/search?org_id=1&cursor=not-a-cursor")
+    assert response.status_code == 400
+
+def test_count_from_facets():
+    from app.crud import count_from_facets
+    from app.schemas import EmployeeStatus
+    metadata = {"total": 10, "counts": {"statuses": {"ACTIVE": 6, "TERMINATED": 4}, "locations": {"NY": 3},
+                                        "departments": {}, "positions": {}}}
+    assert count_from_facets(metadata, None, None, None, None, None) == 10
+    assert count_from_facets(metadata, None, [EmployeeStatus.ACTIVE, EmployeeStatus.NOT_STARTED], None, None, None) == 6
+    assert count_from_facets(metadata, None, None, ["NY", "SF"], None, None) == 3
+    assert count_from_facets(metadata, "alice", None, None, None, None) is None
+    assert count_from_facets(metadata, None, [EmployeeStatus.ACTIVE], ["NY"], None, None) is None
+
+@patch('app.crud.count_employees')
+@patch('app.crud.estimate_employees')
+@patch('app.crud.get_filter_metadata')
+@patch('app.crud.cached_filter_metadata')
+@patch('app.crud.get_org_columns')
+@patch('app.crud.search_employees')
+def test_search_include_total_modes(mock_search_employees, mock_get_org_columns, mock_cached_filter_metadata,
+                                    mock_get_filter_metadata, mock_estimate_employees, mock_count_employees,
+                                    org_version):
+    from app.routers import search
+    mock_get_org_columns.return_value = ["first_name"]
+    mock_search_employees.return_value = [Mock(first_name="Alice", total_count=12)]
+    mock_estimate_employees.return_value = 5000
+
+    # Small org with a q search: exact count from the window function.
+    mock_cached_filter_metadata.return_value = {**mock_filter_metadata, "counts": {}, "total": 100}
+    response = client.get("/employees/search?org_id=1&q=al&include_total=true")
+    assert response.json() == {"items": [{"first_name": "Alice"}], "total": 12, "total_exact": True}
+    assert mock_search_employees.call_args.kwargs["with_total"] is True
+
+    # Large org: planner estimate, no window function. The org grew, so its
+    # data version moved on and the cached result no longer applies.
+    org_version.return_value = 2
+    mock_cached_filter_metadata.return_value = {**mock_filter_metadata, "counts": {}, "total": search.EXACT_COUNT_THRESHOLD + 1}
+    response = client.get("/employees/search?org_id=1&q=al&include_total=true")
+    assert response.json()["total"] == 5000
+    assert response.json()["total_exact"] is False
+    assert mock_search_employees.call_args.kwargs["with_total"] is False
+
+    # Unfiltered: the cached facet total is exact regardless of org size.
+    response = client.get("/employees/search?org_id=1&include_total=true")
+    assert response.json()["total"] == search.EXACT_COUNT_THRESHOLD + 1
+    assert response.json()["total_exact"] is True
+    mock_count_employees.assert_not_called()
+
+    # Cold facet cache: the planner's estimate of the org size picks the mode,
+    # and the facet aggregate over the whole org is not run.
+    org_version.return_value = 3
+    mock_cached_filter_metadata.return_value = None
+    response = client.get("/employees/search?org_id=1&q=al&include_total=true")
+    assert response.json()["total"] == 12
+    assert mock_search_employees.call_args.kwargs["with_total"] is True
+    mock_estimate_employees.return_value = search.EXACT_COUNT_THRESHOLD + 5
+    response = client.get("/employees/search?org_id=1&include_total=true")
+    assert response.json()["total"] == search.EXACT_COUNT_THRESHOLD + 5
+    assert response.json()["total_exact"] is False
+    mock_get_filter_metadata.assert_not_called()
+
+@patch('app.crud.get_org_columns_many')
+@patch('app.crud.search_employees_batch')
+def test_search_batch(mock_search_batch, mock_get_org_columns_many):
+    mock_get_org_columns_many.return_value = {1: ["first_name"], 2: ["email"]}
+    mock_search_batch.return_value = [[Mock(**mock_employees[0])], [Mock(**mock_employees[1])]]
+
+    response = client.post("/employees/search/batch", json=[{"org_id": 1, "departments": ["HR"]}, {"org_id": 2}])
+    assert response.status_code == 200
+    assert response.json() == [[{"first_name": "Alice"}], [{"email": "bob@example.com"}]]
+    searches, columns = mock_search_batch.call_args.args[1:]
+    assert [s.org_id for s in searches] == [1, 2]
+    assert columns == ["first_name", "email"]
+
+    mock_get_org_columns_many.return_value = {1: ["first_name"], 999: []}
+    response = client.post("/employees/search/batch", json=[{"org_id": 1}, {"org_id": 999}])
+    assert response.status_code == 404
+
+    from app.routers.search import BATCH_MAX_SEARCHES
+    response = client.post("/employees/search/batch", json=[{"org_id": 1}] * (BATCH_MAX_SEARCHES + 1))
+    assert response.status_code == 422
+
+def test_search_employees_batch_single_union_query():
+    import asyncio
+    from unittest.mock import AsyncMock
+    from sqlalchemy.dialects import postgresql
+    from app import crud
+    from app.schemas import EmployeeSearchRequest
+
+    db = Mock()
+    db.execute = AsyncMock(return_value=Mock(all=lambda: [Mock(batch_index=1, id=7), Mock(batch_index=1, id=9)]))
+    searches = [EmployeeSearchRequest(org_id=1), EmployeeSearchRequest(org_id=2, search_query="ann", limit=10)]
+
+    pages = asyncio.run(crud.search_employees_batch(db, searches, ["first_name"]))
+    assert pages[0] == [] and [row.id for row in pages[1]] == [7, 9]
+    db.execute.assert_awaited_once()
+    sql = str(db.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+    assert sql.count("UNION ALL") == 1
+    assert sql.rstrip().endswith("ORDER BY batch_index, sort_key, id")
+
+@patch('app.crud.get_org_columns')
+@patch('app.crud.suggest_employees')
+def test_suggest(mock_suggest_employees, mock_get_org_columns):
+    from unittest.mock import AsyncMock
+    from app.suggest import suggest_index
+
+    mock_get_org_columns.return_value = ["first_name", "department", "last_name"]
+    with patch.object(suggest_index, "suggest", AsyncMock(return_value=[{"first_name": "Alice", "last_name": "Smith"}])) as suggest:
+        response = client.get("/employees/suggest?org_id=1&q=al&limit=5")
+        assert response.status_code == 200
+        assert response.json() == [{"first_name": "Alice", "last_name": "Smith"}]
+        assert suggest.await_args.args[1:] == (1, ["first_name", "last_name"], "al", 5)
+        mock_suggest_employees.assert_not_called()
+
+    # Orgs too large for the in-memory index fall back to a prefix query.
+    mock_suggest_employees.return_value = [Mock(first_name="Alice", last_name="Smith")]
+    with patch.object(suggest_index, "suggest", AsyncMock(return_value=None)):
+        response = client.get("/employees/suggest?org_id=1&q=al")
+        assert response.json() == [{"first_name": "Alice", "last_name": "Smith"}]
+
+    mock_get_org_columns.return_value = ["department"]
+    assert client.get("/employees/suggest?org_id=1&q=al").json() == []
+    assert client.get("/employees/suggest?org_id=1&q=").status_code == 422
+
+@patch('app.crud.get_org_columns')
+@patch('app.crud.search_employees')
+def test_search_conditional_get(mock_search_employees, mock_get_org_columns, org_version):
+    mock_get_org_columns.return_value = mock_org_columns
+    mock_search_employees.return_value = [Mock(**emp) for emp in mock_employees]
+
+    response = client.get("/employees/search?org_id=1&departments=HR")
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    response = client.get("/employees/search?org_id=1&departments=HR", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert mock_search_employees.call_count == 1
+
+    # Different parameters or a new org version change the validator.
+    assert client.get("/employees/search?org_id=1&departments=IT", headers={"If-None-Match": etag}).status_code == 200
+    org_version.return_value = 2
+    assert client.get("/employees/search?org_id=1&departments=HR", headers={"If-None-Match": etag}).status_code == 200
+
+@patch('app.crud.get_filter_metadata')
+def test_filter_metadata_conditional_get(mock_get_filter_metadata):
+    mock_get_filter_metadata.return_value = mock_filter_metadata
+    response = client.get("/employees/filters/metadata?org_id=1")
+    etag = response.headers["etag"]
+    response = client.get("/employees/filters/metadata?org_id=1", headers={"If-None-Match": f'"other", {etag}'})
+    assert response.status_code == 304
+    mock_get_filter_metadata.assert_called_once()
+
+def test_etag_matches():
+    from app import utils
+    etag = utils.make_etag(1, ["first_name"])
+    assert etag == utils.make_etag(1, ["first_name"])
+    assert etag != utils.make_etag(2, ["first_name"])
+    assert utils.etag_matches(etag, etag)
+    assert utils.etag_matches(etag.removeprefix("W/"), etag)
+    assert utils.etag_matches("*", etag)
+    assert not utils.etag_matches(None, etag)
+    assert not utils.etag_matches('W/"nope"', etag)
+
+@patch('app.crud.get_org_columns')
+@patch('app.crud.search_employees')
+def test_search_result_cache(mock_search_employees, mock_get_org_columns, org_version):
+    mock_get_org_columns.return_value = mock_org_columns
+    mock_search_employees.return_value = [Mock(**emp) for emp in mock_employees]
+
+    first = client.get("/employees/search?org_id=1&departments=HR&departments=IT")
+    # Same search with the filter list reordered and a duplicate is a cache hit.
+    second = client.get("/employees/search?org_id=1&departments=IT&departments=HR&departments=IT")
+    assert first.json() == second.json()
+    assert mock_search_employees.call_count == 1
+
+    # A write bumps the org version, which is part of the cache key.
+    org_version.return_value = 2
+    client.get("/employees/search?org_id=1&departments=HR&departments=IT")
+    assert mock_search_employees.call_count == 2
+
+@patch('app.crud.get_org_columns')
+def test_export_streams_csv_and_ndjson(mock_get_org_columns):
+    from contextlib import asynccontextmanager
+    from app.routers.search import get_db_sessions
+    from app.schemas import EmployeeStatus
+    mock_get_org_columns.return_value = ["first_name", "email", "status"]
+    calls = []
+
+    async def stream_employees(db, org_id, columns, chunk_rows, *filters):
+        calls.append((db, org_id, columns, filters))
+        yield [Mock(first_name="Alice", email="alice@example.com", status=EmployeeStatus.ACTIVE)]
+        yield [Mock(first_name="Bob, Jr.", email=None, status=EmployeeStatus.TERMINATED)]
+
+    @asynccontextmanager
+    async def sessions():
+        yield "export-session"
+
+    app.dependency_overrides[get_db_sessions] = lambda: sessions
+    try:
+        with patch('app.crud.stream_employees', stream_employees):
+            response = client.get("/employees/export?org_id=1&departments=HR")
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/csv")
+            assert response.headers["content-disposition"] == 'attachment; filename="employees-1.csv"'
+            assert response.text.splitlines() == [
+                "first_name,email,status", "Alice,alice@example.com,ACTIVE", '"Bob, Jr.",,TERMINATED']
+            assert calls[0] == ("export-session", 1, ["first_name", "email", "status"], (None, None, None, ["HR"], None))
+
+            response = client.get("/employees/export?org_id=1&format=ndjson")
+            assert response.headers["content-type"] == "application/x-ndjson"
+            assert [json.loads(line) for line in response.text.splitlines()] == [
+                {"first_name": "Alice", "email": "alice@example.com", "status": "ACTIVE"},
+                {"first_name": "Bob, Jr.", "email": None, "status": "TERMINATED"},
+            ]
+
+        mock_get_org_columns.return_value = []
+        assert client.get("/employees/export?org_id=1").status_code == 404
+    finally:
+        del app.dependency_overrides[get_db_sessions]
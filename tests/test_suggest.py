@@ -0,0 +1,100 @@
+"""
+Unit tests for the in-memory prefix suggest index.
+Run with: pytest tests/test_suggest.py -v
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, Mock, patch
+import pytest
+from app.suggest import OrgNameIndex, SuggestIndex, normalize
+
+pytestmark = pytest.mark.unit
+
+FIELDS = ("first_name", "last_name", "email")
+NOW = datetime(2026, 10, 16, 12, 0)
+
+def row(employee_id, first_name, last_name, email, updated_at=NOW, fields=FIELDS):
+    names = {"first_name": first_name, "last_name": last_name, "email": email}
+    values = (employee_id, updated_at, *(names[f] for f in fields))
+    return Mock(id=employee_id, updated_at=updated_at, __getitem__=lambda self, i: values[i])
+
+ROWS = [
+    row(1, "Ann", "Smith", "ann@example.com"),
+    row(2, "Andrew", "Annan", "andrew@example.com"),
+    row(3, "Bob", "Brown", "bob@example.com"),
+]
+
+def test_normalize():
+    assert normalize("  Ann   SMITH ") == "ann smith"
+    assert normalize(None) == ""
+
+def test_prefix_search_returns_each_employee_once():
+    index = OrgNameIndex(FIELDS)
+    index.load(ROWS)
+    assert [m["first_name"] for m in index.search("an", 10)] == ["Andrew", "Ann"]
+    assert index.search("ANN S", 10) == [{"first_name": "Ann", "last_name": "Smith", "email": "ann@example.com"}]
+    assert [m["first_name"] for m in index.search("b", 10)] == ["Bob"]
+    assert index.search("an", 1) == [{"first_name": "Andrew", "last_name": "Annan", "email": "andrew@example.com"}]
+    assert index.search("zz", 10) == []
+
+def test_only_indexed_fields_are_matched():
+    index = OrgNameIndex(("first_name",))
+    index.load([row(3, "Bob", "Brown", "bob@example.com", fields=("first_name",))])
+    # "bob@example.com" is not visible to this org, so it must not match.
+    assert index.search("bob@", 10) == []
+    assert index.search("bo", 10) == [{"first_name": "Bob"}]
+
+def test_apply_replaces_changed_terms():
+    index = OrgNameIndex(FIELDS)
+    index.load(ROWS)
+    later = NOW + timedelta(minutes=1)
+    index.apply([row(3, "Robert", "Brown", "bob@example.com", later), row(4, "Bea", "Bell", "bea@example.com", later)])
+    assert index.search("bob b", 10) == []
+    assert [m["first_name"] for m in index.search("bob", 10)] == ["Robert"]
+    assert [m["first_name"] for m in index.search("b", 10)] == ["Bea", "Robert"]
+    assert index.watermark == later
+    assert index.entries == sorted(index.entries)
+
+def test_suggest_builds_once_then_serves_from_memory():
+    suggest = SuggestIndex(max_entries=100, refresh_seconds=60)
+    with patch("app.crud.count_employees", AsyncMock(return_value=3)) as count, \
+         patch("app.crud.load_suggest_rows", AsyncMock(return_value=ROWS)) as load:
+        assert [m["first_name"] for m in asyncio.run(suggest.suggest(Mock(), 1, list(FIELDS), "a", 5))] == ["Andrew", "Ann"]
+        asyncio.run(suggest.suggest(Mock(), 1, list(FIELDS), "an", 5))
+        assert count.await_count == 1
+        assert load.await_count == 1
+
+        # A NOTIFY on org_data_changed triggers an incremental refresh.
+        suggest.mark_stale("1")
+        asyncio.run(suggest.suggest(Mock(), 1, list(FIELDS), "an", 5))
+        assert count.await_count == 2
+        assert load.await_args.kwargs["since"] == NOW - timedelta(seconds=60)
+
+def test_suggest_rebuilds_after_deletes():
+    suggest = SuggestIndex(max_entries=100, refresh_seconds=60)
+    with patch("app.crud.count_employees", AsyncMock(return_value=3)), \
+         patch("app.crud.load_suggest_rows", AsyncMock(return_value=ROWS)):
+        asyncio.run(suggest.suggest(Mock(), 1, list(FIELDS), "a", 5))
+    suggest.mark_stale("1")
+    with patch("app.crud.count_employees", AsyncMock(return_value=2)), \
+         patch("app.crud.load_suggest_rows", AsyncMock(side_effect=[[], ROWS[1:]])):
+        assert [m["first_name"] for m in asyncio.run(suggest.suggest(Mock(), 1, list(FIELDS), "a", 5))] == ["Andrew"]
+
+def test_suggest_skips_orgs_over_budget_and_evicts_lru():
+    suggest = SuggestIndex(max_entries=15, refresh_seconds=60)
+    with patch("app.crud.count_employees", AsyncMock(return_value=100)), \
+         patch("app.crud.load_suggest_rows", AsyncMock()) as load:
+        assert asyncio.run(suggest.suggest(Mock(), 1, list(FIELDS), "a", 5)) is None
+        assert asyncio.run(suggest.suggest(Mock(), 1, list(FIELDS), "a", 5)) is None
+        load.assert_not_awaited()
+
+    with patch("app.crud.count_employees", AsyncMock(return_value=3)), \
+         patch("app.crud.load_suggest_rows", AsyncMock(return_value=ROWS)):
+        asyncio.run(suggest.suggest(Mock(), 2, list(FIELDS), "a", 5))
+        asyncio.run(suggest.suggest(Mock(), 3, list(FIELDS), "a", 5))
+    assert list(suggest._orgs) == [3]
+    assert suggest.entries() <= 15
+
+    suggest.drop("*")
+    assert suggest.entries() == 0